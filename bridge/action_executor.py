@@ -13,9 +13,17 @@
 #   sudo containerlab destroy -t cage4-topology.yaml
 
 import docker
+import glob
 import subprocess
+import threading
 import yaml
 import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from container_inventory import get_inventory
+from bulk_ops import run_bulk
+from intrusion_detector import CLEANUP_CMD
 
 CLAB_PREFIX = "clab-cage4-defense-network-"
 
@@ -64,14 +72,32 @@ SUBNET_RESTORE_VIA = {
     "restricted-zone-b-router": "10.0.0.6",
 }
 
+# Actions that block on container restarts / clab deployments. In async mode they
+# run on a worker pool and the host is reported "in progress" until they finish
+# AND their tick count (CybORG's action duration, remaining_ticks) has run out, so
+# the agent sees the same busy window it trained with even when Docker is quick.
+ACTION_TICKS = {
+    "Restore": 5,
+    "DeployDecoy": 2,
+}
+
+ASYNC_WORKERS = 4
+
 
 class ActionExecutor:
-    def __init__(self):
+    def __init__(self, inventory=None, async_mode=False, max_workers=ASYNC_WORKERS, decoy_pool=None):
         self.client = docker.from_env()
-        self._decoys = {}
+        self.inventory = inventory or get_inventory()
+        self.decoy_pool = decoy_pool
+        self._decoys = {}        # clean name -> clab yaml path, or pooled decoy container name
         self._blocks = {}
         self._blocked_hosts = set()
 
+        self.async_mode = async_mode
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="action") if async_mode else None
+        self._pending = {}   # clean name -> {"action_type", "future", "remaining_ticks"}
+        self._pending_lock = threading.Lock()
+
     def execute(self, action, servers, users):
         print(f"Executing action: {action}")
 
@@ -108,34 +134,126 @@ class ActionExecutor:
         full_name = CLAB_PREFIX + container_name
         print(f"Action: {action_name} on {container_name} (action={action}, host_idx={host_idx})")
 
+        busy = self._busy(container_name)
+        if busy:
+            # host is still mid-operation — like CybORG, it can't take a new action yet
+            return {"action_type": action_name, "target": container_name, "result": f"busy: {busy} in progress"}
+
         if action_name == "Analyse":
             return self._analyse(full_name, container_name)
         elif action_name == "Remove":
             return self._block(full_name, container_name)
         elif action_name == "Restore":
-            return self._restore(full_name, container_name)
+            return self._run(action_name, self._restore, full_name, container_name)
         elif action_name == "DeployDecoy":
-            return self._deploy_decoy(full_name, container_name)
+            return self._run(action_name, self._deploy_decoy, full_name, container_name)
         else:
             raise ValueError(f"Unknown action: {action}")
-        
 
-    def _get_mgmt_network(self, container):
-        all_containers = self.client.containers.list()
-        cage4 = [c for c in all_containers
-                 if c.name.startswith(CLAB_PREFIX) and "router" not in c.name
-                 and c.name != container.name]
+    def _run(self, action_name, fn, full_name, clean_name):
+        if not self.async_mode:
+            return fn(full_name, clean_name)
+        with self._pending_lock:
+            self._pending[clean_name] = {
+                "action_type": action_name,
+                "future": self._pool.submit(fn, full_name, clean_name),
+                "remaining_ticks": ACTION_TICKS[action_name],
+            }
+        print(f"[Executor] {action_name} on {clean_name} submitted")
+        return {"action_type": action_name, "target": clean_name, "result": "in progress"}
+
+    def _busy(self, clean_name):
+        with self._pending_lock:
+            op = self._pending.get(clean_name)
+            if op is None or self._finished(op):
+                return None
+            return op["action_type"]
+
+    @staticmethod
+    def _finished(op):
+        return op["future"].done() and op["remaining_ticks"] == 0
+
+    def poll(self):
+        """Advance pending operations by one tick. Returns results of those that finished.
+
+        An operation finishes once its future is done and its ticks have run out.
+        """
+        finished = []
+        with self._pending_lock:
+            for clean_name, op in list(self._pending.items()):
+                op["remaining_ticks"] = max(op["remaining_ticks"] - 1, 0)
+                if self._finished(op):
+                    del self._pending[clean_name]
+                    finished.append(self._result_of(op))
+        return finished
+
+    def in_progress(self):
+        """{clean_name: {"action_type", "remaining_ticks"}} for operations still running."""
+        with self._pending_lock:
+            return {
+                clean_name: {"action_type": op["action_type"], "remaining_ticks": op["remaining_ticks"]}
+                for clean_name, op in self._pending.items()
+                if not self._finished(op)
+            }
+
+    def drain(self):
+        """Block until every pending operation finishes. Returns their results."""
+        with self._pending_lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+        return [self._result_of(op) for op in pending]
+
+    def _result_of(self, op):
+        try:
+            return op["future"].result()
+        except Exception as e:
+            return {"action_type": op["action_type"], "target": None, "result": f"error: {e}"}
         
-        if not cage4:
+
+    def resolve_target(self, action, servers, users):
+        """Clean name of the container an action will touch, without executing it.
+
+        Subnet firewall actions touch the gateway router; Monitor and invalid
+        host indices touch nothing (None).
+        """
+        if 64 <= action <= 79:
+            return SUBNET_GATEWAY[SUBNET_ROUTERS_SORTED[(action - 64) % len(SUBNET_ROUTERS_SORTED)]]
+        if action >= 80:
             return None
-        ref = cage4[0]
-        ref.reload()
-        ref_nets = list(ref.attrs["NetworkSettings"]["Networks"].keys())
-        return next((n for n in ref_nets if n.startswith("clab")), None)
+        host_idx = action % MAX_HOSTS
+        if host_idx < MAX_SERVERS:
+            return servers[host_idx]["clean_name"] if host_idx < len(servers) else None
+        user_idx = host_idx - MAX_SERVERS
+        return users[user_idx]["clean_name"] if user_idx < len(users) else None
+
+    def unavailable_actions(self, servers, users):
+        """Action ids execute() would reject right now without touching the lab.
+
+        Host slots with no container ("invalid"), any node action on a host with an
+        operation still running ("busy"), Remove on a blocked host and DeployDecoy on
+        a host that already has a decoy. Pass as AgentAdapter.decide(exclude=...).
+        """
+        busy = self.in_progress()
+        names = [s["clean_name"] for s in servers[:MAX_SERVERS]] + [None] * (MAX_SERVERS - min(len(servers), MAX_SERVERS))
+        names += [u["clean_name"] for u in users[:MAX_HOSTS - MAX_SERVERS]]
+        names += [None] * (MAX_HOSTS - len(names))
+
+        unavailable = set()
+        for host_idx, name in enumerate(names):
+            for action_type_idx, action_name in ACTION_TYPES.items():
+                action = action_type_idx * MAX_HOSTS + host_idx
+                if (name is None or name in busy
+                        or (action_name == "Remove" and name in self._blocked_hosts)
+                        or (action_name == "DeployDecoy" and name in self._decoys)):
+                    unavailable.add(action)
+        return unavailable
+
+    def _get_mgmt_network(self, container):
+        return self.inventory.mgmt_network(exclude=container.name)
 
     def _analyse(self, full_name, clean_name):
         try:
-            container = self.client.containers.get(full_name)
+            container = self.inventory.get(full_name)
             processes = container.exec_run("ps aux").output.decode(errors="replace")
             user_compromised = container.exec_run("ls /tmp/.compromised").exit_code == 0
             root_compromised = container.exec_run("ls /root/.compromised").exit_code == 0
@@ -155,14 +273,16 @@ class ActionExecutor:
         
     def _block(self, full_name, clean_name):
         try:
-            container = self.client.containers.get(full_name)
-            container.reload()
+            # cached attrs are kept current by the inventory's events stream
+            container = self.inventory.get(full_name)
             net_names = list(container.attrs["NetworkSettings"]["Networks"].keys())
             if not net_names:
                 return {"action_type": "Remove", "target": clean_name, "result": "already blocked"}
             mgmt_network = next((n for n in net_names if n.startswith("clab")), net_names[0])
             self.client.networks.get(mgmt_network).disconnect(container)
             self._blocked_hosts.add(clean_name)
+            # don't wait for the disconnect event — the next observation must see it
+            self.inventory.refresh(full_name)
             print(f"[Executor] Blocked {clean_name} — disconnected from {mgmt_network}")
             return {"action_type": "Remove", "target": clean_name, "result": "blocked"}
         except Exception as e:
@@ -172,8 +292,7 @@ class ActionExecutor:
     def _restore(self, full_name, clean_name):
         self._blocked_hosts.discard(clean_name)
         try:
-            container = self.client.containers.get(full_name)
-            container.reload()
+            container = self.inventory.get(full_name)
             connected = list(container.attrs["NetworkSettings"]["Networks"].keys())
             mgmt_network = self._get_mgmt_network(container)
             was_blocked  = mgmt_network and mgmt_network not in connected
@@ -182,6 +301,7 @@ class ActionExecutor:
             if was_blocked and mgmt_network:
                 self.client.networks.get(mgmt_network).connect(container)
                 print(f"[Executor] Reconnected {clean_name} to {mgmt_network}")
+            self.inventory.refresh(full_name)
             print(f"[Executor] Restored {clean_name}")
             return {"action_type": "Restore", "target": clean_name, "result": "restarted"}
         except Exception as e:
@@ -193,9 +313,17 @@ class ActionExecutor:
             print(f"Decoy already deployed for {clean_name}")
             return {"action_type": "DeployDecoy", "target": clean_name, "result": "decoy already deployed"}
         try:
-            container = self.client.containers.get(full_name)
+            container = self.inventory.get(full_name)
             mgmt_network = self._get_mgmt_network(container)
 
+            if self.decoy_pool is not None:
+                decoy = self.decoy_pool.acquire(mgmt_network)
+                if decoy is not None:
+                    self._decoys[clean_name] = decoy.name
+                    print(f"Decoy {decoy.name} attached for {clean_name}")
+                    return {"action_type": "DeployDecoy", "target": clean_name, "result": "decoy deployed"}
+                print(f"Decoy pool empty — deploying topology for {clean_name}")
+
             topology_name = f"decoy_{clean_name}"
             topology = {
                 "name": topology_name,
@@ -230,31 +358,69 @@ class ActionExecutor:
             return {"action_type": "DeployDecoy", "target": clean_name, "result": f"error: {e}"}
         
     def cleanup_decoys(self):
-        for clean_name, yaml_path in list(self._decoys.items()):
-            topology_name = os.path.splitext(os.path.basename(yaml_path))[0]
-            result = subprocess.run(
-                ["clab", "destroy", "-t", yaml_path],
-                capture_output=True, text=True
-            )
-            if result.returncode == 0:
-                print(f"Decoy {clean_name} cleaned up")
-                del self._decoys[clean_name]
-                try:
-                    os.remove(yaml_path)
-                except Exception as e:
-                    pass  # Ignore errors in cleanup
-            else:
-                print(f"Error cleaning up decoy {clean_name}: {result.stderr}")
+        """Destroy deployed decoys. In async mode returns a Future instead of blocking."""
+        if self.async_mode:
+            return self._pool.submit(self._cleanup_decoys)
+        return self._cleanup_decoys()
+
+    def _cleanup_decoys(self):
+        return run_bulk(self._remove_decoy, list(self._decoys), "cleanup decoys")
+
+    def _remove_decoy(self, clean_name):
+        target = self._decoys[clean_name]
+        if not target.endswith(".yaml"):
+            # pooled decoy — detach and hand it back for reuse
+            self.decoy_pool.release(target)
+        else:
+            self._destroy_topology(target)
+        del self._decoys[clean_name]
+        print(f"Decoy {clean_name} cleaned up")
+
+    def _destroy_topology(self, yaml_path):
+        result = subprocess.run(
+            ["clab", "destroy", "-t", yaml_path],
+            capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip())
+        try:
+            os.remove(yaml_path)
+        except OSError:
+            pass  # Ignore errors in cleanup
 
     def cleanup_stale_decoys(self):
-        import glob
-        for yaml_path in glob.glob("/tmp/decoy_*.yaml"):
-            subprocess.run(["clab", "destroy", "-t", yaml_path],
-                        capture_output=True, text=True)
-            try:
-                os.remove(yaml_path)
-            except Exception:
-                pass
+        if self.decoy_pool is not None:
+            self.decoy_pool.release_all()
+        self._decoys.clear()
+        return run_bulk(self._destroy_topology, glob.glob("/tmp/decoy_*.yaml"), "cleanup stale decoys")
+
+    def reset(self, containers):
+        """Undo every change made during an episode without redeploying the lab.
+
+        Clears red's flags and reconnects blocked hosts, restores blackholed routes
+        and removes decoys — all in one parallel sweep. Returns the bulk summary.
+        """
+        self.drain()
+        tasks = [(c["clean_name"], partial(self._reset_host, c["clean_name"])) for c in containers]
+        tasks += [(subnet, partial(self._reset_route, subnet)) for subnet in list(self._blocks)]
+        tasks += [(f"decoy {name}", partial(self._remove_decoy, name)) for name in list(self._decoys)]
+        return run_bulk(lambda task: task[1](), tasks, "episode reset", key=lambda task: task[0])
+
+    def _reset_host(self, clean_name):
+        full_name = CLAB_PREFIX + clean_name
+        container = self.inventory.get(full_name)
+        container.exec_run(CLEANUP_CMD)
+        if clean_name in self._blocked_hosts:
+            mgmt_network = self._get_mgmt_network(container)
+            if mgmt_network not in container.attrs["NetworkSettings"]["Networks"]:
+                self.client.networks.get(mgmt_network).connect(container)
+                self.inventory.refresh(full_name)
+            self._blocked_hosts.discard(clean_name)
+
+    def _reset_route(self, subnet_router_name):
+        result = self._allow_traffic(subnet_router_name)
+        if str(result["result"]).startswith("error"):
+            raise RuntimeError(result["result"])
 
     def _allow_traffic(self, subnet_router_name):
         if subnet_router_name not in self._blocks:
@@ -263,7 +429,7 @@ class ActionExecutor:
         full_gateway, cidr = self._blocks[subnet_router_name]
         via = SUBNET_RESTORE_VIA[subnet_router_name]
         try:
-            container = self.client.containers.get(full_gateway)
+            container = self.inventory.get(full_gateway)
             container.exec_run(f"ip route replace {cidr} via {via}")
             del self._blocks[subnet_router_name]
             print(f"Traffic to {subnet_router_name} allowed via {via}")
@@ -277,7 +443,7 @@ class ActionExecutor:
         cidr = SUBNET_CIDR[subnet_router_name]
         full_gateway = CLAB_PREFIX + gateway
         try:
-            container = self.client.containers.get(full_gateway)
+            container = self.inventory.get(full_gateway)
             result = container.exec_run(f"ip route replace blackhole {cidr}")
             if result.exit_code == 0:
                 self._blocks[subnet_router_name] = (full_gateway, cidr)
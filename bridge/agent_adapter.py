@@ -16,10 +16,42 @@
 #   before sampling so the agent never picks firewall no-ops unsupported by containerlab.
 #   Masking is applied at inference time — trained weights are unchanged.
 #   Enabled via --mask flag in evaluation.py. Not used in main.py by default.
+#
+# Compiled inference:
+#   By default the actor runs from a TorchScript artifact next to the weights
+#   (gnn_ppo-0.pt -> gnn_ppo-0.ts, see trained-agent/export_inference.py). It is
+#   exported automatically on first use. AgentAdapter(compiled=False) runs the
+#   eager training class instead — both give identical action distributions.
+#
+# Quantized inference:
+#   AgentAdapter(quantized=True) runs an int8 dynamically quantized actor instead
+#   (gnn_ppo-0.pt -> gnn_ppo-0.q8.ts, exported on first use) — smaller and faster on
+#   CPU, with a small drift from fp32 (see trained-agent/quantize_actor.py).
+#   Enabled via --quantized in main.py / evaluation.py.
+#
+# Decisions:
+#   adapter.decide(...) runs one forward pass and returns the masked distribution, top-k
+#   actions and (with AgentAdapter(value=True)) the critic's value estimate. mode picks
+#   the action: "sample" (default, as trained), "greedy" (argmax) or "temperature"
+#   (sample from p^(1/T)). exclude=[action ids] masks any actions, e.g. the ones
+#   ActionExecutor.unavailable_actions() knows would be rejected; adapter.select(decision,
+#   exclude) falls back to the next pick from the same distribution without re-running
+#   the model. get_action(...) is decide(...)["action"].
+#
+# Recording observations:
+#   adapter.recorded = [] makes every get_action append its state tuple;
+#   adapter.save_recorded(path) writes them for trained-agent/quantize_actor.py --obs.
+#
+# Policy server:
+#   If policy_server.py is running, AgentAdapter sends each graph to it instead of
+#   loading the weights (no torch_geometric import, no torch.load). server=None
+#   always loads locally; the quantized actor always runs locally.
 
 import os
 import sys
+import warnings
 import torch
+from torch.distributions.categorical import Categorical
 
 WEIGHTS_PATH = os.path.join(
     os.path.dirname(__file__), "..", "trained-agent", "weights", "gnn_ppo-0.pt"
@@ -29,17 +61,73 @@ AGENT_DIR = os.path.abspath(
 )
 
 from graph_builder import ObservationGraphBuilder, CONTAINER_ROLES
+from policy_server import PolicyClient, SOCKET_PATH
+
+MODES = ["sample", "greedy", "temperature"]
+TOP_K = 5
 
 
 class AgentAdapter:
-    def __init__(self, weights_path=WEIGHTS_PATH, mask_edge_actions=False):
+    def __init__(self, weights_path=WEIGHTS_PATH, mask_edge_actions=False, compiled=True, quantized=False,
+                 server=SOCKET_PATH, mode="sample", temperature=1.0, value=False):
         sys.path.insert(0, AGENT_DIR)
-        from models.cage4 import load
-        self.agent = load(weights_path)
+        self.agent_name = os.path.splitext(os.path.basename(weights_path))[0]
+        self.client = self._connect(server, weights_path) if server and not quantized else None
+        self.actor = None
+        if self.client is None and compiled:
+            self.actor = self._load_compiled(weights_path, quantized)
+        if self.client is None and self.actor is None:
+            from models.cage4 import load
+            from models.inference import quantize_actor
+            actor = load(weights_path).actor
+            self.actor = (quantize_actor(actor) if quantized else actor).probs
+        self.critic = self._load_critic(weights_path) if value else None
         self.builder = ObservationGraphBuilder()
         self.mask_edge_actions = mask_edge_actions
+        self.mode = mode
+        self.temperature = temperature
+        self.recorded = None  # list to record state tuples into
+        self.last_decision = None
 
-    def get_action(self, network_state, phase = 0, host_states = None, compromise_map = None, decoys=None, processes=None):
+    def _connect(self, socket_path, weights_path):
+        client = PolicyClient(socket_path)
+        if not client.available():
+            return None
+        info = client.info()
+        if self.agent_name not in info["agents"] or not os.path.samefile(
+                info["weights_dir"], os.path.dirname(os.path.abspath(weights_path))):
+            client.close()
+            return None
+        # like _load_compiled's mtime check: a retrained checkpoint means the server is stale
+        if info["mtimes"][self.agent_name] != os.path.getmtime(weights_path):
+            print(f"[AgentAdapter] policy server has an older {os.path.basename(weights_path)}, loading locally")
+            client.close()
+            return None
+        print(f"[AgentAdapter] using policy server at {socket_path}")
+        return client
+
+    def _load_critic(self, weights_path):
+        # eager only: the critic is never exported or served
+        from models.cage4 import load
+        agent = load(weights_path)
+        agent.eval()
+        return agent.critic
+
+    def _load_compiled(self, weights_path, quantized=False):
+        from models.inference import artifact_path, export_actor, load_actor
+        path = artifact_path(weights_path, quantized)
+        if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(weights_path):
+            try:
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore", torch.jit.TracerWarning)
+                    export_actor(weights_path, path, quantized=quantized)
+                print(f"[AgentAdapter] exported compiled actor to {path}")
+            except Exception as e:
+                print(f"[AgentAdapter] could not export compiled actor ({e}), using eager model")
+                return None
+        return load_actor(path)
+
+    def build_state(self, network_state, phase=0, host_states=None, compromise_map=None, decoys=None, processes=None):
         # build_graph stores _last_* attributes so ordering is guaranteed consistent
         graph = self.builder.build_graph(
             network_state, 
@@ -76,17 +164,94 @@ class AgentAdapter:
         global_vec = torch.zeros(1, 3)
         global_vec[0, phase] = 1.0
 
-        state = (x, ei, global_vec, server, node_server, user, node_user, action_edges, False)
+        state = (x, ei, global_vec, server, node_server, user, node_user, action_edges)
+        if self.recorded is not None:
+            # x is reused by the builder across steps — keep a copy
+            self.recorded.append((x.clone(),) + state[1:] + (False,))
+        return state
 
+    def get_action(self, network_state, phase = 0, host_states = None, compromise_map = None, decoys=None, processes=None):
+        return self.decide(network_state, phase, host_states, compromise_map, decoys, processes)["action"]
+
+    def decide(self, network_state, phase=0, host_states=None, compromise_map=None, decoys=None, processes=None,
+               mode=None, temperature=None, exclude=(), k=TOP_K):
+        """One forward pass -> {"action", "probs", "raw_probs", "value", "top_k", "mode", "temperature"}.
+
+        probs is the distribution actually sampled from: raw_probs with the edge mask
+        and `exclude` (any action ids, e.g. ActionExecutor.unavailable_actions) zeroed
+        and renormalised. top_k lists the k likeliest remaining (action, prob) pairs.
+        value is the critic's estimate (AgentAdapter(value=True) only, else None).
+        The decision is kept as last_decision; select() re-picks from it.
+        """
+        state = self.build_state(network_state, phase, host_states, compromise_map, decoys, processes)
+        with torch.no_grad():
+            raw = self.probs(state)
+            value = self.critic(*state, False).item() if self.critic is not None else None
+        self.last_probs = raw  # unmasked distribution of the last decision
+
+        decision = {
+            "raw_probs": raw,
+            "value": value,
+            "mode": mode or self.mode,
+            "temperature": self.temperature if temperature is None else temperature,
+            "k": k,
+            "excluded": set(),
+        }
+        self.select(decision, exclude)
+        self.last_decision = decision
+        return decision
+
+    def select(self, decision, exclude=()):
+        """(Re-)pick the action of a decision with `exclude` masked out as well.
+
+        No forward pass — e.g. fall back to the next-best action after the executor
+        rejects one. Returns the new action; None if every action is masked.
+        """
+        decision["excluded"] |= set(exclude)
+        probs = decision["raw_probs"].clone()
         if self.mask_edge_actions:
             # Zero edge action probs (64-79)
-            with torch.no_grad():
-                distro = self.agent.actor(*state)
-                probs = distro.probs.clone()
-                probs[..., 64:80] = 0.0
-                probs = probs / probs.sum(-1, keepdim=True)
-                action = torch.distributions.Categorical(probs=probs).sample().item()
+            probs[..., 64:80] = 0.0
+        if decision["excluded"]:
+            probs[..., sorted(decision["excluded"])] = 0.0
+
+        total = probs.sum(-1, keepdim=True)
+        if not total.item() > 0:
+            decision.update(action=None, probs=probs, top_k=[])
+            return None
+        probs = probs / total
+
+        mode = decision["mode"]
+        if mode == "greedy":
+            action = probs.argmax(-1).item()
+        elif mode == "sample":
+            action = Categorical(probs=probs).sample().item()
+        elif mode == "temperature":
+            if not decision["temperature"] > 0:
+                raise ValueError(f"temperature must be > 0, got {decision['temperature']}")
+            # softmax(log p / T) == p^(1/T) renormalised, without underflow at small T;
+            # masked actions stay at -inf
+            action = Categorical(logits=probs.log() / decision["temperature"]).sample().item()
         else:
-            action = self.agent.get_action((state, False))
+            raise ValueError(f"Unknown mode: {mode}")
 
+        top = probs[0].topk(min(decision["k"], int((probs[0] > 0).sum())))
+        decision.update(
+            action=action,
+            probs=probs,
+            top_k=list(zip(top.indices.tolist(), top.values.tolist())),
+        )
         return action
+
+    def save_recorded(self, path):
+        from models.inference import save_observations
+        save_observations(self.recorded or [], path, source="bridge")
+        print(f"[AgentAdapter] saved {len(self.recorded or [])} observations to {path}")
+
+    def probs(self, state):
+        # server: PolicyClient; compiled: TorchScript module; eager: InductiveActorNetwork.probs (needs multi_subnet)
+        if self.client is not None:
+            return self.client.probs(self.agent_name, state)
+        if isinstance(self.actor, torch.jit.ScriptModule):
+            return self.actor(*state)
+        return self.actor(*state, False)
@@ -0,0 +1,32 @@
+# Fans a per-host operation out over a bounded thread pool and collects the failures.
+# Used for startup/shutdown cleanup and episode reset, which otherwise walk every host serially.
+#
+# Not run standalone — used by action_executor.py / intrusion_detector.py.
+
+from concurrent.futures import ThreadPoolExecutor
+
+BULK_WORKERS = 8
+
+
+def run_bulk(fn, items, label, max_workers=BULK_WORKERS, key=str):
+    """Call fn(item) for every item concurrently.
+
+    Returns {"ok": count, "errors": {key(item): message}}. Exceptions never escape —
+    one failing host doesn't stop the sweep for the rest.
+    """
+    items = list(items)
+    errors = {}
+    if items:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(items)), thread_name_prefix="bulk") as pool:
+            futures = [(item, pool.submit(fn, item)) for item in items]
+            for item, future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    errors[key(item)] = str(e)
+
+    ok = len(items) - len(errors)
+    print(f"[Bulk] {label}: {ok}/{len(items)} ok" + (f", {len(errors)} failed" if errors else ""))
+    for name, message in errors.items():
+        print(f"[Bulk]   {name}: {message}")
+    return {"ok": ok, "errors": errors}
@@ -0,0 +1,193 @@
+# Long-lived cache of the topology's running containers, kept current by the Docker events stream.
+# Monitor, detector, executor and red agent all read from one shared inventory instead of calling
+# client.containers.list() / get() / reload() every step.
+#
+# Terminal 1 (deploy topology):
+#   cd ~/Desktop/Network_Defender_FYP/containerlab-networks
+#   sudo containerlab deploy -t cage4-topology.yaml
+#
+# Terminal 2 (run — prints the inventory as events arrive):
+#   cd ~/Desktop/Network_Defender_FYP/bridge
+#   sudo ~/fyp-venv-linux/bin/python container_inventory.py
+#
+# Cleanup (when done):
+#   sudo containerlab destroy -t cage4-topology.yaml
+
+import threading
+import time
+
+import docker
+
+CLAB_PREFIX = "clab-cage4-defense-network-"
+
+# Events that change what a step observes: container lifecycle (Restore restarts,
+# crashes) and management network membership (Remove disconnects, Restore reconnects).
+# exec_* events are deliberately excluded — every probe would otherwise trigger a refresh.
+WATCHED_EVENTS = {
+    "type": ["container", "network"],
+    "event": ["start", "restart", "die", "destroy", "connect", "disconnect"],
+}
+
+# Probes and actions exec through the cached Container objects, which share this client
+MAX_POOL_SIZE = 32
+
+# Reconnect delays (seconds) after the events stream drops, doubling up to the max
+RETRY_DELAY = 1.0
+MAX_RETRY_DELAY = 30.0
+
+
+class ContainerInventory:
+    def __init__(self, client=None):
+        self.client = client or docker.from_env(max_pool_size=MAX_POOL_SIZE)
+        self._lock = threading.Lock()
+        self._containers = {}   # full name -> Container (running only)
+        self._events = None
+        self._thread = None
+        self._stopping = threading.Event()
+        # False while the events stream is down: the cache may be stale, so
+        # list()/get() go to Docker directly until the watcher has resynced
+        self._valid = False
+
+    def start(self):
+        """Take the initial snapshot and start following the events stream."""
+        if self._thread is not None:
+            return self
+        self._stopping.clear()
+        self._subscribe()
+        self._thread = threading.Thread(target=self._watch, name="inventory", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopping.set()
+        self._valid = False
+        if self._events is not None:
+            self._events.close()
+        self._events = None
+        self._thread = None
+
+    def _subscribe(self):
+        # subscribe before listing so nothing that happens in between is missed
+        self._events = self.client.events(decode=True, filters=WATCHED_EVENTS)
+        self.resync()
+        self._valid = True
+
+    def resync(self):
+        """Rebuild the cache from a full container listing."""
+        containers = {
+            c.name: c for c in self.client.containers.list()
+            if c.name.startswith(CLAB_PREFIX)
+        }
+        with self._lock:
+            self._containers = containers
+
+    def list(self):
+        """Running topology containers, in docker's listing order."""
+        if not self._valid:
+            self.resync()
+        with self._lock:
+            return list(self._containers.values())
+
+    def get(self, full_name):
+        """Cached container by full name. Raises NotFound if it is not running."""
+        with self._lock:
+            container = self._containers.get(full_name) if self._valid else None
+        if container is None:
+            # not seen yet (e.g. started before its event was processed)
+            container = self.refresh(full_name)
+        if container is None:
+            raise docker.errors.NotFound(f"{full_name} is not running")
+        return container
+
+    def refresh(self, name_or_id):
+        """Re-inspect one container and update the cache. Returns it if running."""
+        try:
+            container = self.client.containers.get(name_or_id)
+        except docker.errors.NotFound:
+            self._discard(name_or_id)
+            return None
+
+        if not container.name.startswith(CLAB_PREFIX):
+            return None
+        with self._lock:
+            if container.status == "running":
+                # assigning to an existing key keeps the listing order stable
+                self._containers[container.name] = container
+                return container
+            self._containers.pop(container.name, None)
+        return None
+
+    def mgmt_network(self, exclude=None):
+        """Name of the clab management network, read from any connected host other than exclude."""
+        # not cached: the attrs are already in memory, and a cached answer could
+        # come from the host a later caller asks to exclude
+        for c in self.list():
+            if "router" in c.name or c.name == exclude:
+                continue
+            nets = c.attrs["NetworkSettings"]["Networks"].keys()
+            mgmt = next((n for n in nets if n.startswith("clab")), None)
+            if mgmt:
+                return mgmt
+        return None
+
+    def _discard(self, name_or_id):
+        with self._lock:
+            for name, c in list(self._containers.items()):
+                if name == name_or_id or c.id == name_or_id:
+                    del self._containers[name]
+
+    def _watch(self):
+        delay = RETRY_DELAY
+        while not self._stopping.is_set():
+            try:
+                if self._events is None:
+                    self._subscribe()
+                    print("[Inventory] events stream reconnected, cache resynced")
+                    delay = RETRY_DELAY
+                for event in self._events:
+                    self._handle(event)
+                # the stream ending on its own (e.g. daemon restart) is a failure too
+                error = "stream closed"
+            except Exception as e:
+                error = e
+            if self._stopping.is_set():
+                return
+
+            self._valid = False
+            self._events = None
+            print(f"[Inventory] events stream stopped ({error}) — querying Docker directly, retrying in {delay:.0f}s")
+            self._stopping.wait(delay)
+            delay = min(delay * 2, MAX_RETRY_DELAY)
+
+    def _handle(self, event):
+        attrs = event.get("Actor", {}).get("Attributes", {})
+        if event.get("Type") == "network":
+            # network events are keyed by network; the container is an attribute
+            target = attrs.get("container")
+        else:
+            if not attrs.get("name", "").startswith(CLAB_PREFIX):
+                return
+            target = event.get("Actor", {}).get("ID")
+        if target:
+            self.refresh(target)
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_inventory():
+    """Process-wide inventory, started on first use."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = ContainerInventory().start()
+    return _shared
+
+
+if __name__ == "__main__":
+    inventory = get_inventory()
+    while True:
+        names = [c.name.removeprefix(CLAB_PREFIX) for c in inventory.list()]
+        print(f"{len(names)} running: {', '.join(sorted(names))}")
+        time.sleep(2)
@@ -0,0 +1,186 @@
+# Pool of pre-started decoy containers. DeployDecoy attaches an idle decoy to the target's
+# management network instead of deploying a fresh containerlab topology; cleanup detaches
+# it and puts it back in the pool. A background thread keeps the pool topped up.
+#
+# Terminal 1 (deploy topology):
+#   cd ~/Desktop/Network_Defender_FYP/containerlab-networks
+#   sudo containerlab deploy -t cage4-topology.yaml
+#
+# Terminal 2 (run — fills the pool and prints its size):
+#   cd ~/Desktop/Network_Defender_FYP/bridge
+#   sudo ~/fyp-venv-linux/bin/python decoy_pool.py
+#
+# Cleanup (when done):
+#   sudo ~/fyp-venv-linux/bin/python decoy_pool.py --remove
+#   sudo containerlab destroy -t cage4-topology.yaml
+
+import sys
+import threading
+import uuid
+from collections import deque
+
+import docker
+
+DECOY_IMAGE = "nginx:alpine"
+DECOY_POOL_SIZE = 4
+DECOY_LABEL = "cage4-decoy-pool"
+DECOY_PREFIX = "decoy-pool-"
+
+
+class DecoyPool:
+    def __init__(self, client=None, size=DECOY_POOL_SIZE, image=DECOY_IMAGE):
+        self.client = client or docker.from_env()
+        self.size = size
+        self.image = image
+        self._idle = deque()     # started, detached decoys ready to hand out
+        self._active = {}        # container name -> (container, network name)
+        self._dirty = deque()    # released decoys waiting to be reset
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = None
+
+    def start(self):
+        """Adopt decoys left by a previous run, then keep the pool filled in the background."""
+        if self._thread is not None:
+            return self
+        with self._cond:
+            self._dirty.extend(self.client.containers.list(all=True, filters={"label": DECOY_LABEL}))
+        self._thread = threading.Thread(target=self._replenish, name="decoy-pool", daemon=True)
+        self._thread.start()
+        return self
+
+    def acquire(self, network, timeout=0.0):
+        """Attach an idle decoy to `network`. Returns the container, or None if the pool is empty."""
+        with self._cond:
+            if not self._idle:
+                self._cond.wait_for(lambda: self._idle or self._stopped, timeout=timeout)
+            if not self._idle:
+                return None
+            container = self._idle.popleft()
+            self._cond.notify_all()   # wake the replenisher
+        try:
+            self.client.networks.get(network).connect(container)
+        except Exception:
+            self._remove(container)
+            raise
+        with self._cond:
+            self._active[container.name] = (container, network)
+        print(f"[DecoyPool] {container.name} attached to {network} ({len(self._idle)} idle)")
+        return container
+
+    def release(self, name):
+        """Detach an active decoy; it is reset and returned to the pool in the background."""
+        with self._cond:
+            container, network = self._active.pop(name, (None, None))
+        if container is None:
+            return
+        try:
+            self.client.networks.get(network).disconnect(container)
+        except Exception as e:
+            print(f"[DecoyPool] could not detach {name}: {e}")
+            self._remove(container)
+            return
+        with self._cond:
+            self._dirty.append(container)
+            self._cond.notify_all()
+
+    def release_all(self):
+        with self._cond:
+            names = list(self._active)
+        for name in names:
+            self.release(name)
+
+    def idle(self):
+        with self._cond:
+            return len(self._idle)
+
+    def remove_stale(self):
+        """Delete every pooled decoy container, including ones left by other runs."""
+        for c in self.client.containers.list(all=True, filters={"label": DECOY_LABEL}):
+            self._remove(c)
+
+    def stop(self, remove=True):
+        """Stop replenishing; with remove=True also delete every pooled container."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+            containers = list(self._idle) + list(self._dirty) + [c for c, _ in self._active.values()]
+            self._idle.clear()
+            self._dirty.clear()
+            self._active.clear()
+        if remove:
+            for c in containers:
+                self._remove(c)
+
+    def _recycle(self, container):
+        # a restart drops anything red left behind; decoys stay off every network while idle
+        container.reload()
+        if container.status == "running":
+            container.restart(timeout=1)
+        else:
+            container.start()
+        container.reload()
+        for net in list(container.attrs["NetworkSettings"]["Networks"]):
+            self.client.networks.get(net).disconnect(container)
+        return container
+
+    def _create(self):
+        container = self.client.containers.run(
+            self.image,
+            name=DECOY_PREFIX + uuid.uuid4().hex[:8],
+            labels=[DECOY_LABEL],
+            detach=True,
+        )
+        container.reload()
+        # started on the default bridge — detach so it is unreachable until acquired
+        for net in list(container.attrs["NetworkSettings"]["Networks"]):
+            self.client.networks.get(net).disconnect(container)
+        return container
+
+    def _remove(self, container):
+        try:
+            container.remove(force=True)
+        except Exception:
+            pass
+
+    def _replenish(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._stopped or self._dirty or len(self._idle) < self.size
+                )
+                if self._stopped:
+                    return
+                # reset released decoys before creating new ones
+                dirty = self._dirty.popleft() if self._dirty else None
+                surplus = dirty is not None and len(self._idle) >= self.size
+            if surplus:
+                self._remove(dirty)
+                continue
+            try:
+                container = self._recycle(dirty) if dirty is not None else self._create()
+            except Exception as e:
+                print(f"[DecoyPool] could not prepare decoy: {e}")
+                if dirty is not None:
+                    self._remove(dirty)
+                with self._cond:
+                    self._cond.wait(timeout=5.0)
+                continue
+            with self._cond:
+                if self._stopped:
+                    self._remove(container)
+                    return
+                self._idle.append(container)
+                self._cond.notify_all()
+
+
+if __name__ == "__main__":
+    pool = DecoyPool()
+    if "--remove" in sys.argv:
+        pool.remove_stale()
+        print("Decoy pool removed")
+    else:
+        pool.start()
+        with pool._cond:
+            pool._cond.wait_for(lambda: len(pool._idle) >= pool.size)
+        print(f"Decoy pool ready: {pool.idle()} idle decoys")
@@ -1,4 +1,4 @@
-# Runs a full 100-step episode and logs every red/blue action to a CSV in bridge/results/.
+# Runs 100-step episodes and logs every red/blue action to a CSV in bridge/results/.
 #
 # Terminal 1 (deploy topology):
 #   cd ~/Desktop/Network_Defender_FYP/containerlab-networks
@@ -14,6 +14,25 @@
 #   sudo ~/fyp-venv-linux/bin/python evaluation.py --mask
 #   → bridge_eval_<timestamp>_masked.csv
 #
+# Terminal 2 (run — stages strictly in order, for timing comparisons):
+#   sudo ~/fyp-venv-linux/bin/python evaluation.py --sequential
+#
+# Terminal 2 (run — Restore/DeployDecoy in the background, fixed decision cadence):
+#   sudo ~/fyp-venv-linux/bin/python evaluation.py --async
+#
+# Terminal 2 (run — batch of seeded episodes on the same lab, model loaded once):
+#   sudo ~/fyp-venv-linux/bin/python evaluation.py --episodes 10
+#   sudo ~/fyp-venv-linux/bin/python evaluation.py --seeds 0 1 2 3
+#   → bridge_eval_<timestamp>.csv (every step of every episode, tagged episode/seed)
+#   → bridge_batch_summary_<timestamp>.csv (one row per episode)
+#
+# Terminal 2 (run — int8 quantized actor, recording every observation):
+#   sudo ~/fyp-venv-linux/bin/python evaluation.py --quantized --record-obs obs_bridge.pt
+#   → obs_bridge.pt, input for trained-agent/quantize_actor.py --obs
+#
+# Terminal 2 (run — greedy actions, skipping actions the executor would reject):
+#   sudo ~/fyp-venv-linux/bin/python evaluation.py --mode greedy --mask-unavailable
+#
 # Cleanup (when done):
 #   sudo containerlab destroy -t cage4-topology.yaml
 
@@ -21,28 +40,49 @@ import argparse
 import csv
 import os
 from datetime import datetime
+from statistics import mean, stdev
+
+import torch
 
 from network_monitor import ContainerlabMonitor
 from graph_builder import ObservationGraphBuilder
-from agent_adapter import AgentAdapter
+from agent_adapter import AgentAdapter, MODES
 from action_executor import ActionExecutor
 from red_agent import RedAgent
 from intrusion_detector import IntrusionDetector
+from step_scheduler import StepScheduler
+from decoy_pool import DecoyPool, DECOY_POOL_SIZE
 
 TOTAL_STEPS = 100
 LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
 
+FIELDS = ["episode", "seed", "step", "phase", "red_action", "red_host", "red_success",
+          "blue_action_type", "blue_target", "blue_result",
+          "compromised_count", "decoy_count", "in_progress"]
+
+SUMMARY_FIELDS = ["episode", "seed", "steps", "mean_compromised", "max_compromised", "final_compromised",
+                  "red_success_rate", "restores", "decoys_deployed", "wall_seconds"]
+
+
+def run_evaluation(mask_edge_actions=False, pipelined=True, async_mode=False, decoy_pool_size=DECOY_POOL_SIZE,
+                   episodes=1, seeds=None, quantized=False, record_obs=None, mode="sample", temperature=1.0,
+                   mask_unavailable=False):
+    seeds = list(seeds) if seeds else list(range(episodes))
 
-def run_evaluation(mask_edge_actions=False):
     os.makedirs(LOG_DIR, exist_ok=True)
     run_id = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
     suffix = "_masked" if mask_edge_actions else ""
     csv_path = os.path.join(LOG_DIR, f"bridge_eval_{run_id}{suffix}.csv")
+    summary_path = os.path.join(LOG_DIR, f"bridge_batch_summary_{run_id}{suffix}.csv")
 
+    # built once — weights load once and the lab is reused across episodes
     monitor = ContainerlabMonitor()
     builder = ObservationGraphBuilder()
-    adapter = AgentAdapter(mask_edge_actions=mask_edge_actions)
-    executor = ActionExecutor()
+    adapter = AgentAdapter(mask_edge_actions=mask_edge_actions, quantized=quantized, mode=mode, temperature=temperature)
+    if record_obs:
+        adapter.recorded = []
+    decoy_pool = DecoyPool(size=decoy_pool_size).start() if decoy_pool_size > 0 else None
+    executor = ActionExecutor(async_mode=async_mode, decoy_pool=decoy_pool)
     detector = IntrusionDetector()
 
     state = monitor.get_network_state()
@@ -53,66 +93,133 @@ def run_evaluation(mask_edge_actions=False):
     detector.cleanup_flags(all_containers)
 
     red_agent = RedAgent(all_containers, decoys=executor._decoys)
+    scheduler = StepScheduler(monitor, builder, adapter, executor, detector, red_agent, pipelined=pipelined,
+                              mask_unavailable=mask_unavailable)
 
-    rows = []
-    FIELDS = ["step", "phase", "red_action", "red_host", "red_success",
-              "blue_action_type", "blue_target", "blue_result",
-              "compromised_count", "decoy_count"]
-
-    print(f"Bridge System Evaluation — {TOTAL_STEPS} steps\n")
+    summaries = []
+    print(f"Bridge System Evaluation — {len(seeds)} episode(s) x {TOTAL_STEPS} steps\n")
 
     with open(csv_path, "w", newline="") as f:
         writer = csv.DictWriter(f, fieldnames=FIELDS)
         writer.writeheader()
 
-        for step in range(TOTAL_STEPS):
-            phase = min(step // (TOTAL_STEPS // 3), 2)
-
-            red_action, red_host, red_success = red_agent.step()
-
-            state = monitor.get_network_state()
-            servers, users, routers = builder.classify_node_type(state)
-            all_containers = servers + users
-
-            compromises = detector.scan(all_containers)
-            compromised_count = sum(1 for v in compromises.values() if v >= 1)
-
-            action_int = adapter.get_action(
-                state, phase, red_agent.host_states, compromises, decoys=executor._decoys
-            )
-            result = executor.execute(action_int, servers, users)
-
-            row = {
-                "step": step + 1,
-                "phase": phase,
-                "red_action": red_action,
-                "red_host": red_host,
-                "red_success": red_success,
-                "blue_action_type": result["action_type"],
-                "blue_target": result["target"],
-                "blue_result": result["result"],
-                "compromised_count": compromised_count,
-                "decoy_count": len(executor._decoys),
-            }
-            rows.append(row)
-            writer.writerow(row)
-            f.flush()
-
-            print(
-                f"[{step+1:3d}] Phase {phase} | "
-                f"RED: {red_action:<28} on {str(red_host):<40} | "
-                f"BLUE: {result['action_type']:<14} on {str(result['target']):<40} | "
-                f"Compromised: {compromised_count}  Decoys: {len(executor._decoys)}"
-            )
-
-    print(f"\nResults saved to {csv_path}\n")
-    
+        for episode, seed in enumerate(seeds):
+            if episode > 0:
+                # undo the previous episode in place instead of redeploying
+                executor.reset(all_containers)
+            red_agent.reset(seed)
+            torch.manual_seed(seed)
+
+            print(f"Episode {episode + 1}/{len(seeds)} (seed {seed})")
+            rows = run_episode(scheduler, executor, writer, f, episode, seed)
+            summaries.append(summarise(episode, seed, rows, scheduler.history[-len(rows):]))
+
+    with open(summary_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(summaries)
+
+    print(f"\nResults saved to {csv_path}")
+    print(f"Summary saved to {summary_path}\n")
+    print_summary_table(summaries)
+    scheduler.print_summary()
+    if record_obs:
+        adapter.save_recorded(record_obs)
+
+    monitor.close()
+    executor.drain()
     executor.cleanup_stale_decoys()
     detector.cleanup_flags(all_containers)
+    if decoy_pool is not None:
+        decoy_pool.stop()
+    return summaries
+
+
+def run_episode(scheduler, executor, writer, f, episode, seed):
+    rows = []
+    for step in range(TOTAL_STEPS):
+        phase = min(step // (TOTAL_STEPS // 3), 2)
+
+        out = scheduler.step(step, phase, has_next=step + 1 < TOTAL_STEPS)
+        red_action, red_host, red_success = out["red_action"], out["red_host"], out["red_success"]
+        compromises, result = out["compromises"], out["result"]
+        compromised_count = sum(1 for v in compromises.values() if v >= 1)
+
+        row = {
+            "episode": episode,
+            "seed": seed,
+            "step": step + 1,
+            "phase": phase,
+            "red_action": red_action,
+            "red_host": red_host,
+            "red_success": red_success,
+            "blue_action_type": result["action_type"],
+            "blue_target": result["target"],
+            "blue_result": result["result"],
+            "compromised_count": compromised_count,
+            "decoy_count": len(executor._decoys),
+            "in_progress": ";".join(sorted(out["state"]["in_progress"])),
+        }
+        rows.append(row)
+        writer.writerow(row)
+        f.flush()
+
+        print(
+            f"[{step+1:3d}] Phase {phase} | "
+            f"RED: {str(red_action):<28} on {str(red_host):<40} | "
+            f"BLUE: {result['action_type']:<14} on {str(result['target']):<40} | "
+            f"Compromised: {compromised_count}  Decoys: {len(executor._decoys)}"
+        )
+    return rows
+
+
+def summarise(episode, seed, rows, timings):
+    compromised = [r["compromised_count"] for r in rows]
+    red_attempts = [r["red_success"] for r in rows if r["red_action"]]
+    return {
+        "episode": episode,
+        "seed": seed,
+        "steps": len(rows),
+        "mean_compromised": round(mean(compromised), 3),
+        "max_compromised": max(compromised),
+        "final_compromised": compromised[-1],
+        "red_success_rate": round(sum(1 for s in red_attempts if s) / len(red_attempts), 3) if red_attempts else 0.0,
+        "restores": sum(1 for r in rows if r["blue_action_type"] == "Restore"),
+        "decoys_deployed": sum(1 for r in rows if r["blue_action_type"] == "DeployDecoy"),
+        "wall_seconds": round(sum(t["wall"] for t in timings), 2),
+    }
+
+
+def print_summary_table(summaries):
+    columns = SUMMARY_FIELDS[1:]
+    print("  ".join(f"{c:>17}" for c in ["episode"] + columns))
+    for s in summaries:
+        print("  ".join(f"{str(s[c]):>17}" for c in ["episode"] + columns))
+    if len(summaries) > 1:
+        for label, fn in (("mean", mean), ("stdev", stdev)):
+            cells = [f"{fn([s[c] for s in summaries]):>17.3f}" for c in columns[2:]]
+            print("  ".join([f"{label:>17}", f"{'':>17}", f"{'':>17}"] + cells))
+    print()
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--mask", action="store_true", help="Enable edge action masking (actions 64-79)")
+    parser.add_argument("--sequential", action="store_true", help="Run stages strictly in order (no overlap)")
+    parser.add_argument("--async", dest="async_mode", action="store_true", help="Run Restore/DeployDecoy in the background")
+    parser.add_argument("--decoy-pool", type=int, default=DECOY_POOL_SIZE, help="Pre-started decoys (0 = clab deploy per decoy)")
+    parser.add_argument("--episodes", type=int, default=1, help="Episodes to run back to back (seeds 0..N-1)")
+    parser.add_argument("--seeds", type=int, nargs="+", help="Explicit per-episode seeds (one episode each)")
+    parser.add_argument("--quantized", action="store_true", help="Use the int8 quantized actor")
+    parser.add_argument("--record-obs", metavar="PATH", help="Save every observation the agent saw to PATH")
+    parser.add_argument("--mode", choices=MODES, default="sample", help="Action selection: sample, greedy (argmax) or temperature")
+    parser.add_argument("--temperature", type=float, default=1.0, help="Sampling temperature for --mode temperature")
+    parser.add_argument("--mask-unavailable", action="store_true",
+                        help="Mask actions the executor would reject (busy/missing hosts, re-Remove, second decoy)")
     args = parser.parse_args()
-    run_evaluation(mask_edge_actions=args.mask)
+    if args.seeds and args.episodes not in (1, len(args.seeds)):
+        parser.error("--episodes and --seeds disagree on the number of episodes")
+    run_evaluation(mask_edge_actions=args.mask, pipelined=not args.sequential, async_mode=args.async_mode,
+                   decoy_pool_size=args.decoy_pool, episodes=args.episodes, seeds=args.seeds,
+                   quantized=args.quantized, record_obs=args.record_obs, mode=args.mode,
+                   temperature=args.temperature, mask_unavailable=args.mask_unavailable)
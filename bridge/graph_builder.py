@@ -11,6 +11,9 @@
 # Cleanup (when done):
 #   sudo containerlab destroy -t cage4-topology.yaml
 
+from functools import lru_cache
+
+import numpy as np
 import torch
 from torch_geometric.data import Data
 
@@ -62,54 +65,177 @@ CONTAINER_ROLES ={
 # [186]  restricted_zone_b_subnet_router
 # [187]  tabular: was_compromised
 
+# subnet name fragments in feature order (178 + index)
+SUBNETS = [
+    "admin-network",
+    "contractor-network",
+    "internet",
+    "office-network",
+    "operational-zone-a",
+    "operational-zone-b",
+    "public-access-zone",
+    "restricted-zone-a",
+    "restricted-zone-b",
+]
+SUBNET_OFFSET = 178
+
+# per-role static columns: node type, then server/router/user flag
+ROLES = ["server", "user", "router"]
+ROLE_COLUMNS = np.array([
+    [0, 56],   # server: system node, server
+    [0, 55],   # user:   system node, user
+    [3, 57],   # router: internet node, router
+])
+ALWAYS_ON = [5, 14, 24]   # x64, ubuntu, linux
+
+# Feature columns that change during an episode, grouped by what sets them.
+# Everything else is fixed by the node's name, role and subnet.
+FLAG_COLUMNS = {
+    "compromised": [99, 187],        # suspicious pid, was_compromised
+    "red_active":  [188],            # red FSM past Known
+    "processes":   [60, 78, 101],    # ps available
+    "sshd":        [64, 88],
+    "web":         [70, 93],         # apache2 / nginx
+    "decoy":       [100, 102],       # is decoy, is ephemeral
+}
+DYNAMIC_COLUMNS = sorted(col for cols in FLAG_COLUMNS.values() for col in cols)
+RED_ACTIVE_STATES = {"S", "SD", "U", "UD", "R", "RD"}
+
+
+@lru_cache(maxsize=None)
+def subnet_index(clean_name):
+    for i, subnet in enumerate(SUBNETS):
+        if subnet in clean_name:
+            return i
+    return 0
+
+
+def role_of(clean_name):
+    return "router" if clean_name.endswith("-router") else CONTAINER_ROLES[clean_name][0]
+
+
 class ObservationGraphBuilder:
+    def __init__(self):
+        # caches for the current topology — rebuilt only when the node set changes
+        self._topology     = None   # clean names in graph order
+        self._nodes_to_idx = None
+        self._edge_index   = None
+        self._features     = None   # preallocated N x 192 float32 array, patched in place
+        self._x            = None   # torch.from_numpy view of _features
+        self._dynamic      = None   # N x len(DYNAMIC_COLUMNS) bools currently set
+
+        # FLAG_COLUMNS as positions within DYNAMIC_COLUMNS
+        pos = {col: i for i, col in enumerate(DYNAMIC_COLUMNS)}
+        self._flag_pos = {flag: [pos[c] for c in cols] for flag, cols in FLAG_COLUMNS.items()}
+
     def build_graph(self, network_state, compromise_map=None, host_states=None, decoys=None, processes=None):
+        """Graph for the current step.
+
+        Edge index, node ordering and static features are cached per topology; only
+        rows whose dynamic columns changed are rewritten. The returned x is reused and
+        overwritten by the next call — clone it to keep it.
+        """
         servers, users, routers = self.classify_node_type(network_state)
         all_nodes = servers + users + routers
-        nodes_to_idx = {c["clean_name"]: i for i, c in enumerate(all_nodes)}
+
+        topology = tuple(c["clean_name"] for c in all_nodes)
+        if topology != self._topology:
+            self._build_static(servers, users, routers)
+            self._topology = topology
 
         # store so AgentAdapter can read consistent ordering without a second classify call
         self._last_servers      = servers
         self._last_users        = users
         self._last_routers      = routers
-        self._last_nodes_to_idx = nodes_to_idx
+        self._last_nodes_to_idx = self._nodes_to_idx
 
         if compromise_map:
             for c in all_nodes:
                 c["compromise_level"] = compromise_map.get(c["clean_name"], 0)
 
-        #feature matrix construction
-        node_features = []
-        for c in all_nodes:
-            name = c["clean_name"]
-            subnet_idx = self.get_subnet_index(name)
-            role = "router" if name.endswith("-router") else CONTAINER_ROLES[name][0]
-            node_features.append(self.encode_host(c, role, subnet_idx, host_states, processes=processes, decoys=decoys))
-        x = torch.tensor(node_features, dtype = torch.float)
-        
-
-        #Build edge index
+        # patch only the rows whose dynamic features changed since the last step
+        dynamic = self.dynamic_flags(all_nodes, host_states, processes=processes, decoys=decoys)
+        changed = np.flatnonzero((dynamic != self._dynamic).any(axis=1))
+        if changed.size:
+            self._features[np.ix_(changed, DYNAMIC_COLUMNS)] = dynamic[changed]
+            self._dynamic = dynamic
+
+        return Data(x=self._x, edge_index=self._edge_index)
+
+    def _build_static(self, servers, users, routers):
+        all_nodes = servers + users + routers
+        names = [c["clean_name"] for c in all_nodes]
+        nodes_to_idx = {name: i for i, name in enumerate(names)}
+
+        self._features = self.static_features(names)
+        self._x = torch.from_numpy(self._features)   # shares memory with _features
+        self._dynamic = np.zeros((len(names), len(DYNAMIC_COLUMNS)), dtype=bool)
+
+        #Build edge index: each host to its subnet router, each subnet router to the internet router
+        router_by_subnet = {}
+        for router in routers:
+            name = router["clean_name"]
+            if name != "internet-router":
+                router_by_subnet.setdefault(subnet_index(name), nodes_to_idx[name])
+
         edge_index = []
         for c in servers + users:
-            host_idx = nodes_to_idx[c["clean_name"]]
-            subnet_idx = self.get_subnet_index(c["clean_name"])
-            for router in routers:
-                if router["clean_name"] != "internet-router" and self.get_subnet_index(router["clean_name"]) == subnet_idx:
-                    router_idx = nodes_to_idx[router["clean_name"]]
-                    edge_index += [[host_idx, router_idx], [router_idx, host_idx]]
-                    break
-
-        #connecting subnet routers to internet router
+            router_idx = router_by_subnet.get(subnet_index(c["clean_name"]))
+            if router_idx is not None:
+                host_idx = nodes_to_idx[c["clean_name"]]
+                edge_index += [[host_idx, router_idx], [router_idx, host_idx]]
+
         internet_idx = nodes_to_idx["internet-router"]
         for router in routers:
-            if router["clean_name"] != "internet-router" and internet_idx is not None:
+            if router["clean_name"] != "internet-router":
                 router_idx = nodes_to_idx[router["clean_name"]]
                 edge_index += [[router_idx, internet_idx], [internet_idx, router_idx]]
 
-        edge_index = torch.tensor(edge_index, dtype=torch.long).t().contiguous()
-        return Data(x=x, edge_index=edge_index)
+        self._edge_index = torch.tensor(edge_index, dtype=torch.long).t().contiguous()
+        self._nodes_to_idx = nodes_to_idx
+
+    def static_features(self, names):
+        """N x 192 float32 matrix of the columns fixed by name, role and subnet."""
+        rows = np.arange(len(names))
+        roles = np.array([ROLES.index(role_of(n)) for n in names], dtype=np.int64)
+        subnets = np.array([subnet_index(n) for n in names], dtype=np.int64)
+
+        features = np.zeros((len(names), FEATURE_DIM), dtype=np.float32)
+        features[:, ALWAYS_ON] = 1.0
+        features[rows[:, None], ROLE_COLUMNS[roles]] = 1.0
+        features[rows, SUBNET_OFFSET + subnets] = 1.0
+        return features
 
+    def dynamic_flags(self, containers, host_states=None, processes=None, decoys=None):
+        """N x len(DYNAMIC_COLUMNS) bool matrix of the columns set this step."""
+        names = [c["clean_name"] for c in containers]
+        flags = np.zeros((len(names), len(DYNAMIC_COLUMNS)), dtype=bool)
 
+        levels = np.fromiter((c.get("compromise_level", 0) for c in containers), dtype=np.int64, count=len(names))
+        flags[:, self._flag_pos["compromised"]] = (levels >= 1)[:, None]
+
+        if host_states:
+            red_active = np.fromiter(
+                (host_states.get(n, {}).get("state", "K") in RED_ACTIVE_STATES for n in names),
+                dtype=bool, count=len(names),
+            )
+            flags[:, self._flag_pos["red_active"]] = red_active[:, None]
+
+        #Process based features from ps
+        if processes:
+            cmds = [self._commands(processes.get(n, [])) for n in names]
+            flags[:, self._flag_pos["processes"]] = True
+            flags[:, self._flag_pos["sshd"]] = np.array(["sshd" in c for c in cmds])[:, None]
+            flags[:, self._flag_pos["web"]] = np.array(["apache2" in c or "nginx" in c for c in cmds])[:, None]
+
+        if decoys:
+            is_decoy = np.fromiter((n in decoys for n in names), dtype=bool, count=len(names))
+            flags[:, self._flag_pos["decoy"]] = is_decoy[:, None]
+
+        return flags
+
+    def _commands(self, proc):
+        return " ".join(p.get("command", "") for p in proc).lower() if isinstance(proc, list) else ""
 
     def classify_node_type(self, state):
         servers, users, routers = [], [], []
@@ -129,72 +255,14 @@ class ObservationGraphBuilder:
         return servers, users, routers
 
     def get_subnet_index (self, clean_name):
-        if "admin-network" in clean_name: return 0
-        elif "contractor-network" in clean_name: return 1
-        elif "internet" in clean_name: return 2
-        elif "office-network" in clean_name: return 3
-        elif "operational-zone-a" in clean_name: return 4
-        elif "operational-zone-b" in clean_name: return 5
-        elif "public-access-zone" in clean_name: return 6
-        elif "restricted-zone-a" in clean_name: return 7
-        elif "restricted-zone-b" in clean_name: return 8
-        return 0
+        return subnet_index(clean_name)
 
     def encode_host(self, container, role, subnet_idx, host_states= None, processes=None, decoys=None):
-        features = [0.0] * FEATURE_DIM
-
-        #node type
-        if role in ("server", "user"):
-            features[0] = 1.0 #system node
-        else:
-            features[3] = 1.0 #internet node
-
-        #Architecture and OS
-        features[5] = 1.0 #x64
-        features[14] = 1.0 #ubuntu
-        features[24] = 1.0 #linux
-
-        if role == "server":
-            features[56] = 1.0 #server
-        elif role == "router":
-            features[57] = 1.0 #router
-        elif role == "user":
-            features[55] = 1.0 #user
-
-        features[178 +subnet_idx] = 1.0
-
-        level = container.get("compromise_level", 0)
-        if level >= 1:
-            features[187] = 1.0
-
-        name = container.get("clean_name","")
-        if host_states:
-            red_state = host_states.get(name, {}).get('state','K')
-            if red_state in ("S", "SD", "U", "UD", "R", "RD"):
-                features[188] = 1.0
-
-        #Process based features from ps
-        if processes:
-            proc = processes.get(name, [])
-            cmds = " ".join(p.get("command", "") for p in proc).lower() if isinstance(proc, list) else ""
-            features[60] = 1.0
-            features[78] = 1.0
-            features[101] = 1.0
-            if "sshd" in cmds:
-                features[64] = 1.0
-                features[88] = 1.0
-            if "apache2" in cmds or "nginx" in cmds:
-                features[70] = 1.0
-                features[93] = 1.0
-
-        #Suspicious pid
-        if level >=1:
-            features[99] = 1.0
-
-        #decoy flags 
-        if decoys and name in decoys:
-            features[100] = 1.0 #is decoy?
-            features[102] = 1.0 #is ephemeral
-
-        return features
-    
+        # single-host 192-dim list; build_graph encodes every node at once instead
+        container = {"clean_name": "", **container}
+        features = np.zeros(FEATURE_DIM, dtype=np.float32)
+        features[ALWAYS_ON] = 1.0
+        features[ROLE_COLUMNS[ROLES.index(role)]] = 1.0
+        features[SUBNET_OFFSET + subnet_idx] = 1.0
+        features[DYNAMIC_COLUMNS] = self.dynamic_flags([container], host_states, processes=processes, decoys=decoys)[0]
+        return features.tolist()
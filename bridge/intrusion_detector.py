@@ -13,50 +13,60 @@
 #   sudo containerlab destroy -t cage4-topology.yaml
 
 import docker
+from container_inventory import get_inventory
+from network_monitor import SENTINEL_SCRIPT, parse_sentinel
+from bulk_ops import run_bulk
 
 CLAB_PREFIX = "clab-cage4-defense-network-"
 
+# everything the red agent leaves behind on a host
+CLEANUP_CMD = "rm -f /root/.compromised /tmp/.compromised /tmp/junk /tmp/degraded"
+
 class IntrusionDetector:
-    def __init__(self):
+    def __init__(self, inventory=None):
         self.client = docker.from_env()
+        self.inventory = inventory or get_inventory()
 
-    def scan(self, containers):
+    def scan(self, containers, sentinels=None):
+        # sentinels: {clean_name: level} from the monitor's probe bundle.
+        # Hosts it already covered are not exec'd into a second time.
         print("scanning for compromised markers on hosts")
+        sentinels = sentinels or {}
 
         results = {}
         for c in containers:
             name = c["clean_name"]
-            results[name] = self._check_container(name)
+            if name in sentinels:
+                results[name] = self._report(name, sentinels[name])
+            else:
+                results[name] = self._check_container(name)
         return results
+
+    def _report(self, clean_name, level):
+        if level == 2:
+            print(f"  [IntrusionDetector] {clean_name} - root compromised")
+        elif level == 1:
+            print(f"  [IntrusionDetector] {clean_name} - user compromised")
+        return level
     
     def _check_container(self, clean_name):
         full_name = CLAB_PREFIX + clean_name
         try:
-            container = self.client.containers.get(full_name)
-            if container.status != "running":
-                return 0
-            
-            result = container.exec_run("test -f /root/.compromised")
-            if result.exit_code == 0:
-                print(f"  [IntrusionDetector] {clean_name} - root compromised")
-                return 2
+            try:
+                container = self.inventory.get(full_name)
+            except docker.errors.NotFound:
+                return 0  # not running
             
-            results = container.exec_run("test -f /tmp/.compromised")
-            if results.exit_code == 0:
-                print(f"  [IntrusionDetector] {clean_name} - user compromised")
-                return 1
-            return 0
+            # both sentinel files checked in one exec (root takes priority)
+            out = container.exec_run(["sh", "-c", SENTINEL_SCRIPT]).output.decode()
+            return self._report(clean_name, parse_sentinel(out))
         
         except Exception as e:
             print(f"  [IntrusionDetector] could not scan {clean_name}: {e}")
             return 0
 
     def cleanup_flags(self, containers):
-        for c in containers:
-            name = c["clean_name"]
-            full_name = CLAB_PREFIX + name
-            try:
-                container = self.client.containers.get(full_name)
-                container.exec_run("rm -f /root/.compromised /tmp/.compromised /tmp/junk /tmp/degraded")
-            except Exception:
-                pass
\ No newline at end of file
+        """Remove red's marker files from every host in parallel. Returns the bulk summary."""
+        def clean(c):
+            self.inventory.get(CLAB_PREFIX + c["clean_name"]).exec_run(CLEANUP_CMD)
+        return run_bulk(clean, containers, "cleanup flags", key=lambda c: c["clean_name"])
\ No newline at end of file
@@ -23,7 +23,19 @@
 #   5. action_executor    — executes action on live Docker containers
 #   6. red_agent          — simulates attacker FSM via Docker exec_run
 #   7. server             — serves live dashboard at http://localhost:8080
-
+#
+# Stages are driven by step_scheduler.StepScheduler, which overlaps the next red
+# attack and observation prefetch with the blue action. Run with --sequential
+# to disable the overlap; a per-stage timing breakdown is printed at the end.
+# Run with --async to let Restore/DeployDecoy finish in the background while
+# the loop keeps stepping (hosts show as in progress until they complete).
+# DeployDecoy attaches decoys from a warm pool (decoy_pool.py); --decoy-pool 0
+# falls back to a containerlab deployment per decoy.
+# Run with --quantized to use the int8 actor (see agent_adapter.py).
+# --mode greedy|temperature changes how the action is picked from the policy, and
+# --mask-unavailable skips actions the executor would reject (see step_scheduler.py).
+
+import argparse
 import json
 import os
 import signal
@@ -33,41 +45,58 @@ from collections import Counter
 import server
 from network_monitor import ContainerlabMonitor
 from graph_builder import ObservationGraphBuilder
-from agent_adapter import AgentAdapter
+from agent_adapter import AgentAdapter, MODES
 from action_executor import ActionExecutor
 from red_agent import RedAgent
 from intrusion_detector import IntrusionDetector
+from step_scheduler import StepScheduler
+from decoy_pool import DecoyPool, DECOY_POOL_SIZE
 
 MAX_STEPS = 100
 
 STATE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "state.json")
 
-monitor = ContainerlabMonitor()
-builder = ObservationGraphBuilder()
-adapter = AgentAdapter()
-executor = ActionExecutor()
-detector = IntrusionDetector()
+monitor = builder = adapter = executor = detector = red_agent = decoy_pool = None
+all_containers = []
+
+
+def setup(async_mode=False, decoy_pool_size=DECOY_POOL_SIZE, quantized=False, mode="sample", temperature=1.0):
+    """Build the pipeline components, clean up leftovers from previous runs and install the Ctrl+C handler."""
+    global monitor, builder, adapter, executor, detector, red_agent, decoy_pool, all_containers
 
-#initial classification to get red agents container list
-state = monitor.get_network_state()
-servers, users, routers = builder.classify_node_type(state)
-all_containers = servers + users
+    monitor = ContainerlabMonitor()
+    builder = ObservationGraphBuilder()
+    adapter = AgentAdapter(quantized=quantized, mode=mode, temperature=temperature)
+    decoy_pool = DecoyPool(size=decoy_pool_size).start() if decoy_pool_size > 0 else None
+    executor = ActionExecutor(async_mode=async_mode, decoy_pool=decoy_pool)
+    detector = IntrusionDetector()
 
-#clean up any existing decoys or flags from previous runs
-executor.cleanup_stale_decoys()
-detector.cleanup_flags(all_containers)
+    #initial classification to get red agents container list
+    state = monitor.get_network_state()
+    servers, users, routers = builder.classify_node_type(state)
+    all_containers = servers + users
+
+    #clean up any existing decoys or flags from previous runs
+    executor.cleanup_stale_decoys()
+    detector.cleanup_flags(all_containers)
+
+    red_agent = RedAgent(all_containers, decoys=executor._decoys)
+    signal.signal(signal.SIGINT, shutdown)
 
-red_agent = RedAgent(all_containers, decoys=executor._decoys)
 
 def shutdown(sig, frame):
     print("\nShutting down...")
+    monitor.close()
+    executor.drain()
     executor.cleanup_stale_decoys()
     detector.cleanup_flags(all_containers)
+    if decoy_pool is not None:
+        decoy_pool.stop()
     sys.exit(0)
-signal.signal(signal.SIGINT, shutdown)
 
 
-def _write_state(step, phase, red_action, red_host, result, compromises, servers, users):
+def _write_state(step, phase, red_action, red_host, result, compromises, servers, users, host_states, in_progress=None):
+    in_progress = in_progress or {}
     blue_tgt = result.get("target")
 
     # Build nodeStatuses: blocked > compromised > clean, then overlay transient actions
@@ -88,8 +117,13 @@ def _write_state(step, phase, red_action, red_host, result, compromises, servers
         elif result["action_type"] == "Analyse":
             node_statuses[blue_tgt] = "analysed"
 
+    # Restores still running in the background keep their transient visual
+    for name, op in in_progress.items():
+        if name in node_statuses and op["action_type"] == "Restore":
+            node_statuses[name] = "restored"
+
     # Flatten FSM host_states {"state": "K"} → "K"
-    fsm_states = {k: v["state"] for k, v in red_agent.host_states.items()}
+    fsm_states = {k: v["state"] for k, v in host_states.items()}
     fsm_counts = Counter(fsm_states.values())
 
     payload = {
@@ -100,6 +134,7 @@ def _write_state(step, phase, red_action, red_host, result, compromises, servers
         "fsmCounts":      {k: fsm_counts.get(k, 0) for k in ["K", "KD", "S", "SD", "U", "UD", "R", "RD", "F"]},
         "blockedRouters": list(executor._blocks.keys()),
         "activeDecoys":   list(executor._decoys.keys()),
+        "inProgress":     {k: v["action_type"] for k, v in in_progress.items()},
         "highlighted":    {k: True for k in [red_host, blue_tgt] if k},
         "events":         list(_write_state.events),
         "nComp":    sum(1 for s in node_statuses.values() if s == "compromised"),
@@ -119,18 +154,24 @@ def _write_state(step, phase, red_action, red_host, result, compromises, servers
 _write_state.events = []  # rolling event log, persists across steps
 
 
-def run(total_steps=MAX_STEPS):
+def run(total_steps=MAX_STEPS, pipelined=True, mask_unavailable=False):
     print(f"Network Defender - Starting @{total_steps} steps per episode\n")
     _write_state.events = []
 
     server.start(port=8080)
+    scheduler = StepScheduler(monitor, builder, adapter, executor, detector, red_agent, pipelined=pipelined,
+                              mask_unavailable=mask_unavailable)
 
     for step in range(total_steps):
         phase = min(step // (total_steps // 3), 2)
         print(f"Step {step+1}")
 
-        #Red agent attacks
-        red_action, red_host, red_success = red_agent.step()
+        #Red attacks, blue observes and acts
+        out = scheduler.step(step, phase, has_next=step + 1 < total_steps)
+        red_action, red_host, red_success = out["red_action"], out["red_host"], out["red_success"]
+        servers, users = out["servers"], out["users"]
+        compromises, action_int, result = out["compromises"], out["action"], out["result"]
+        all_containers = servers + users
         print(f"[RED] {red_action} on {red_host} - status: {red_success}")
 
         if red_action:
@@ -139,18 +180,9 @@ def run(total_steps=MAX_STEPS):
                 "type": red_action, "target": red_host or "—"
             })
 
-        #Blue agent observes
-        state = monitor.get_network_state()
-        servers, users, routers = builder.classify_node_type(state)
-        all_containers = servers + users
-
-        #Intrusion detector scans containers
-        compromises = detector.scan(all_containers)
-
-        #Blue agent acts
-        action_int = adapter.get_action(state, phase, red_agent.host_states, compromises, decoys=executor._decoys)
-        result = executor.execute(action_int, servers, users)
         print(f"[BLUE] action={action_int} {result['action_type']} on {result['target']} - {result['result']}")
+        for done in out["completed"]:
+            print(f"[BLUE] completed {done['action_type']} on {done['target']} - {done['result']}")
         print()
 
         _write_state.events.append({
@@ -160,12 +192,31 @@ def run(total_steps=MAX_STEPS):
         if len(_write_state.events) > 80:
             _write_state.events = _write_state.events[-80:]
 
-        _write_state(step, phase, red_action, red_host, result, compromises, servers, users)
+        with scheduler.stage("write", out["timings"]):
+            _write_state(step, phase, red_action, red_host, result, compromises, servers, users,
+                         out["host_states"], out["state"]["in_progress"])
 
+    scheduler.print_summary()
     print("Episode complete. Cleaning up...")
+    monitor.close()
+    executor.drain()
     executor.cleanup_stale_decoys()
     detector.cleanup_flags(all_containers)
+    if decoy_pool is not None:
+        decoy_pool.stop()
 
 
 if __name__ == "__main__":
-    run()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sequential", action="store_true", help="Run stages strictly in order (no overlap)")
+    parser.add_argument("--async", dest="async_mode", action="store_true", help="Run Restore/DeployDecoy in the background")
+    parser.add_argument("--decoy-pool", type=int, default=DECOY_POOL_SIZE, help="Pre-started decoys (0 = clab deploy per decoy)")
+    parser.add_argument("--quantized", action="store_true", help="Use the int8 quantized actor")
+    parser.add_argument("--mode", choices=MODES, default="sample", help="Action selection: sample, greedy (argmax) or temperature")
+    parser.add_argument("--temperature", type=float, default=1.0, help="Sampling temperature for --mode temperature")
+    parser.add_argument("--mask-unavailable", action="store_true",
+                        help="Mask actions the executor would reject (busy/missing hosts, re-Remove, second decoy)")
+    args = parser.parse_args()
+    setup(async_mode=args.async_mode, decoy_pool_size=args.decoy_pool, quantized=args.quantized,
+          mode=args.mode, temperature=args.temperature)
+    run(pipelined=not args.sequential, mask_unavailable=args.mask_unavailable)
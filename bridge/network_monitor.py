@@ -13,45 +13,132 @@
 
 import docker
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
 
+from container_inventory import get_inventory
+
 CLAB_PREFIX = "clab-cage4-defense-network-"
 
+# Per-step probing: containers are listed once, then every per-container probe
+# (ps, ss/netstat) is fanned out across a thread pool. A probe that does not
+# finish within probe_timeout seconds is reported as an error for that host
+# instead of stalling the whole step. The Docker client's own socket timeout
+# (PROBE_SOCKET_TIMEOUT) makes the exec give up too, so a hung probe frees its
+# worker rather than holding it for good; call close() to stop the pool.
+MAX_WORKERS = 16
+PROBE_TIMEOUT = 5.0
+PROBE_SOCKET_TIMEOUT = 2 * PROBE_TIMEOUT
+
+# Probe bundle: one exec per container per step instead of one per signal.
+# The script prints each signal under its own "### <section>" header so the
+# output can be split back into ps, ss/netstat and sentinel-file results.
+# Sentinel levels match IntrusionDetector: 2 = root, 1 = user, 0 = clean.
+SENTINEL_SCRIPT = (
+    "if [ -f /root/.compromised ]; then echo 2; "
+    "elif [ -f /tmp/.compromised ]; then echo 1; "
+    "else echo 0; fi"
+)
+PROBE_SCRIPT = (
+    "echo '### ps'; ps aux 2>/dev/null || ps; "
+    "echo '### ports'; ss -tuln 2>/dev/null || netstat -tuln 2>/dev/null; "
+    "echo '### sentinel'; " + SENTINEL_SCRIPT
+)
+
+
+def split_probe_output(output):
+    """Split PROBE_SCRIPT output into {section: text}."""
+    sections = {}
+    current = None
+    for line in output.split("\n"):
+        if line.startswith("### "):
+            current = line[4:].strip()
+            sections[current] = []
+        elif current is not None:
+            sections[current].append(line)
+    return {k: "\n".join(v) for k, v in sections.items()}
+
+
+def parse_sentinel(text):
+    """Sentinel section → compromise level (0 if missing or unreadable)."""
+    text = text.strip()
+    return int(text) if text in ("0", "1", "2") else 0
+
 
 class ContainerlabMonitor:
-    def __init__(self):
-        self.client = docker.from_env()
+    def __init__(self, max_workers=MAX_WORKERS, probe_timeout=PROBE_TIMEOUT, probe_bundle=True, inventory=None,
+                 socket_timeout=PROBE_SOCKET_TIMEOUT):
+        # docker-py keeps one HTTP connection per concurrent request, so the
+        # pool has to be at least as large as the number of probe workers.
+        # This client only runs probe execs, so its timeout bounds each of them
+        self.client = docker.from_env(max_pool_size=max(max_workers, 10), timeout=socket_timeout)
+        self.inventory = inventory or get_inventory()
+        self.max_workers = max_workers
+        self.probe_timeout = probe_timeout
+        self.probe_bundle = probe_bundle
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="probe")
 
-    def get_network_state(self):
-        """Collect complete network state from all containerlab containers."""
-        return {
+        # {"list": s, "probes": s, "total": s, "hosts": {name: {probe: s}}}
+        self.last_timings = {}
+
+    def close(self):
+        """Stop the probe pool (dropping queued probes) and close the Docker client."""
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self.client.close()
+
+    def get_network_state(self, prefetched=None):
+        """Collect complete network state from all containerlab containers.
+
+        prefetched: handle from prefetch(); its probes are reused instead of re-run.
+        """
+        t0 = time.perf_counter()
+        containers = self._get_clab_containers()
+        t_list = time.perf_counter() - t0
+
+        t1 = time.perf_counter()
+        results, host_timings = self._probe_all(containers, prefetched)
+        t_probes = time.perf_counter() - t1
+
+        self.last_timings = {
+            "list": t_list,
+            "probes": t_probes,
+            "total": time.perf_counter() - t0,
+            "hosts": host_timings,
+        }
+        state = {
             "timestamp": datetime.now().isoformat(),
-            "containers": self._get_containers(),
-            "processes": self._get_processes(),
-            "connections": self._get_connections(),
+            "containers": self._get_containers(containers),
+            "processes": results["processes"],
+            "connections": results["connections"],
         }
+        # only bundle mode reads the sentinel files; IntrusionDetector.scan
+        # falls back to its own exec for hosts missing from this map
+        if self.probe_bundle:
+            state["sentinels"] = results["sentinels"]
+        return state
 
     def _get_clab_containers(self):
         """Return only containerlab containers for our topology."""
-        return [
-            c for c in self.client.containers.list()
-            if c.name.startswith(CLAB_PREFIX)
-        ]
+        # rebind the cached attrs to this monitor's client (no API call) so
+        # probe execs use its connection pool
+        return [self.client.containers.prepare_model(c.attrs) for c in self.inventory.list()]
 
     def _short_name(self, container):
         """Strip the clab prefix to get the node name."""
         return container.name.removeprefix(CLAB_PREFIX)
 
-    def _get_containers(self):
+    def _get_containers(self, containers):
         """Get running containers with IPs."""
         result = []
-        for c in self._get_clab_containers():
+        for c in containers:
             result.append({
                 "name": self._short_name(c),
                 "full_name": c.name,
                 "ip": self._get_container_ip(c),
                 "status": c.status,
-                "image": c.image.tags[0] if c.image.tags else "unknown",
+                # from the cached attrs; c.image would cost an images.get() per host
+                "image": c.attrs["Config"].get("Image") or "unknown",
             })
         return result
 
@@ -63,22 +150,89 @@ class ContainerlabMonitor:
                 return network_info["IPAddress"]
         return None
 
-    def _get_processes(self):
-        """Get processes running in each container."""
-        result = {}
-        for c in self._get_clab_containers():
+    def prefetch(self, exclude=()):
+        """Start probing every host not in exclude (clean names) in the background.
+
+        Used to overlap the next observation with the current step's actions;
+        pass the returned handle to get_network_state(prefetched=...).
+        """
+        containers = [c for c in self._get_clab_containers() if self._short_name(c) not in exclude]
+        return self._submit_probes(containers)
+
+    def _probes(self):
+        if self.probe_bundle:
+            return {"bundle": self._get_bundle}
+        return {"processes": self._get_processes, "connections": self._get_connections}
+
+    def _submit_probes(self, containers, futures=None):
+        futures = dict(futures or {})
+        for c in containers:
             name = self._short_name(c)
+            for probe_name, probe in self._probes().items():
+                if (name, probe_name) not in futures:
+                    futures[(name, probe_name)] = self._pool.submit(self._timed, probe, c)
+        return futures
+
+    def _probe_all(self, containers, prefetched=None):
+        """Run every per-container probe concurrently and collect the results.
+
+        Each probe returns {kind: value}; results are regrouped as {kind: {host: value}}.
+        """
+        names = {self._short_name(c) for c in containers}
+        # drop prefetched probes for hosts that have since gone away
+        prefetched = {k: f for k, f in (prefetched or {}).items() if k[0] in names}
+        futures = self._submit_probes(containers, prefetched)
+
+        # probes were submitted together (or earlier, when prefetched), so a
+        # single deadline bounds each of them by probe_timeout
+        wait(futures.values(), timeout=self.probe_timeout)
+
+        results = {"processes": {}, "connections": {}, "sentinels": {}}
+        timings = {}
+        for (name, probe_name), future in futures.items():
+            if future.done():
+                values, elapsed = future.result()
+            else:
+                # only the kinds this probe reports; sentinels stay missing so
+                # IntrusionDetector.scan falls back to its own exec
+                error = {"error": f"timed out after {self.probe_timeout}s"}
+                kinds = ("processes", "connections") if probe_name == "bundle" else (probe_name,)
+                values, elapsed = {kind: error for kind in kinds}, self.probe_timeout
+            for kind, value in values.items():
+                results[kind][name] = value
+            timings.setdefault(name, {})[probe_name] = elapsed
+        return results, timings
+
+    def _timed(self, probe, container):
+        start = time.perf_counter()
+        value = probe(container)
+        return value, time.perf_counter() - start
+
+    def _get_bundle(self, container):
+        """Processes, open ports and sentinel level from a single exec."""
+        try:
+            out = container.exec_run(["sh", "-c", PROBE_SCRIPT]).output.decode(errors="replace")
+        except Exception as e:
+            return {"processes": {"error": str(e)}, "connections": {"error": str(e)}}
+        sections = split_probe_output(out)
+        return {
+            "processes": self._parse_ps_output(sections.get("ps", "")),
+            "connections": self._parse_netstat(sections.get("ports", "")),
+            "sentinels": parse_sentinel(sections.get("sentinel", "")),
+        }
+
+    def _get_processes(self, container):
+        """Get processes running in a container."""
+        try:
+            ps_output = container.exec_run("ps aux").output.decode()
+            return {"processes": self._parse_ps_output(ps_output)}
+        except Exception as e:
+            # Some containers may not have ps
             try:
-                ps_output = c.exec_run("ps aux").output.decode()
-                result[name] = self._parse_ps_output(ps_output)
-            except Exception as e:
-                # Some containers may not have ps
-                try:
-                    ps_output = c.exec_run("ps").output.decode()
-                    result[name] = self._parse_ps_output(ps_output)
-                except Exception:
-                    result[name] = {"error": str(e)}
-        return result
+                ps_output = container.exec_run("ps").output.decode()
+                return {"processes": self._parse_ps_output(ps_output)}
+            except Exception:
+                return {"processes": {"error": str(e)}}
 
     def _parse_ps_output(self, output):
         """Parse ps aux output into structured data."""
@@ -108,20 +262,16 @@ class ContainerlabMonitor:
             })
         return processes
 
-    def _get_connections(self):
-        """Get open ports from each container."""
-        result = {}
-        for c in self._get_clab_containers():
-            name = self._short_name(c)
-            try:
-                # Try ss first, then netstat
-                out = c.exec_run(
-                    "sh -c 'ss -tuln 2>/dev/null || netstat -tuln 2>/dev/null'"
-                )
-                result[name] = self._parse_netstat(out.output.decode())
-            except Exception as e:
-                result[name] = {"error": str(e)}
-        return result
+    def _get_connections(self, container):
+        """Get open ports from a container."""
+        try:
+            # Try ss first, then netstat
+            out = container.exec_run(
+                "sh -c 'ss -tuln 2>/dev/null || netstat -tuln 2>/dev/null'"
+            )
+            return {"connections": self._parse_netstat(out.output.decode())}
+        except Exception as e:
+            return {"connections": {"error": str(e)}}
 
     def _parse_netstat(self, output):
         """Parse ss/netstat output to get open ports."""
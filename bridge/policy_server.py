@@ -0,0 +1,317 @@
+# Long-running policy server: keeps every gnn_ppo-*.pt actor loaded and warm behind a Unix
+# socket, so bridge runs, evaluations and tests skip the torch_geometric import and weight
+# load. Requests arriving together are answered with one batched forward pass
+# (trained-agent/models/batched.py). AgentAdapter uses the server automatically when its
+# socket exists (PolicyClient below), and loads the weights itself otherwise.
+#
+# Wire format: 4-byte big-endian length + an .npz payload (no pickle) each way.
+#
+# The socket lives in a directory only its owner can write (/run/cage4-policy as root,
+# $XDG_RUNTIME_DIR otherwise), and clients refuse a socket that isn't owned by them
+# or root — the bridge runs under sudo, so whoever serves the socket picks its actions.
+# ping reports each checkpoint's mtime as loaded; AgentAdapter ignores a server whose
+# weights are older than the file on disk.
+#
+# Terminal 1 (deploy topology):
+#   cd ~/Desktop/Network_Defender_FYP/containerlab-networks
+#   sudo containerlab deploy -t cage4-topology.yaml
+#
+# Terminal 2 (server — leave running):
+#   cd ~/Desktop/Network_Defender_FYP/bridge
+#   sudo ~/fyp-venv-linux/bin/python policy_server.py
+#
+# Terminal 3 (run as usual — main.py / evaluation.py pick the server up):
+#   sudo ~/fyp-venv-linux/bin/python evaluation.py
+#
+# Cleanup (when done):
+#   Ctrl+C in Terminal 2 (removes the socket)
+#   sudo containerlab destroy -t cage4-topology.yaml
+
+import argparse
+import glob
+import io
+import os
+import signal
+import socket
+import socketserver
+import stat
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from queue import Queue, Empty
+
+import numpy as np
+
+AGENT_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "trained-agent")
+)
+WEIGHTS_DIR = os.path.join(AGENT_DIR, "weights")
+
+
+def default_socket_path():
+    if os.geteuid() == 0:
+        return "/run/cage4-policy/policy.sock"
+    runtime = os.environ.get("XDG_RUNTIME_DIR") or f"/tmp/cage4-policy-{os.geteuid()}"
+    return os.path.join(runtime, "cage4-policy.sock")
+
+
+SOCKET_PATH = os.environ.get("CAGE4_POLICY_SOCKET") or default_socket_path()
+
+BATCH_WINDOW = 0.002   # seconds to wait for more requests after the first
+MAX_BATCH = 32
+STATE_KEYS = ["x", "ei", "global_vec", "servers", "n_servers", "users", "n_users", "action_edges"]
+
+
+def encode(**arrays):
+    buf = io.BytesIO()
+    np.savez(buf, **arrays)
+    return buf.getvalue()
+
+
+def decode(payload):
+    with np.load(io.BytesIO(payload), allow_pickle=False) as data:
+        return {k: data[k] for k in data.files}
+
+
+def send_msg(sock, payload):
+    sock.sendall(struct.pack(">I", len(payload)) + payload)
+
+
+def recv_msg(sock):
+    header = _recv_exact(sock, 4)
+    if header is None:
+        return None
+    return _recv_exact(sock, struct.unpack(">I", header)[0])
+
+
+def check_owner(path):
+    """Raise PermissionError unless path (and its directory) belong to us or root and
+    nobody else can write the directory — otherwise another user could swap the socket."""
+    trusted = {os.geteuid(), 0}
+    st = os.lstat(path)
+    if not stat.S_ISSOCK(st.st_mode) or st.st_uid not in trusted:
+        raise PermissionError(f"{path} is not a socket owned by this user or root")
+    parent = os.stat(os.path.dirname(os.path.abspath(path)))
+    if parent.st_uid not in trusted or parent.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError(f"{os.path.dirname(path)} is writable by other users")
+
+
+def _recv_exact(sock, n):
+    chunks = []
+    while n:
+        chunk = sock.recv(min(n, 1 << 20))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        n -= len(chunk)
+    return b"".join(chunks)
+
+
+class PolicyServer:
+    def __init__(self, weights_dir=WEIGHTS_DIR, socket_path=SOCKET_PATH,
+                 window=BATCH_WINDOW, max_batch=MAX_BATCH):
+        self.weights_dir = weights_dir
+        self.socket_path = socket_path
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = Queue()
+        self._server = None
+        self.batches = 0
+        self.requests = 0
+
+    def load(self):
+        sys.path.insert(0, AGENT_DIR)
+        import torch
+        from models.cage4 import load
+        from models.batched import BatchedActors
+        from models.inference import example_state
+
+        start = time.perf_counter()
+        paths = sorted(glob.glob(os.path.join(self.weights_dir, "gnn_ppo-*.pt")))
+        # mtime read before loading, so a file replaced mid-load reads as stale
+        self.mtimes = {os.path.splitext(os.path.basename(p))[0]: os.path.getmtime(p) for p in paths}
+        agents = {name: load(p) for name, p in zip(self.mtimes, paths)}
+        for agent in agents.values():
+            agent.eval()
+        self.policy = BatchedActors(agents)
+
+        # warm up: first calls pay for allocator and kernel setup
+        in_dim = next(iter(agents.values())).args[0]
+        state = example_state(in_dim) + (False,)
+        for _ in range(3):
+            self.policy.probs({name: state for name in agents})
+        print(f"[PolicyServer] {len(agents)} agents loaded and warm in {time.perf_counter() - start:.1f}s")
+        self._torch = torch
+        return self
+
+    def submit(self, agent, state):
+        future = Future()
+        self._queue.put((agent, state, future))
+        return future
+
+    def _batch_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.window
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get(timeout=max(deadline - time.perf_counter(), 0)))
+                except Empty:
+                    break
+
+            unknown = [b for b in batch if b[0] not in self.policy.idx]
+            for agent, _, future in unknown:
+                future.set_exception(KeyError(f"unknown agent {agent}"))
+            batch = [b for b in batch if b[0] in self.policy.idx]
+            if not batch:
+                continue
+
+            names, states, futures = zip(*batch)
+            try:
+                probs = self.policy.probs_list(list(names), list(states))
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            for future, p in zip(futures, probs):
+                future.set_result(p)
+            self.batches += 1
+            self.requests += len(batch)
+
+    def _handle(self, request):
+        torch = self._torch
+        op = str(request["op"])
+        if op == "ping":
+            return {"agents": np.array(list(self.policy.names)),
+                    "mtimes": np.array([self.mtimes[n] for n in self.policy.names]),
+                    "weights_dir": np.array(os.path.abspath(self.weights_dir))}
+        if op != "probs":
+            return {"error": np.array(f"unknown op {op}")}
+
+        state = tuple(torch.from_numpy(request[k]) for k in STATE_KEYS) + (bool(request["multi"]),)
+        try:
+            probs = self.submit(str(request["agent"]), state).result()
+        except Exception as e:
+            return {"error": np.array(str(e))}
+        return {"probs": probs.numpy()}
+
+    def serve_forever(self):
+        directory = os.path.dirname(os.path.abspath(self.socket_path))
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        if os.path.exists(self.socket_path):
+            if PolicyClient(self.socket_path).available():
+                raise RuntimeError(f"a policy server is already listening on {self.socket_path}")
+            os.unlink(self.socket_path)
+
+        server = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                # one connection carries any number of requests
+                while (payload := recv_msg(self.request)) is not None:
+                    send_msg(self.request, encode(**server._handle(decode(payload))))
+
+        # created 0600 (no window where others could connect)
+        old_umask = os.umask(0o177)
+        try:
+            self._server = socketserver.ThreadingUnixStreamServer(self.socket_path, Handler)
+        finally:
+            os.umask(old_umask)
+        self._server.daemon_threads = True
+        check_owner(self.socket_path)
+        threading.Thread(target=self._batch_loop, name="policy-batch", daemon=True).start()
+        print(f"[PolicyServer] listening on {self.socket_path}")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def shutdown(self):
+        if self._server is not None:
+            self._server.shutdown()
+
+
+class PolicyClient:
+    """Thin client for PolicyServer. Thread-safe; keeps one connection open."""
+
+    def __init__(self, socket_path=SOCKET_PATH, timeout=10.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._sock = None
+        self._lock = threading.Lock()
+
+    def _request(self, **arrays):
+        with self._lock:
+            if self._sock is None:
+                check_owner(self.socket_path)
+                self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self._sock.settimeout(self.timeout)
+                self._sock.connect(self.socket_path)
+            try:
+                send_msg(self._sock, encode(**arrays))
+                payload = recv_msg(self._sock)
+            except OSError:
+                self.close()
+                raise
+            if payload is None:
+                self.close()
+                raise ConnectionError("policy server closed the connection")
+        response = decode(payload)
+        if "error" in response:
+            raise RuntimeError(f"policy server: {response['error']}")
+        return response
+
+    def available(self):
+        if not os.path.exists(self.socket_path):
+            return False
+        try:
+            self.info()
+            return True
+        except PermissionError as e:
+            print(f"[PolicyClient] not using {self.socket_path}: {e}")
+            return False
+        except (OSError, RuntimeError):
+            return False
+
+    def info(self):
+        """{"agents": [names served], "mtimes": {name: checkpoint mtime as loaded},
+        "weights_dir": directory they were loaded from}"""
+        response = self._request(op=np.array("ping"))
+        agents = [str(a) for a in response["agents"]]
+        # servers from before the mtime field report none, so they always look stale
+        mtimes = response["mtimes"].tolist() if "mtimes" in response else [None] * len(agents)
+        return {"agents": agents, "mtimes": dict(zip(agents, mtimes)),
+                "weights_dir": str(response["weights_dir"])}
+
+    def probs(self, agent, state):
+        """Action probabilities for one state tuple (as passed to actor.probs)."""
+        import torch
+        arrays = {k: t.numpy() for k, t in zip(STATE_KEYS, state[:8])}
+        multi = bool(state[8]) if len(state) > 8 else False
+        response = self._request(op=np.array("probs"), agent=np.array(agent), multi=np.array(multi), **arrays)
+        return torch.from_numpy(response["probs"])
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--socket", default=SOCKET_PATH, help="Unix socket path")
+    parser.add_argument("--weights-dir", default=WEIGHTS_DIR)
+    parser.add_argument("--window", type=float, default=BATCH_WINDOW * 1000, help="Batching window (ms)")
+    args = parser.parse_args()
+
+    server = PolicyServer(args.weights_dir, args.socket, window=args.window / 1000).load()
+    # SIGTERM (kill, systemd) unwinds like Ctrl+C so the socket is removed
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        print(f"\n[PolicyServer] stopped after {server.requests} requests in {server.batches} batches")
@@ -15,6 +15,7 @@
 import docker
 import random
 from action_executor import SUBNET_RESTORE_VIA
+from container_inventory import get_inventory
 
 CLAB_PREFIX = "clab-cage4-defense-network-"
 
@@ -32,10 +33,13 @@ ACTION_NAMES = [
 
 
 class RedAgent:
-    def __init__(self, containers, decoys = None):
+    def __init__(self, containers, decoys = None, inventory=None, seed=None):
         self.client = docker.from_env()
-        self.decoys = decoys or {}
+        self.inventory = inventory or get_inventory()
+        # keep the executor's dict itself (even while empty) so new decoys are seen
+        self.decoys = decoys if decoys is not None else {}
         self.host_ips = {c["clean_name"]: c.get("ip") for c in containers}
+        self.rng = random.Random(seed)
 
         self.host_states = {}
         for c in containers:
@@ -97,9 +101,9 @@ class RedAgent:
         servers = [h for h in active if "server" in h]
         users = [h for h in active if "server" not in h]
         if servers and users:
-            chosen_host = random.choice(servers) if random.random() <= 0.75 else random.choice(users)
+            chosen_host = self.rng.choice(servers) if self.rng.random() <= 0.75 else self.rng.choice(users)
         else:
-            chosen_host = random.choice(active)
+            chosen_host = self.rng.choice(active)
 
         state = self.host_states[chosen_host]["state"]
         probs  =self.state_transitions_probability.get(state)
@@ -114,7 +118,7 @@ class RedAgent:
         indices, weights = zip(*options)
         total = sum(weights)
         weights = [w / total for w in weights]
-        action_idx = random.choices(indices, weights=weights, k=1)[0]
+        action_idx = self.rng.choices(indices, weights=weights, k=1)[0]
         return chosen_host,action_idx
     
     
@@ -122,7 +126,7 @@ class RedAgent:
 
         full_name = CLAB_PREFIX + host
         try:
-            container = self.client.containers.get(full_name)
+            container = self.inventory.get(full_name)
         except Exception as e:
             print(f"Error getting container {full_name}: {e}")
             return False
@@ -132,19 +136,19 @@ class RedAgent:
         
         
         if action_idx == 0: #DiscoverRemoteSystems
-            target_ip = random.choice(list(SUBNET_RESTORE_VIA.values()))
+            target_ip = self.rng.choice(list(SUBNET_RESTORE_VIA.values()))
             result = container.exec_run(f"ping -c 1 {target_ip}")
             return result.exit_code == 0
         
         elif action_idx == 1: #AggressiveServiceDiscovery
-            target_ip = random.choice([ip for ip in self.host_ips.values() if ip])
+            target_ip = self.rng.choice([ip for ip in self.host_ips.values() if ip])
             container.exec_run(f"nc -zv {target_ip} 22 80 443 3306 8080")
             return True
 
 
 
         elif action_idx == 2: #StealthServiceDiscovery
-            target_ip = random.choice([ip for ip in self.host_ips.values() if ip])
+            target_ip = self.rng.choice([ip for ip in self.host_ips.values() if ip])
             container.exec_run(f"nc -zv {target_ip} 22 80")
             return True
 
@@ -200,14 +204,27 @@ class RedAgent:
             self.host_states[host]['state'] = next_state
             print(f"[RED] {host} state: {curr_state} > {next_state}")
 
-    def step(self):
-        host, action_idx = self._choose_host_and_action()
+    def reset(self, seed=None):
+        # Back to the start of an episode: every host Known, RNG reseeded
+        for state in self.host_states.values():
+            state["state"] = 'K'
+        self.rng.seed(seed)
+
+    def plan(self):
+        # Choose the next (host, action_idx) without touching any container.
+        # Split from commit() so a scheduler can look at the target first.
+        return self._choose_host_and_action()
+
+    def commit(self, host, action_idx):
         if host is None:
             return None, None, None
-        
+
         action_name = ACTION_NAMES[action_idx]
         success = self._execute_action(host, action_idx)
         self._transition_state(host, action_idx, success)
 
         return action_name, host, success
+
+    def step(self):
+        return self.commit(*self.plan())
     
\ No newline at end of file
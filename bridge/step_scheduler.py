@@ -0,0 +1,175 @@
+# Pipelined observe-act step scheduler shared by main.py and evaluation.py.
+#
+# Stages of one step t (sequential order, which decides semantics):
+#   red      — red agent's attack for step t
+#   observe  — monitor collects network state (containers, probe bundle)
+#   scan     — intrusion detector turns sentinels into compromise levels
+#   decide   — GNN forward pass picks the blue action
+#   act      — executor runs the blue action
+#
+# Pipelining: once the blue action is decided, the red agent's attack for step t+1
+# is planned (host + action, no Docker I/O) and — when it cannot interact with the
+# blue action — committed concurrently with act(t). While both run, observation
+# probes for every other host are prefetched for step t+1. Hosts touched by either
+# action are re-probed after they finish, so every step observes exactly what the
+# sequential loop would.
+#
+# With mask_unavailable, actions the executor would reject outright (busy or
+# missing hosts, Remove on a blocked host, a second decoy) are masked out of the
+# decision, so the agent's next-best action is taken from the same forward pass.
+#
+# With an async ActionExecutor, Restore/DeployDecoy return "in progress" at once;
+# each step polls the executor, reports finished operations in the record
+# ("completed") and marks still-running hosts in state["in_progress"].
+#
+# Not run standalone — constructed by main.py / evaluation.py.
+
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+STAGES = ["red", "observe", "scan", "decide", "act", "write"]
+
+# Red actions whose outcome depends on routing — never overlapped with a
+# subnet firewall (Allow/BlockTrafficZone) action
+RED_NETWORK_ACTIONS = {0, 1, 2}
+
+
+class StepScheduler:
+    def __init__(self, monitor, builder, adapter, executor, detector, red_agent, pipelined=True,
+                 mask_unavailable=False):
+        self.monitor = monitor
+        self.builder = builder
+        self.adapter = adapter
+        self.executor = executor
+        self.detector = detector
+        self.red_agent = red_agent
+        self.pipelined = pipelined
+        self.mask_unavailable = mask_unavailable
+
+        self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="stage")
+        self._next_red = None      # red result for the coming step, if already committed
+        self._prefetched = None    # monitor.prefetch() handle for the coming step
+        self.history = []          # per-step {stage: seconds, "wall": seconds}
+
+    @contextmanager
+    def stage(self, name, timings):
+        """Time a block as stage `name` of the step whose timings these are.
+
+        A stage run after step() returned (main.py's "write") is added to that
+        step's wall time as well, so wall always covers every stage.
+        """
+        start = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - start
+        timings[name] = timings.get(name, 0.0) + elapsed
+        if "wall" in timings:
+            timings["wall"] += elapsed
+
+    def step(self, step, phase, has_next=True):
+        """Run step `step`. Returns the step record; has_next=False on the final step."""
+        timings = {}
+        wall = time.perf_counter()
+
+        # red(t) — already committed alongside act(t-1) when pipelined
+        if self._next_red is not None:
+            red_action, red_host, red_success = self._next_red
+            self._next_red = None
+        else:
+            with self.stage("red", timings):
+                red_action, red_host, red_success = self.red_agent.step()
+
+        with self.stage("observe", timings):
+            completed = self.executor.poll()
+            state = self.monitor.get_network_state(prefetched=self._prefetched)
+            self._prefetched = None
+            state["in_progress"] = self.executor.in_progress()
+            servers, users, routers = self.builder.classify_node_type(state)
+
+        with self.stage("scan", timings):
+            compromises = self.detector.scan(servers + users, sentinels=state.get("sentinels"))
+
+        with self.stage("decide", timings):
+            exclude = self.executor.unavailable_actions(servers, users) if self.mask_unavailable else ()
+            decision = self.adapter.decide(
+                state, phase, self.red_agent.host_states, compromises, decoys=self.executor._decoys,
+                exclude=exclude
+            )
+            action = decision["action"]
+
+        # FSM as the sequential loop would see it after act(t), before red(t+1)
+        host_states = {k: dict(v) for k, v in self.red_agent.host_states.items()}
+
+        if self.pipelined and has_next:
+            result = self._act_pipelined(action, servers, users, timings)
+        else:
+            with self.stage("act", timings):
+                result = self.executor.execute(action, servers, users)
+
+        timings["wall"] = time.perf_counter() - wall
+        self.history.append(timings)
+        return {
+            "step": step,
+            "phase": phase,
+            "red_action": red_action,
+            "red_host": red_host,
+            "red_success": red_success,
+            "state": state,
+            "servers": servers,
+            "users": users,
+            "compromises": compromises,
+            "action": action,
+            "decision": decision,
+            "result": result,
+            "completed": completed,
+            "host_states": host_states,
+            "timings": timings,
+        }
+
+    def _act_pipelined(self, action, servers, users, timings):
+        blue_target = self.executor.resolve_target(action, servers, users)
+        red_host, red_idx = self.red_agent.plan()
+
+        # observation for t+1 can start now for every host neither action touches
+        self._prefetched = self.monitor.prefetch(exclude={blue_target, red_host})
+
+        act = self._pool.submit(self._timed, self.executor.execute, action, servers, users)
+        if self._independent(action, blue_target, red_host, red_idx):
+            red = self._pool.submit(self._timed, self.red_agent.commit, red_host, red_idx)
+            result, timings["act"] = act.result()
+            self._next_red, timings["red_next"] = red.result()
+        else:
+            result, timings["act"] = act.result()
+            self._next_red, timings["red_next"] = self._timed(self.red_agent.commit, red_host, red_idx)
+        return result
+
+    def _independent(self, action, blue_target, red_host, red_idx):
+        if red_host is None or blue_target is None:
+            return True
+        if red_host == blue_target:
+            return False
+        if 64 <= action <= 79 and red_idx in RED_NETWORK_ACTIONS:
+            return False
+        return True
+
+    def _timed(self, fn, *args):
+        start = time.perf_counter()
+        out = fn(*args)
+        return out, time.perf_counter() - start
+
+    def summary(self):
+        """Mean seconds per stage across all steps run so far."""
+        totals = defaultdict(float)
+        for timings in self.history:
+            for name, seconds in timings.items():
+                totals[name] += seconds
+        n = max(len(self.history), 1)
+        return {name: seconds / n for name, seconds in totals.items()}
+
+    def print_summary(self):
+        summary = self.summary()
+        print(f"Stage timings (mean over {len(self.history)} steps, pipelined={self.pipelined}):")
+        for name in STAGES + ["red_next", "wall"]:
+            if name in summary:
+                print(f"  {name:<9} {summary[name] * 1000:8.1f} ms")
@@ -13,7 +13,7 @@ import shutil
 import pytest
 from network_monitor import ContainerlabMonitor
 from agent_adapter import AgentAdapter
-from action_executor import ActionExecutor
+from action_executor import ActionExecutor, ACTION_TICKS
 from graph_builder import ObservationGraphBuilder, CONTAINER_ROLES
 
 
@@ -67,4 +67,49 @@ def test_deploy_decoy():
     servers, users, _ = builder.classify_node_type(state)
     result = executor.execute(48, servers, users)  # action 48 = DeployDecoy host_idx 0
     assert result["action_type"] == "DeployDecoy"
-    executor.cleanup_decoys()
\ No newline at end of file
+    executor.cleanup_decoys()
+
+def test_async_restore_reports_in_progress():
+    monitor = ContainerlabMonitor()
+    builder = ObservationGraphBuilder()
+    executor = ActionExecutor(async_mode=True)
+    state = monitor.get_network_state()
+    servers, users, _ = builder.classify_node_type(state)
+    result = executor.execute(32, servers, users)  # action 32 = Restore host_idx 0
+    assert result["result"] == "in progress"
+    target = result["target"]
+    assert executor.in_progress()[target]["action_type"] == "Restore"
+    busy = executor.execute(0, servers, users)     # Analyse on the same host while restoring
+    assert busy["result"].startswith("busy")
+    done = executor.drain()
+    assert done[0]["result"] == "restarted"
+    assert executor.in_progress() == {}
+
+
+def test_async_restore_holds_host_for_its_ticks():
+    monitor = ContainerlabMonitor()
+    builder = ObservationGraphBuilder()
+    executor = ActionExecutor(async_mode=True)
+    state = monitor.get_network_state()
+    servers, users, _ = builder.classify_node_type(state)
+    target = executor.execute(32, servers, users)["target"]  # action 32 = Restore host_idx 0
+    executor._pending[target]["future"].result()             # Docker side done
+    for _ in range(ACTION_TICKS["Restore"] - 1):
+        assert executor.poll() == []
+        assert target in executor.in_progress()
+    assert executor.poll()[0]["result"] == "restarted"
+    assert executor.in_progress() == {}
+
+
+def test_reset_undoes_block_and_route():
+    monitor = ContainerlabMonitor()
+    builder = ObservationGraphBuilder()
+    executor = ActionExecutor()
+    state = monitor.get_network_state()
+    servers, users, _ = builder.classify_node_type(state)
+    target = executor.execute(16, servers, users)["target"]  # action 16 = Remove host_idx 0
+    executor.execute(72, servers, users)                     # action 72 = BlockTraffic first subnet
+    summary = executor.reset(servers + users)
+    assert summary["errors"] == {}
+    assert target not in executor._blocked_hosts
+    assert executor._blocks == {}
@@ -38,4 +38,150 @@ def test_node_action_decodes_correctly():
     action = adapter.get_action(state)
     if action < 64:
         assert 0 <= action // 16 <= 3
-        assert 0 <= action % 16 <= 15
\ No newline at end of file
+        assert 0 <= action % 16 <= 15
+
+def _synthetic_steps(n, seed=0):
+    # network states over the known topology with random host dropouts
+    import random
+    from graph_builder import CONTAINER_ROLES, SUBNETS
+
+    names = list(CONTAINER_ROLES) + [f"{s}-router" for s in SUBNETS]
+    rng = random.Random(seed)
+    for step in range(n):
+        present = [n for n in names if n.endswith("-router") or rng.random() > 0.1]
+        state = {"containers": [{"name": f"clab-cage4-defense-network-{n}"} for n in present]}
+        compromises = {n: rng.choice([0, 0, 1, 2]) for n in present}
+        host_states = {n: {"state": rng.choice(["K", "S", "U", "R"])} for n in present}
+        yield step, state, step % 3, host_states, compromises
+
+
+def test_compiled_actor_matches_eager():
+    # no containers needed — synthetic network states over the known topology
+    if not os.path.exists(WEIGHTS_PATH):
+        pytest.skip("weights file not in repo")
+    import torch
+
+    compiled = AgentAdapter(compiled=True, server=None)
+    eager = AgentAdapter(compiled=False, server=None)
+    assert isinstance(compiled.actor, torch.jit.ScriptModule)
+
+    for step, state, phase, host_states, compromises in _synthetic_steps(20):
+        probs = []
+        for adapter in (compiled, eager):
+            torch.manual_seed(step)
+            action = adapter.get_action(state, phase, host_states, compromises)
+            probs.append((action, adapter.last_probs))
+        assert probs[0][0] == probs[1][0]
+        assert torch.equal(probs[0][1], probs[1][1])
+
+
+def test_quantized_actor_tracks_fp32():
+    # int8 actor stays close to the fp32 distribution on recorded observations
+    if not os.path.exists(WEIGHTS_PATH):
+        pytest.skip("weights file not in repo")
+    import torch
+
+    fp32 = AgentAdapter(server=None)
+    int8 = AgentAdapter(quantized=True)
+    assert isinstance(int8.actor, torch.jit.ScriptModule)
+
+    fp32.recorded = []
+    for _, state, phase, host_states, compromises in _synthetic_steps(20, seed=1):
+        fp32.get_action(state, phase, host_states, compromises)
+
+    agree = 0
+    for s in fp32.recorded:
+        p, q = fp32.probs(s[:8]), int8.probs(s[:8])
+        kl = (p * (p.clamp_min(1e-12).log() - q.clamp_min(1e-12).log())).sum()
+        assert kl < 0.05
+        agree += p.argmax().item() == q.argmax().item()
+    assert agree >= 0.9 * len(fp32.recorded)
+
+
+def test_policy_server_matches_local(tmp_path):
+    # concurrent adapters share one server; answers match the local actor
+    if not os.path.exists(WEIGHTS_PATH):
+        pytest.skip("weights file not in repo")
+    import threading
+    import time
+    import torch
+    from policy_server import PolicyServer
+
+    sock = str(tmp_path / "policy.sock")
+    server = PolicyServer(socket_path=sock, window=0.02).load()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    while not os.path.exists(sock):
+        time.sleep(0.01)
+
+    try:
+        local = AgentAdapter(server=None)
+        local.recorded = []
+        for _, state, phase, host_states, compromises in _synthetic_steps(8, seed=2):
+            local.get_action(state, phase, host_states, compromises)
+
+        remote = [AgentAdapter(server=sock) for _ in range(4)]
+        assert all(r.client is not None for r in remote)
+
+        results = {}
+        def ask(i):
+            results[i] = [remote[i].probs(s[:8]) for s in local.recorded]
+        threads = [threading.Thread(target=ask, args=(i,)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        for i in range(4):
+            for s, p in zip(local.recorded, results[i]):
+                assert torch.allclose(p, local.probs(s[:8]), atol=1e-6)
+        assert server.batches < server.requests
+
+        # a checkpoint replaced after the server loaded it: the adapter loads locally
+        st = os.stat(WEIGHTS_PATH)
+        os.utime(WEIGHTS_PATH, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        try:
+            assert AgentAdapter(server=sock).client is None
+        finally:
+            os.utime(WEIGHTS_PATH, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+        # a socket others could have swapped is refused
+        os.chmod(tmp_path, 0o777)
+        try:
+            assert AgentAdapter(server=sock).client is None
+        finally:
+            os.chmod(tmp_path, 0o700)
+    finally:
+        server.shutdown()
+        thread.join()
+
+
+def test_decide_modes_and_masks():
+    # one forward pass per decision; masks, top-k and fallback reuse it
+    if not os.path.exists(WEIGHTS_PATH):
+        pytest.skip("weights file not in repo")
+    import torch
+
+    adapter = AgentAdapter(server=None, value=True)
+    calls = []
+    probs = adapter.probs
+    adapter.probs = lambda state: calls.append(1) or probs(state)
+
+    for step, state, phase, host_states, compromises in _synthetic_steps(10, seed=3):
+        greedy = adapter.decide(state, phase, host_states, compromises, mode="greedy", exclude=[0, 16, 80])
+        assert greedy["action"] == greedy["probs"].argmax().item()
+        assert greedy["probs"][0, [0, 16, 80]].sum() == 0
+        assert torch.allclose(greedy["probs"].sum(), torch.tensor(1.0))
+        assert isinstance(greedy["value"], float)
+
+        top = greedy["top_k"]
+        assert top[0][0] == greedy["action"] and len(top) == 5
+        assert all(a[1] >= b[1] for a, b in zip(top, top[1:]))
+
+        # fall back past the top pick without another forward pass
+        assert adapter.select(greedy, [greedy["action"]]) == top[1][0]
+
+        torch.manual_seed(step)
+        cold = adapter.decide(state, phase, host_states, compromises, mode="temperature", temperature=1e-3)
+        assert cold["action"] == cold["probs"].argmax().item()
+    assert len(calls) == 20
@@ -0,0 +1,115 @@
+# Unit tests for ContainerInventory — initial snapshot and event-driven updates on Remove/Restore.
+#
+# Terminal 1 (deploy topology):
+#   cd ~/Desktop/Network_Defender_FYP/containerlab-networks
+#   sudo containerlab deploy -t cage4-topology.yaml
+#
+# Terminal 2 (run):
+#   cd ~/Desktop/Network_Defender_FYP/bridge
+#   sudo ~/fyp-venv-linux/bin/python -m pytest tests/test_container_inventory.py -v
+
+import time
+import docker
+from container_inventory import ContainerInventory, CLAB_PREFIX
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def test_snapshot_matches_docker():
+    client = docker.from_env()
+    inventory = ContainerInventory().start()
+    expected = {c.name for c in client.containers.list() if c.name.startswith(CLAB_PREFIX)}
+    assert {c.name for c in inventory.list()} == expected
+    inventory.stop()
+
+
+def test_disconnect_seen_without_polling():
+    client = docker.from_env()
+    inventory = ContainerInventory().start()
+    target = next(c for c in inventory.list() if "router" not in c.name)
+    network = inventory.mgmt_network()
+    assert network is not None
+
+    def networks():
+        return inventory.get(target.name).attrs["NetworkSettings"]["Networks"]
+
+    client.networks.get(network).disconnect(target.name)
+    try:
+        assert _wait_for(lambda: network not in networks())
+    finally:
+        client.networks.get(network).connect(target.name)
+    assert _wait_for(lambda: network in networks())
+    inventory.stop()
+
+
+class _FakeContainer:
+    def __init__(self, name):
+        self.name, self.id, self.status = name, name, "running"
+        self.attrs = {"NetworkSettings": {"Networks": {"clab": {}}}}
+
+
+class _FakeStream:
+    def __init__(self, fail):
+        self.fail, self.closed = fail, False
+
+    def __iter__(self):
+        if self.fail:
+            raise ConnectionError("daemon went away")
+        while not self.closed:
+            time.sleep(0.05)
+        yield from ()
+
+    def close(self):
+        self.closed = True
+
+
+class _FakeClient:
+    """Just enough of docker.DockerClient; the first events stream drops."""
+
+    def __init__(self):
+        self.running = [_FakeContainer(CLAB_PREFIX + "host-a")]
+        self.subscriptions = 0
+        client = self
+
+        class Containers:
+            def list(self):
+                return list(client.running)
+
+            def get(self, name):
+                for c in client.running:
+                    if c.name == name or c.id == name:
+                        return c
+                raise docker.errors.NotFound(name)
+
+        self.containers = Containers()
+
+    def events(self, **kwargs):
+        self.subscriptions += 1
+        return _FakeStream(fail=self.subscriptions == 1)
+
+
+def test_stream_failure_falls_back_and_resyncs(monkeypatch):
+    import container_inventory
+    monkeypatch.setattr(container_inventory, "RETRY_DELAY", 0.2)
+    client = _FakeClient()
+    inventory = ContainerInventory(client).start()
+
+    # the stream dropped: changes made now must still be visible
+    assert _wait_for(lambda: not inventory._valid)
+    client.running.append(_FakeContainer(CLAB_PREFIX + "host-b"))
+    assert {c.name for c in inventory.list()} == {CLAB_PREFIX + "host-a", CLAB_PREFIX + "host-b"}
+    assert inventory.get(CLAB_PREFIX + "host-b").name == CLAB_PREFIX + "host-b"
+
+    # ...and the watcher resubscribes and resyncs on its own
+    assert _wait_for(lambda: inventory._valid)
+    time.sleep(0.3)
+    assert client.subscriptions == 2
+    assert inventory.mgmt_network(exclude=CLAB_PREFIX + "host-a") == "clab"
+    inventory.stop()
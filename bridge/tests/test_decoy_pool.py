@@ -0,0 +1,56 @@
+# Unit tests for DecoyPool — pool fills in the background, decoys attach/detach on the mgmt network.
+# Skipped if the nginx:alpine decoy image is not available locally.
+#
+# Terminal 1 (deploy topology):
+#   cd ~/Desktop/Network_Defender_FYP/containerlab-networks
+#   sudo containerlab deploy -t cage4-topology.yaml
+#
+# Terminal 2 (run):
+#   cd ~/Desktop/Network_Defender_FYP/bridge
+#   sudo ~/fyp-venv-linux/bin/python -m pytest tests/test_decoy_pool.py -v
+
+import time
+import docker
+import pytest
+from decoy_pool import DecoyPool, DECOY_IMAGE
+from container_inventory import get_inventory
+
+
+def _wait_for(predicate, timeout=30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.2)
+    return False
+
+
+@pytest.fixture
+def pool():
+    client = docker.from_env()
+    try:
+        client.images.get(DECOY_IMAGE)
+    except docker.errors.ImageNotFound:
+        pytest.skip(f"{DECOY_IMAGE} not pulled")
+    pool = DecoyPool(size=2).start()
+    yield pool
+    pool.stop()
+
+
+def test_pool_fills(pool):
+    assert _wait_for(lambda: pool.idle() == 2)
+
+
+def test_acquire_and_release(pool):
+    network = get_inventory().mgmt_network()
+    assert _wait_for(lambda: pool.idle() == 2)
+
+    decoy = pool.acquire(network)
+    decoy.reload()
+    assert network in decoy.attrs["NetworkSettings"]["Networks"]
+
+    pool.release(decoy.name)
+    decoy.reload()
+    assert network not in decoy.attrs["NetworkSettings"]["Networks"]
+    # replenished while the decoy was out, recycled one is trimmed
+    assert _wait_for(lambda: pool.idle() == 2)
@@ -61,4 +61,20 @@ def test_feature_indices():
     # every node has exactly one subnet bit set
     for i, c in enumerate(nodes):
         subnet_bits = sum(float(graph.x[i][178 + j]) for j in range(9))
-        assert subnet_bits == 1.0, f"{c['clean_name']} subnet one-hot invalid"
\ No newline at end of file
+        assert subnet_bits == 1.0, f"{c['clean_name']} subnet one-hot invalid"
+
+def test_incremental_build_matches_fresh_build():
+    monitor = ContainerlabMonitor()
+    builder = ObservationGraphBuilder()
+    state = monitor.get_network_state()
+    first = builder.build_graph(state)
+    edge_index = first.edge_index
+
+    host = builder._last_servers[0]["clean_name"]
+    graph = builder.build_graph(state, compromise_map={host: 2}, decoys={host: "decoy"})
+    assert graph.edge_index is edge_index  # topology unchanged, cache reused
+
+    fresh = ObservationGraphBuilder().build_graph(state, compromise_map={host: 2}, decoys={host: "decoy"})
+    assert torch.equal(graph.x, fresh.x)
+    idx = builder._last_nodes_to_idx[host]
+    assert graph.x[idx][187] == 1.0 and graph.x[idx][100] == 1.0
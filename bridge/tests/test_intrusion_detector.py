@@ -66,4 +66,20 @@ def test_root_compromise_detected():
     client.containers.get(PREFIX + target).exec_run("touch /root/.compromised")
     results = detector.scan(servers + users)
     assert results[target] == 2
-    client.containers.get(PREFIX + target).exec_run("rm -f /root/.compromised")
\ No newline at end of file
+    client.containers.get(PREFIX + target).exec_run("rm -f /root/.compromised")
+
+def test_bundle_sentinels_match_direct_scan():
+    monitor = ContainerlabMonitor()
+    builder = ObservationGraphBuilder()
+    detector = IntrusionDetector()
+    client = docker.from_env()
+    state = monitor.get_network_state()
+    servers, users, _ = builder.classify_node_type(state)
+    target = servers[0]["clean_name"]
+    client.containers.get(PREFIX + target).exec_run("touch /tmp/.compromised")
+    state = monitor.get_network_state()
+    bundled = detector.scan(servers + users, sentinels=state["sentinels"])
+    direct = detector.scan(servers + users)
+    assert bundled[target] == 1
+    assert bundled == direct
+    client.containers.get(PREFIX + target).exec_run("rm -f /tmp/.compromised")
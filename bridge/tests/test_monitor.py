@@ -8,6 +8,10 @@
 #   cd ~/Desktop/Network_Defender_FYP/bridge
 #   sudo ~/fyp-venv-linux/bin/python -m pytest tests/test_monitor.py -v
 
+import threading
+
+import pytest
+
 from network_monitor import ContainerlabMonitor
 from graph_builder import ObservationGraphBuilder
 
@@ -39,4 +43,50 @@ def test_containers_classified():
 def test_processes_collected():
     monitor = ContainerlabMonitor()
     state = monitor.get_network_state()
-    assert len(state["processes"]) > 0
\ No newline at end of file
+    assert len(state["processes"]) > 0
+
+def test_probe_timings_recorded():
+    monitor = ContainerlabMonitor(max_workers=4, probe_timeout=10.0)
+    state = monitor.get_network_state()
+    timings = monitor.last_timings
+    assert set(timings["hosts"]) == set(state["processes"])
+    for host in timings["hosts"].values():
+        assert set(host) == {"bundle"}
+    assert timings["total"] >= timings["probes"]
+
+
+def test_split_probe_mode():
+    monitor = ContainerlabMonitor(probe_bundle=False)
+    state = monitor.get_network_state()
+    assert "sentinels" not in state
+    for host in monitor.last_timings["hosts"].values():
+        assert set(host) == {"processes", "connections"}
+
+
+def test_bundle_reports_sentinels():
+    monitor = ContainerlabMonitor()
+    state = monitor.get_network_state()
+    assert set(state["sentinels"]) == set(state["processes"])
+    assert all(level in (0, 1, 2) for level in state["sentinels"].values())
+
+
+def test_close_stops_probe_pool():
+    monitor = ContainerlabMonitor()
+    monitor.get_network_state()
+    monitor.close()
+    with pytest.raises(RuntimeError):
+        monitor.prefetch()
+
+
+def test_split_mode_timeout_keeps_other_probe():
+    monitor = ContainerlabMonitor(probe_bundle=False, probe_timeout=1.0)
+    release = threading.Event()
+    monitor._get_connections = lambda container: release.wait() and {}   # hangs until released
+    try:
+        state = monitor.get_network_state()
+    finally:
+        release.set()
+        monitor.close()
+    for host, processes in state["processes"].items():
+        assert not isinstance(processes, dict) or "timed out" not in processes.get("error", ""), host
+        assert "timed out" in state["connections"][host]["error"]
@@ -0,0 +1,196 @@
+# Inference micro-benchmark for the GNN-PPO agent: replays observations through
+# get_action / the critic and writes a JSON report to track across commits.
+#   venv/bin/python benchmark_inference.py [--obs obs.pt ...] [--threads 1 4] [--batch-sizes 1 8 64]
+#
+# Observations come from --obs files recorded with
+#   bridge:  sudo ~/fyp-venv-linux/bin/python evaluation.py --record-obs obs_bridge.pt
+#   CybORG:  venv/bin/python evaluate_cyborg.py --record-obs obs_cyborg.pt
+# or, without --obs, synthetic graphs of growing size (models.inference.example_state).
+#
+# Reported per thread count (torch.set_num_threads):
+#   latency     p50/p95/p99/mean ms of agent.get_action (eval) and critic forward, one observation
+#   by_nodes    get_action p50 per graph-size bucket — how latency scales with the graph
+#   throughput  observations/s for actor+critic over combine_marl_states batches
+# plus peak RSS. → results/inference_benchmark_<timestamp>.json
+
+from argparse import ArgumentParser
+from datetime import datetime
+import json
+import os
+import resource
+import subprocess
+import time
+
+import numpy as np
+import torch
+
+from models.cage4 import load
+from models.inference import example_state, example_multi_state, load_observations
+from models.utils import combine_marl_states
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WEIGHTS_PATH = os.path.join(HERE, "weights", "gnn_ppo-0.pt")
+RESULTS_DIR = os.path.join(HERE, "results")
+
+# synthetic graph sizes: extra process/connection nodes per observation
+SYNTHETIC_OTHER = [0, 50, 100, 200, 400, 800]
+SIZE_BUCKETS = 5
+
+
+def synthetic_observations(in_dim):
+    states = []
+    for i, n_other in enumerate(SYNTHETIC_OTHER):
+        for j, (n_srv, n_usr) in enumerate([(6, 10), (3, 7), (1, 2)]):
+            states.append(example_state(in_dim, n_srv, n_usr, seed=i*3+j, n_other=n_other) + (False,))
+    states.append(example_multi_state(in_dim))
+    return states
+
+
+def peak_rss_mb():
+    # ru_maxrss is KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def git_commit():
+    try:
+        out = subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=HERE, capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def percentiles(samples):
+    ms = np.array(samples) * 1000
+    return {
+        'p50': float(np.percentile(ms, 50)), 'p95': float(np.percentile(ms, 95)),
+        'p99': float(np.percentile(ms, 99)), 'mean': float(ms.mean()), 'n': len(ms)
+    }
+
+
+def sample(fn, states, repeats):
+    '''
+    Time fn(state) for every state, `repeats` rounds after one warm-up
+    round. Returns per-state lists of seconds.
+    '''
+    for s in states:
+        fn(s)
+    times = [[] for _ in states]
+    for _ in range(repeats):
+        for i, s in enumerate(states):
+            start = time.perf_counter()
+            fn(s)
+            times[i].append(time.perf_counter() - start)
+    return times
+
+
+def by_nodes(states, times):
+    sizes = np.array([s[0].size(0) for s in states])
+    edges = np.unique(np.quantile(sizes, np.linspace(0, 1, SIZE_BUCKETS + 1)))
+    buckets = []
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        idx = [i for i, n in enumerate(sizes) if lo <= n <= hi and (hi == edges[-1] or n < hi)]
+        if idx:
+            buckets.append({
+                'nodes_min': int(sizes[idx].min()), 'nodes_max': int(sizes[idx].max()),
+                'observations': len(idx),
+                'p50': float(np.percentile(np.concatenate([times[i] for i in idx]) * 1000, 50)),
+            })
+    return buckets
+
+
+def throughput(agent, states, bs, min_seconds):
+    '''
+    Actor+critic over batches of bs observations. The observations are
+    cycled to a whole number of batches so every batch size sees the
+    same mix of graph sizes.
+    '''
+    # combine_marl_states takes one multi_subnet flag for the whole batch
+    single = [s for s in states if not s[8]]
+    total = -(-max(bs, len(single)) // bs) * bs
+    cycled = [single[i % len(single)] for i in range(total)]
+    batches = [combine_marl_states(cycled[i:i+bs]) for i in range(0, total, bs)]
+
+    def run():
+        for b in batches:
+            agent.actor.probs(*b)
+            agent.critic(*b)
+
+    run()
+    n, start = 0, time.perf_counter()
+    while (elapsed := time.perf_counter() - start) < min_seconds:
+        run()
+        n += 1
+    return {'batch': bs, 'ms_per_batch': elapsed / (n * len(batches)) * 1000, 'obs_per_s': total * n / elapsed}
+
+
+if __name__ == '__main__':
+    ap = ArgumentParser()
+    ap.add_argument('--weights', default=WEIGHTS_PATH)
+    ap.add_argument('--obs', nargs='+', default=[], help='Recorded observation files (default: synthetic)')
+    ap.add_argument('--threads', type=int, nargs='+', default=sorted({1, torch.get_num_threads()}))
+    ap.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 64, 256])
+    ap.add_argument('--repeats', type=int, default=20, help='Latency samples per observation')
+    ap.add_argument('--seconds', type=float, default=1.0, help='Minimum run time per throughput point')
+    ap.add_argument('--out', help='Report path (default: results/inference_benchmark_<timestamp>.json)')
+    args = ap.parse_args()
+
+    rss_start = peak_rss_mb()
+    agent = load(args.weights)
+    agent.eval()
+    in_dim = agent.args[0]
+
+    sources = {}
+    states = []
+    for f in args.obs:
+        source, recorded = load_observations(f)
+        sources[source] = sources.get(source, 0) + len(recorded)
+        states += recorded
+    if not states:
+        states = synthetic_observations(in_dim)
+        sources['synthetic'] = len(states)
+    nodes = [s[0].size(0) for s in states]
+    print(f"{len(states)} observations {sources}, {min(nodes)}-{max(nodes)} nodes")
+
+    results = []
+    with torch.no_grad():
+        for threads in args.threads:
+            torch.set_num_threads(threads)
+            torch.manual_seed(0)
+
+            act = sample(lambda s: agent.get_action((s, False)), states, args.repeats)
+            crit = sample(lambda s: agent.critic(*s), states, args.repeats)
+            tput = [throughput(agent, states, bs, args.seconds) for bs in args.batch_sizes]
+
+            latency = {
+                'get_action': percentiles(np.concatenate(act)),
+                'critic': percentiles(np.concatenate(crit)),
+            }
+            results.append({
+                'threads': threads, 'latency_ms': latency,
+                'by_nodes': by_nodes(states, act), 'throughput': tput,
+            })
+
+            la = latency['get_action']
+            print(f"threads {threads}: get_action p50 {la['p50']:.2f} p95 {la['p95']:.2f} p99 {la['p99']:.2f} ms  "
+                  f"critic p50 {latency['critic']['p50']:.2f} ms")
+            for t in tput:
+                print(f"  batch {t['batch']:>4}: {t['ms_per_batch']:8.2f} ms  {t['obs_per_s']:8.0f} obs/s")
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'torch': torch.__version__,
+        'weights': os.path.relpath(args.weights, HERE),
+        'observations': {'sources': sources, 'nodes_min': min(nodes), 'nodes_max': max(nodes),
+                         'nodes_median': float(np.median(nodes))},
+        'results': results,
+        'memory_mb': {'rss_before_load': rss_start, 'peak_rss': peak_rss_mb()},
+    }
+
+    out = args.out or os.path.join(
+        RESULTS_DIR, f"inference_benchmark_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Peak RSS {report['memory_mb']['peak_rss']:.0f} MB — report saved to {out}")
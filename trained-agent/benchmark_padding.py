@@ -0,0 +1,103 @@
+# Compares host padding in models/cage4.py against the original per-graph Python loop
+# at bridge (1), rollout (64) and PPO minibatch (2500) batch sizes.
+#   venv/bin/python benchmark_padding.py [--repeats 3]
+
+from argparse import ArgumentParser
+import random
+import time
+
+import torch
+
+import models.cage4 as cage4
+from models.cage4 import InductiveActorNetwork, InductiveCriticNetwork, extract_hosts, host_layout
+from models.inference import example_state
+from models.utils import combine_marl_states
+
+BATCH_SIZES = [1, 64, 2500]
+IN_DIM = 192
+
+
+def pad_sequence_loop(seq, lens, padding):
+    # pad_sequence as originally written, for reference
+    padded = torch.zeros(lens.size(0), padding, seq.size(-1))
+    mask = torch.ones(padded.size(0), padded.size(1))
+
+    offset = 0
+    for i,len in enumerate(lens):
+        st = offset
+        en = offset+len
+
+        padded[i][:len] = seq[st:en]
+        mask[i][len:] = 0
+        offset += len
+
+    return padded, mask.unsqueeze(-1)
+
+def extract_hosts_loop(x, servers, n_servers, users, n_users, layout=None):
+    srv,s_mask = pad_sequence_loop(x[servers], n_servers, cage4.MAX_SERVERS)
+    usr,u_mask = pad_sequence_loop(x[users], n_users, cage4.MAX_USERS)
+    return torch.cat([srv,usr], dim=1), torch.cat([s_mask, u_mask], dim=1)
+
+def extract_hosts_scatter(x, servers, n_servers, users, n_users, layout=None):
+    # vectorized, but indices rebuilt on every call
+    srv,s_mask = cage4.pad_sequence(x[servers], n_servers, cage4.MAX_SERVERS)
+    usr,u_mask = cage4.pad_sequence(x[users], n_users, cage4.MAX_USERS)
+    return torch.cat([srv,usr], dim=1), torch.cat([s_mask, u_mask], dim=1)
+
+
+def make_batch(bs, seed=0):
+    rng = random.Random(seed)
+    states = []
+    for i in range(bs):
+        st = example_state(IN_DIM, rng.randint(1, cage4.MAX_SERVERS), rng.randint(1, cage4.MAX_USERS), seed=i)
+        states.append(st + (False,))
+    return combine_marl_states(states)
+
+def timeit(fn, repeats):
+    fn()    # warm up
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+if __name__ == '__main__':
+    ap = ArgumentParser()
+    ap.add_argument('--repeats', type=int, default=3)
+    args = ap.parse_args()
+
+    torch.manual_seed(0)
+    actor = InductiveActorNetwork(IN_DIM)
+    critic = InductiveCriticNetwork(IN_DIM)
+    variants = {
+        'loop': extract_hosts_loop,
+        'scatter': extract_hosts_scatter,
+        'layout': extract_hosts,
+    }
+
+    print(f"{'batch':>6} {'variant':>8} {'pad x7 (ms)':>12} {'fwd+bwd (ms)':>13}")
+    for bs in BATCH_SIZES:
+        x, ei, gv, srv, nsrv, usr, nusr, edges, multi = state = make_batch(bs)
+        reference = extract_hosts_loop(x, srv, nsrv, usr, nusr)
+
+        for name, fn in variants.items():
+            out = fn(x, srv, nsrv, usr, nusr)
+            assert torch.equal(out[0], reference[0]) and torch.equal(out[1], reference[1]), name
+
+            # 7 calls per actor+critic forward (4 actor, 3 critic)
+            def pad():
+                layout = host_layout(srv, nsrv, usr, nusr) if name == 'layout' else None
+                for _ in range(7):
+                    fn(x, srv, nsrv, usr, nusr, layout)
+
+            def step():
+                cage4.extract_hosts = fn
+                try:
+                    loss = actor(*state).probs.sum() + critic(*state).sum()
+                    loss.backward()
+                finally:
+                    cage4.extract_hosts = extract_hosts
+
+            print(f"{bs:>6} {name:>8} {timeit(pad, args.repeats):>12.2f} {timeit(step, args.repeats):>13.1f}")
@@ -0,0 +1,118 @@
+# Compares the return/advantage computation in InductiveGraphPPOAgent.learn (vectorized,
+# once per update) against the original Python loop (rebuilt every epoch), then times a
+# whole PPO update both ways.
+#   venv/bin/python benchmark_update.py [--steps 500 2500 12500] [--update-steps 1000] [--repeats 3]
+
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+import copy
+import io
+import random
+import time
+
+import torch
+
+from models.cage4 import InductiveGraphPPOAgent, MAX_SERVERS, MAX_USERS
+from models.inference import example_state
+from models.memory_buffer import PPOMemory
+
+IN_DIM = 192
+EPISODE_LEN = 500
+EPOCHS = 4
+BS = 2500
+
+
+def returns_loop(mem, gamma):
+    # learn() as originally written, for reference
+    rewards = []
+    discounted_reward = 0
+    for reward, is_terminal in zip(reversed(mem.r.tolist()), reversed(mem.t.tolist())):
+        if is_terminal:
+            discounted_reward = 0
+        discounted_reward = reward + gamma * discounted_reward
+        rewards.insert(0, discounted_reward)
+
+    r = torch.tensor(rewards, dtype=torch.float)
+    r = (r - r.mean()) / (r.std() + 1e-5)
+    return r, r - mem.v.float()
+
+
+class ReferenceAgent(InductiveGraphPPOAgent):
+    def returns(self, mem):
+        # The original learn() recomputed these in every epoch
+        for _ in range(self.epochs):
+            out = returns_loop(mem, self.gamma)
+        return out
+
+
+def make_memory(n, states, agent=None, seed=0):
+    '''
+    n transitions over `states`, with a terminal every EPISODE_LEN steps.
+    Actions/values/log probs come from agent if given (so the update is
+    well defined), otherwise they're placeholders
+    '''
+    g = torch.Generator().manual_seed(seed)
+    mem = PPOMemory(BS, capacity=n)
+    for i in range(n):
+        s = states[i % len(states)]
+        a,v,p = agent.get_action((s, False)) if agent else (0, torch.randn(1, generator=g).item(), -1.)
+        r = torch.randn(1, generator=g).item()
+        mem.remember(s, a,v,p, r, int(i % EPISODE_LEN == EPISODE_LEN-1))
+    return mem
+
+def timeit(fn, repeats):
+    fn()    # warm up
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+if __name__ == '__main__':
+    ap = ArgumentParser()
+    ap.add_argument('--steps', type=int, nargs='+', default=[500, 2500, 12500], help='Transitions per update (returns only)')
+    ap.add_argument('--update-steps', type=int, default=1000, help='Transitions for the full-update timing (0 to skip)')
+    ap.add_argument('--repeats', type=int, default=3)
+    args = ap.parse_args()
+
+    torch.manual_seed(0)
+    rng = random.Random(0)
+    states = [
+        example_state(IN_DIM, rng.randint(1, MAX_SERVERS), rng.randint(1, MAX_USERS), seed=i) + (False,)
+        for i in range(16)
+    ]
+    agent = InductiveGraphPPOAgent(IN_DIM, bs=BS, epochs=EPOCHS)
+
+    print(f"Returns + advantages, {EPOCHS} epochs per update")
+    print(f"{'steps':>6} {'loop (ms)':>10} {'vectorized (ms)':>16} {'speedup':>8}")
+    for n in args.steps:
+        mem = make_memory(n, states[:1])
+        ref, out = returns_loop(mem, agent.gamma), agent.returns(mem)
+        assert all(torch.allclose(a, b, atol=1e-5) for a,b in zip(ref, out))
+
+        def loop():
+            for _ in range(EPOCHS):
+                returns_loop(mem, agent.gamma)
+
+        t_loop, t_vec = timeit(loop, args.repeats), timeit(lambda: agent.returns(mem), args.repeats)
+        print(f"{n:>6} {t_loop:>10.2f} {t_vec:>16.2f} {t_loop/t_vec:>7.0f}x")
+
+    if args.update_steps:
+        reference = ReferenceAgent(IN_DIM, bs=BS, epochs=EPOCHS)
+        reference.actor.load_state_dict(agent.actor.state_dict())
+        reference.critic.load_state_dict(agent.critic.state_dict())
+        mem = make_memory(args.update_steps, states, agent)
+        weights = copy.deepcopy((agent.actor.state_dict(), agent.critic.state_dict()))
+
+        def update(a):
+            # Same starting weights and memories every time
+            a.actor.load_state_dict(weights[0]); a.critic.load_state_dict(weights[1])
+            a.memory.mems = [mem]
+            with redirect_stdout(io.StringIO()):
+                a.learn()
+
+        t_ref, t_new = timeit(lambda: update(reference), args.repeats), timeit(lambda: update(agent), args.repeats)
+        print(f"\nFull update, {args.update_steps} steps, bs {BS}, {EPOCHS} epochs")
+        print(f"  before {t_ref:.0f} ms  after {t_new:.0f} ms")
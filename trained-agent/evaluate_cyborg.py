@@ -1,6 +1,7 @@
 import matplotlib
 matplotlib.use('Agg')
 
+from argparse import ArgumentParser
 from datetime import datetime
 import csv
 import sys
@@ -12,6 +13,8 @@ from CybORG.Simulator.Scenarios import EnterpriseScenarioGenerator
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 from submission import Submission
+from models.batched import BatchedActors
+from models.inference import save_observations
 
 EPISODE_LENGTH = 100
 RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
@@ -21,7 +24,7 @@ def decode_action(action_int):
         return "Monitor"
     return ["Analyse", "Block", "Restore", "DeployDecoy"][action_int // 16]
 
-def run_evaluation():
+def run_evaluation(record_obs=None):
     os.makedirs(RESULTS_DIR, exist_ok=True)
     run_id = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
     csv_path = os.path.join(RESULTS_DIR, f"cyborg_eval_{run_id}.csv")
@@ -35,19 +38,25 @@ def run_evaluation():
     cyborg = CybORG(sg, "sim")
     wrapped_cyborg = Submission.wrap(cyborg)
     observations, _ = wrapped_cyborg.reset()
+    policy = BatchedActors(Submission.AGENTS)
 
     FIELDS = ["step", "blue_action_type"]
+    recorded = []
 
     with open(csv_path, "w", newline="") as f:
         writer = csv.DictWriter(f, fieldnames=FIELDS)
         writer.writeheader()
 
         for step in range(EPISODE_LENGTH):
-            actions = {
-                name: agent.get_action(observations[name], wrapped_cyborg.action_space(name))
-                for name, agent in Submission.AGENTS.items()
+            if record_obs:
+                recorded += [obs for obs, is_blocked in observations.values() if not is_blocked]
+
+            # One forward pass for all five agents
+            actions = policy.get_actions({
+                name: observations[name]
+                for name in Submission.AGENTS
                 if name in wrapped_cyborg.agents
-            }
+            })
             action_type = decode_action(actions.get("blue_agent_0"))
             observations, _, term, trunc, _ = wrapped_cyborg.step(actions)
 
@@ -60,7 +69,13 @@ def run_evaluation():
                 break
 
     print(f"\nResults saved to {csv_path}")
+    if record_obs:
+        save_observations(recorded, record_obs, source="cyborg")
+        print(f"{len(recorded)} observations saved to {record_obs}")
 
     
 if __name__ == "__main__":
-    run_evaluation()
\ No newline at end of file
+    ap = ArgumentParser()
+    ap.add_argument("--record-obs", metavar="PATH", help="Save every agent observation to PATH (for quantize_actor.py --obs)")
+    args = ap.parse_args()
+    run_evaluation(record_obs=args.record_obs)
\ No newline at end of file
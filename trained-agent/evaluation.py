@@ -18,6 +18,8 @@ import json
 import sys
 import os
 
+from models.batched import BatchedActors
+
 cyborg_version = CYBORG_VERSION
 EPISODE_LENGTH = 500
 
@@ -50,20 +52,24 @@ def load_submission(source: str):
     return Submission
 
 
+def get_actions(policy, observations, wrapped_cyborg):
+    """All active agents' actions from one batched actor forward pass"""
+    return policy.get_actions({
+        agent_name: observations[agent_name]
+        for agent_name in policy.names
+        if agent_name in wrapped_cyborg.agents
+    })
+
+
 def evaluate_one_episode(cyborg, wrapped_cyborg, agent, write_to_file, i,tot):
     observations, _ = wrapped_cyborg.reset()
     r = []
     a = []
     o = []
     count = 0
+    policy = BatchedActors(agent)
     for j in tqdm(range(EPISODE_LENGTH), desc=f'({i+1}/{tot})'):
-        actions = {
-            agent_name: agent.get_action(
-                observations[agent_name], wrapped_cyborg.action_space(agent_name)
-            )
-            for agent_name, agent in submission.AGENTS.items()
-            if agent_name in wrapped_cyborg.agents
-        }
+        actions = get_actions(policy, observations, wrapped_cyborg)
         observations, rew, term, trunc, info = wrapped_cyborg.step(actions)
         done = {
             agent: term.get(agent, False) or trunc.get(agent, False)
@@ -235,6 +241,7 @@ def run_evaluation(submission, log_path, max_eps=100, write_to_file=False, seed=
     total_reward = []
     actions_log = []
     obs_log = []
+    policy = BatchedActors(submission.AGENTS)
     for i in tqdm(range(max_eps)):
         observations, _ = wrapped_cyborg.reset()
         r = []
@@ -242,13 +249,7 @@ def run_evaluation(submission, log_path, max_eps=100, write_to_file=False, seed=
         o = []
         count = 0
         for j in range(EPISODE_LENGTH):
-            actions = {
-                agent_name: agent.get_action(
-                    observations[agent_name], wrapped_cyborg.action_space(agent_name)
-                )
-                for agent_name, agent in submission.AGENTS.items()
-                if agent_name in wrapped_cyborg.agents
-            }
+            actions = get_actions(policy, observations, wrapped_cyborg)
             observations, rew, term, trunc, info = wrapped_cyborg.step(actions)
             done = {
                 agent: term.get(agent, False) or trunc.get(agent, False)
@@ -0,0 +1,44 @@
+# Traces each gnn_ppo-*.pt actor to weights/gnn_ppo-*.ts (TorchScript) for the bridge,
+# then checks the artifact against the eager actor on a few host layouts.
+#   venv/bin/python export_inference.py [weights/gnn_ppo-0.pt ...]
+
+import glob
+import os
+import sys
+import time
+import warnings
+
+import torch
+
+from models.cage4 import load
+from models.inference import export_actor, load_actor, example_state
+
+WEIGHTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "weights")
+
+if __name__ == "__main__":
+    paths = sys.argv[1:] or sorted(glob.glob(os.path.join(WEIGHTS_DIR, "gnn_ppo-*.pt")))
+    warnings.filterwarnings("ignore", category=torch.jit.TracerWarning)
+
+    for path in paths:
+        out = export_actor(path)
+        agent = load(path)
+        actor, in_dim = agent.actor, agent.args[0]
+        traced = load_actor(out)
+
+        worst = 0.0
+        with torch.no_grad():
+            for seed, (n_srv, n_usr) in enumerate([(6, 10), (5, 9), (2, 3), (6, 4)]):
+                state = example_state(in_dim, n_srv, n_usr, seed=seed)
+                eager = actor.probs(*state, False)
+                worst = max(worst, (traced(*state) - eager).abs().max().item())
+
+            start = time.perf_counter()
+            for _ in range(200):
+                actor.probs(*state, False)
+            eager_ms = (time.perf_counter() - start) / 200 * 1000
+            start = time.perf_counter()
+            for _ in range(200):
+                traced(*state)
+            traced_ms = (time.perf_counter() - start) / 200 * 1000
+
+        print(f"{os.path.basename(out)}: max |dp| = {worst:.2e}  eager {eager_ms:.2f} ms  traced {traced_ms:.2f} ms")
@@ -0,0 +1,119 @@
+# Per-agent PPO learner processes for train.py (--learner processes). Each agent's
+# update runs in its own long-lived process with its own intra-op thread budget, so
+# the Python side of learn() (batching, loss bookkeeping) isn't serialized by the GIL
+# the way Parallel(prefer='threads') is.
+#
+# Nothing is copied back: a learner aliases the agent's actor/critic parameters, which
+# RolloutPool has already moved into shared memory, and its optimizer steps them in
+# place. Memories arrive as PPOMemory buffers through the shared-memory queues. The
+# optimizer state lives in the learner process for the whole run.
+#
+# Not run standalone — used by train.py.
+
+import traceback
+from queue import Empty
+
+import torch
+import torch.multiprocessing as mp
+
+from models.cage4 import InductiveGraphPPOAgent
+
+# As in rollout.py: share by name, not by open file descriptor
+mp.set_sharing_strategy('file_system')
+
+
+def thread_budget(total, weights):
+    '''
+    Split `total` threads proportionally to `weights` (at least one
+    each), handing leftovers to the largest remainders
+    '''
+    share = [total * w / sum(weights) for w in weights]
+    threads = [max(int(s), 1) for s in share]
+    order = sorted(range(len(weights)), key=lambda i: share[i] - int(share[i]), reverse=True)
+    for i in order[:max(total - sum(threads), 0)]:
+        threads[i] += 1
+    return threads
+
+
+def _alias(module, tensors):
+    # Point the parameters (which the optimizer holds) at the shared tensors
+    for name,p in module.named_parameters():
+        p.data = tensors[name]
+
+
+def _learner(i, tasks, results, spec, weights, seed, threads):
+    '''
+    Learner loop for agent i: each task is that agent's list of
+    PPOMemory buffers, answered with ('loss', i, last loss)
+    '''
+    try:
+        torch.set_num_threads(threads)
+
+        args,kwargs = spec
+        agent = InductiveGraphPPOAgent(*args, **kwargs)
+        _alias(agent.actor, weights[0])
+        _alias(agent.critic, weights[1])
+        agent.train()
+
+        # Seeded after the (discarded) initialisation, so only the updates draw from it
+        torch.manual_seed(seed + i)
+
+        while (mems := tasks.get()) is not None:
+            agent.memory.mems = mems
+            results.put(('loss', i, agent.learn()))
+    except Exception:
+        results.put(('error', i, traceback.format_exc()))
+
+
+class LearnerPool:
+    '''
+    One persistent learner process per agent. threads[i] is agent i's
+    intra-op thread budget. The agents' parameters must already be in
+    shared memory (RolloutPool does this)
+    '''
+    def __init__(self, agents, threads, seed):
+        ctx = mp.get_context('spawn')
+        self.tasks = [ctx.Queue() for _ in agents]
+        self.results = ctx.Queue()
+
+        self.procs = [
+            ctx.Process(
+                target=_learner, name=f'learner-{i}', daemon=True,
+                args=(
+                    i, self.tasks[i], self.results, (agent.args, agent.kwargs),
+                    (agent.actor.state_dict(), agent.critic.state_dict()), seed, threads[i]
+                )
+            )
+            for i,agent in enumerate(agents)
+        ]
+        [p.start() for p in self.procs]
+
+    def learn(self, memories):
+        '''
+        Run every agent's update in parallel; memories[i] is agent i's
+        list of PPOMemory buffers. Returns each agent's last loss
+        '''
+        for q,mems in zip(self.tasks, memories):
+            q.put(mems)
+
+        losses = dict()
+        while len(losses) < len(self.tasks):
+            try:
+                msg = self.results.get(timeout=60)
+            except Empty:
+                if (dead := [p.name for p in self.procs if not p.is_alive()]):
+                    raise RuntimeError(f'Learner processes exited unexpectedly: {dead}')
+                continue
+            if msg[0] == 'error':
+                raise RuntimeError(f'Learner {msg[1]} failed:\n{msg[2]}')
+            losses[msg[1]] = msg[2]
+
+        return [losses[i] for i in range(len(self.tasks))]
+
+    def close(self):
+        for q in self.tasks:
+            q.put(None)
+        for p in self.procs:
+            p.join(timeout=10)
+            if p.is_alive():
+                p.terminate()
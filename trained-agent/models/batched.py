@@ -0,0 +1,192 @@
+import warnings
+
+import torch
+from torch_geometric.nn.conv.gcn_conv import gcn_norm
+
+from models.cage4 import MAX_SERVERS, MAX_USERS, MAX_EDGES, host_layout, extract_hosts
+
+
+class BatchedActors():
+    '''
+    Runs the actors of several agents in one forward pass per step.
+
+    The agents share an architecture but not weights, so each
+    parameter is stacked along a new leading dim (one slice per agent)
+    and every layer becomes a batched matmul that picks the right slice
+    for each graph/row. The observation graphs are zero-padded to the
+    same node count and joined into one disjoint-union graph for the
+    GCN layers; padding nodes have no edges, so they never reach a real
+    node. Matches InductiveActorNetwork.probs up to float rounding.
+    '''
+    def __init__(self, agents):
+        '''
+        agents: dict of {agent_name: InductiveGraphPPOAgent}
+        '''
+        self.names = list(agents)
+        self.agents = agents
+        self.idx = {name: i for i, name in enumerate(self.names)}
+
+        actors = [a.actor for a in agents.values()]
+        sds = [a.state_dict() for a in actors]
+        keys = list(sds[0])
+        for name, sd in zip(self.names, sds):
+            if list(sd) != keys or any(sd[k].shape != sds[0][k].shape for k in keys):
+                raise ValueError(f'{name} has a different actor architecture; cannot stack')
+        if len({a.concat_edges for a in actors}) > 1:
+            raise ValueError('agents disagree on concat_edges; cannot stack')
+
+        self.params = {k: torch.stack([sd[k] for sd in sds]) for k in keys}
+        self.concat_edges = actors[0].concat_edges
+        self.node_action_space = actors[0].node_action_space
+
+        # Shared-trunk actors keep their GCN under trunk.*
+        self.gcn = 'trunk.' if 'trunk.conv1.bias' in self.params else ''
+
+    def _linear(self, key, v, who):
+        '''
+        Apply nn.Linear `key` of agent who[i] to row i of v (R x ... x d)
+        '''
+        w = self.params[key + '.weight'].index_select(0, who)   # R x out x in
+        b = self.params[key + '.bias'].index_select(0, who)     # R x out
+        if v.dim() == 2:
+            return torch.baddbmm(b.unsqueeze(1), v.unsqueeze(1), w.transpose(1, 2)).squeeze(1)
+        return torch.baddbmm(b.unsqueeze(1), v, w.transpose(1, 2))
+
+    def _gcn(self, key, x, adj, who):
+        '''
+        GCNConv `key` over G padded graphs: x is G x N x d, adj is the
+        normalised (sparse) adjacency of their disjoint union
+        '''
+        g, n, _ = x.size()
+        w = self.params[key + '.lin.weight'].index_select(0, who)
+        h = torch.bmm(x, w.transpose(1, 2)).reshape(g * n, -1)
+        h = torch.sparse.mm(adj, h).reshape(g, n, -1)
+        return h.add_(self.params[key + '.bias'].index_select(0, who).unsqueeze(1))
+
+    def _attn(self, key, v, mask, g, who):
+        # SimpleSelfAttention.forward
+        att = torch.softmax(self._linear(key + '.att.0', v, who), dim=-1)
+        feat = self._linear(key + '.feat', v, who)
+        out = (att*feat*mask).sum(dim=1)
+        g_ = torch.tanh(self._linear(key + '.glb.0', torch.cat([out, g], dim=-1), who))
+        return g + g_
+
+    def _mlp(self, key, v, who, layers):
+        for i in layers[:-1]:
+            v = torch.relu(self._linear(f'{key}.{i}', v, who))
+        return self._linear(f'{key}.{layers[-1]}', v, who)
+
+    def probs(self, states):
+        '''
+        states: dict of {agent_name: state} (the 9-tuples from
+                GraphWrapper; blue_agent_4's covers 3 subnets)
+
+        Returns dict of {agent_name: probs}, each shaped like the output
+        of that agent's own actor.probs (1 x 81, or 1 x 243 for multi-subnet)
+        '''
+        names = list(states)
+        return dict(zip(names, self.probs_list(names, [states[n] for n in names])))
+
+    @torch.no_grad()
+    def probs_list(self, names, states):
+        '''
+        As probs(), for parallel lists -- the same agent may appear
+        more than once (e.g. several requests for one checkpoint)
+        '''
+        graph_who = torch.tensor([self.idx[n] for n in names])
+
+        # Pad every graph to N nodes and offset into one union graph
+        n = max(s[0].size(0) for s in states)
+        x = torch.stack([
+            torch.cat([s[0], s[0].new_zeros(n - s[0].size(0), s[0].size(1))])
+            for s in states
+        ])
+        offsets = [i * n for i in range(len(states))]
+        ei = torch.cat([s[1] + off for s, off in zip(states, offsets)], dim=1)
+        ei, norm = gcn_norm(ei, num_nodes=len(states) * n)
+        adj = torch.sparse_coo_tensor(ei.flip(0), norm, (len(states) * n,) * 2)
+        with warnings.catch_warnings():
+            # CSR spmm is much faster than COO here; torch flags it as beta
+            warnings.filterwarnings('ignore', 'Sparse CSR tensor support')
+            adj = adj.to_sparse_csr()
+
+        x1 = self._gcn(self.gcn + 'conv1', x, adj, graph_who).relu_()
+        x2 = self._gcn(self.gcn + 'conv2', x1, adj, graph_who).relu_()
+        x0, x1, x2 = [h.reshape(len(states) * n, -1) for h in (x, x1, x2)]
+
+        # One row per subnet (blue_agent_4 contributes 3); every row
+        # is evaluated with the weights of the agent that observed it
+        rows = torch.tensor([s[4].size(0) for s in states])
+        who = graph_who.repeat_interleave(rows)
+
+        servers = torch.cat([s[3] + off for s, off in zip(states, offsets)])
+        users = torch.cat([s[5] + off for s, off in zip(states, offsets)])
+        n_servers = torch.cat([s[4] for s in states])
+        n_users = torch.cat([s[6] for s in states])
+        layout = host_layout(servers, n_servers, users, n_users)
+
+        rtrs, edges = [], []
+        for s, off, r in zip(states, offsets, rows.tolist()):
+            rtrs.append((s[7].unique(sorted=True) + off).reshape(-1, 9).repeat_interleave(r, 0))
+            edges.append(s[7] + off)
+        rtrs = torch.cat(rtrs)
+        src, dst = torch.cat(edges, dim=1)
+        rtr_mask = torch.ones(rtrs.size(0), 9, 1)
+
+        g = self._linear('global_net', torch.cat([s[2] for s in states]), who)
+        for key, h in (('g0_attn', x0), ('g1_attn', x1), ('g2_attn', x2)):
+            v, mask = extract_hosts(h, servers, n_servers, users, n_users, layout)
+            v = torch.cat([v, h[rtrs]], dim=1)
+            mask = torch.cat([mask, rtr_mask], dim=1)
+            g = self._attn(key, v, mask, g, who)
+
+        # Node actions: R x 16*a_n, rows are actions and columns nodes
+        z, mask = extract_hosts(x2, servers, n_servers, users, n_users, layout)
+        z = torch.cat([z, g.unsqueeze(1).repeat(1, z.size(1), 1)], dim=-1)
+        node_a = self._mlp('node_actions', z, who, [0, 2, 4]) * mask
+        node_a = node_a.transpose(1, 2).reshape(
+            z.size(0), (MAX_SERVERS+MAX_USERS)*self.node_action_space
+        )
+
+        # Edge actions: MAX_EDGES per row, evaluated as R x 8 x d
+        src = x2[src].reshape(-1, MAX_EDGES, x2.size(-1))
+        dst = x2[dst].reshape(-1, MAX_EDGES, x2.size(-1))
+        edge_mlp = lambda v: torch.relu(self._mlp('edge_actions', v, who, [0, 2]))
+        if self.concat_edges:
+            edge_a = edge_mlp(torch.cat([src, dst], dim=-1))
+        else:
+            edge_a = edge_mlp(src) * edge_mlp(dst)
+        edge_a = torch.cat([edge_a, g.unsqueeze(1).repeat(1, MAX_EDGES, 1)], dim=-1)
+        edge_a = self._linear('edge_out', edge_a, who)
+        edge_a = edge_a.transpose(1, 2).reshape(edge_a.size(0), -1)
+
+        glb_a = self._mlp('global_out', g, who, [0, 2])
+        out = torch.cat([node_a, edge_a, glb_a], dim=-1)
+
+        probs = []
+        for s, out_ in zip(states, out.split(rows.tolist())):
+            if s[8]:
+                out_ = out_.reshape(out_.size(0)//3, out_.size(1)*3)
+            out_ = out_.clone()
+            out_[out_ == 0] = -float('inf')   # So softmax prob is 0
+            probs.append(torch.softmax(out_, dim=1))
+
+        return probs
+
+    def get_actions(self, observations):
+        '''
+        Batched equivalent of calling agent.get_action(obs) for every agent
+        (eval mode). observations: {agent_name: (state, is_blocked)}.
+        Blocked agents get None, as in InductiveGraphPPOAgent.get_action
+        '''
+        states = {n: obs[0] for n, obs in observations.items() if not obs[1]}
+        actions = {n: None for n in observations}
+        if not states:
+            return actions
+
+        for name, p in self.probs(states).items():
+            if self.agents[name].deterministic:
+                actions[name] = p.argmax().item()
+            else:
+                actions[name] = torch.multinomial(p[0], 1).item()
+        return actions
@@ -5,37 +5,73 @@ from torch.distributions.categorical import Categorical
 from torch_geometric.nn import GCNConv
 
 from models.memory_buffer import MultiPPOMemory
-from models.utils import combine_marl_states
+from models.utils import discounted_scan
 
 MAX_SERVERS = 6
 MAX_USERS = 10
 MAX_EDGES = 8
 
+# Checkpoint 'format' values. Files without the key are split.
+CHECKPOINT_SPLIT = 'split'      # actor and critic each have their own GCN
+CHECKPOINT_SHARED = 'shared'    # one GCNTrunk, stored with the actor
 
-def pad_sequence(seq, lens, padding):
-    padded = torch.zeros(lens.size(0), padding, seq.size(-1))
-    mask = torch.ones(padded.size(0), padded.size(1))
 
-    offset = 0
-    for i,len in enumerate(lens):
-        st = offset
-        en = offset+len
+def pad_sequence(seq, lens, padding):
+    '''
+    Scatter the rows of each graph (lens[i] consecutive rows of seq)
+    into a B x padding x d zero tensor. No Python loop over the batch,
+    so it traces into a graph that works for any lens.
+    '''
+    batch = torch.repeat_interleave(torch.arange(lens.size(0)), lens)
+    starts = torch.cumsum(lens, 0) - lens
+    pos = torch.arange(seq.size(0)) - starts[batch]
 
-        padded[i][:len] = seq[st:en]
-        mask[i][len:] = 0
-        offset += len
+    padded = torch.zeros(lens.size(0), padding, seq.size(-1))
+    padded[batch, pos] = seq
+    mask = (torch.arange(padding).unsqueeze(0) < lens.unsqueeze(-1)).float()
 
     return padded, mask.unsqueeze(-1)
 
-def extract_hosts(x, servers, n_servers, users, n_users):
-    srv = x[servers]
-    srv,s_mask = pad_sequence(srv, n_servers, MAX_SERVERS)  # B x MAX_s x d
-
-    usr = x[users]
-    usr,u_mask = pad_sequence(usr, n_users, MAX_USERS)      # B x MAX_u x d
-
-    hosts = torch.cat([srv,usr], dim=1)
-    mask = torch.cat([s_mask, u_mask], dim=1)
+def host_layout(servers, n_servers, users, n_users):
+    '''
+    Gather indices (B x 16) into x for each graph's servers then users,
+    plus the matching B x 16 x 1 mask. The host sets don't change between
+    GNN layers, so this is computed once per forward and shared by every
+    extract_hosts call.
+    '''
+    # Checked up front for a clear message; _pad_index fails on its own
+    # when traced
+    if not torch.jit.is_tracing():
+        if n_servers.max() > MAX_SERVERS:
+            raise ValueError(f'{int(n_servers.max())} servers in one graph, at most {MAX_SERVERS} supported')
+        if n_users.max() > MAX_USERS:
+            raise ValueError(f'{int(n_users.max())} users in one graph, at most {MAX_USERS} supported')
+
+    srv_idx, srv_mask = _pad_index(servers, n_servers, MAX_SERVERS)
+    usr_idx, usr_mask = _pad_index(users, n_users, MAX_USERS)
+    idx = torch.cat([srv_idx, usr_idx], dim=1)
+    mask = torch.cat([srv_mask, usr_mask], dim=1)
+    return idx, mask.unsqueeze(-1)
+
+def _pad_index(nodes, lens, padding):
+    # A graph with more than `padding` nodes makes pos out of range, so the
+    # scatter raises (traced graphs included) rather than dropping them
+    batch = torch.repeat_interleave(torch.arange(lens.size(0)), lens)
+    starts = torch.cumsum(lens, 0) - lens
+    pos = torch.arange(nodes.size(0)) - starts[batch]
+
+    # Padding slots point at a dummy entry (node 0) and are masked out
+    idx = nodes.new_zeros(lens.size(0), padding)
+    idx[batch, pos] = nodes
+    mask = torch.arange(padding).unsqueeze(0) < lens.unsqueeze(-1)
+    return idx, mask.float()
+
+def extract_hosts(x, servers, n_servers, users, n_users, layout=None):
+    if layout is None:
+        layout = host_layout(servers, n_servers, users, n_users)
+    idx, mask = layout
+
+    hosts = x[idx] * mask   # B x (MAX_s + MAX_u) x d
     return hosts, mask
 
 class SimpleSelfAttention(nn.Module):
@@ -77,14 +113,35 @@ class SimpleSelfAttention(nn.Module):
         return g + g_                              # Short-circuit
 
 
+class GCNTrunk(nn.Module):
+    '''
+    Two-layer GCN shared by the actor and critic when the agent is
+    built with shared_trunk=True. Returns the node features the heads
+    attend over: the input, and the output of each layer.
+    '''
+    def __init__(self, in_dim, hidden1=256, hidden2=64):
+        super().__init__()
+        self.conv1 = GCNConv(in_dim, hidden1)
+        self.conv2 = GCNConv(hidden1, hidden2)
+
+    def forward(self, x, ei):
+        h1 = torch.relu(self.conv1(x, ei))
+        h2 = torch.relu(self.conv2(h1, ei))
+        return x, h1, h2
+
+
 class InductiveActorNetwork(nn.Module):
     def __init__(self, in_dim, global_state_space=3,
                  node_action_space=4, edge_action_space=2, global_action_space=1,
-                 hidden1=256, hidden2=64, gdim=64, lr=0.0003, concat_edges=False):
+                 hidden1=256, hidden2=64, gdim=64, lr=0.0003, concat_edges=False, trunk=None):
         super().__init__()
 
-        self.conv1 = GCNConv(in_dim, hidden1)
-        self.conv2 = GCNConv(hidden1, hidden2)
+        # The actor owns the shared trunk (if any), so its optimizer
+        # applies the critic's gradients to it as well
+        self.trunk = trunk
+        if trunk is None:
+            self.conv1 = GCNConv(in_dim, hidden1)
+            self.conv2 = GCNConv(hidden1, hidden2)
 
         self.g0_attn = SimpleSelfAttention(in_dim, hidden1, gdim)
         self.g1_attn = SimpleSelfAttention(hidden1, hidden1, gdim)
@@ -126,7 +183,28 @@ class InductiveActorNetwork(nn.Module):
         self.node_action_space = node_action_space
         self.edge_action_space = edge_action_space
 
-    def forward(self, x, ei, global_vec, servers, n_servers, users, n_users, action_edges, multi_subnet):
+    def encode(self, x, ei):
+        '''
+        Node features at each GCN depth: (x, layer 1, layer 2)
+        '''
+        if self.trunk is not None:
+            return self.trunk(x, ei)
+        h1 = torch.relu(self.conv1(x, ei))
+        h2 = torch.relu(self.conv2(h1, ei))
+        return x, h1, h2
+
+    def forward(self, x, ei, global_vec, servers, n_servers, users, n_users, action_edges, multi_subnet, hidden=None):
+        return Categorical(self.probs(x, ei, global_vec, servers, n_servers, users, n_users, action_edges, multi_subnet, hidden))
+
+    def probs(self, x, ei, global_vec, servers, n_servers, users, n_users, action_edges, multi_subnet, hidden=None):
+        '''
+        Action probabilities (B x 81). Split out of forward() so the
+        tensor part of the policy can be traced for inference.
+
+        hidden: output of encode(), if already computed for this batch
+        '''
+        x0, x1, x2 = hidden if hidden is not None else self.encode(x, ei)
+
         # Always come in groups of 9
         rtrs = action_edges.unique(sorted=True).squeeze(-1)
         bs = rtrs.size(0) // 9
@@ -138,31 +216,31 @@ class InductiveActorNetwork(nn.Module):
 
         # Global init features
         g0 = self.global_net(global_vec)
+        layout = host_layout(servers, n_servers, users, n_users)
 
-        v,mask = extract_hosts(x, servers, n_servers, users, n_users)
-        rtr = x[rtrs]
+        v,mask = extract_hosts(x0, servers, n_servers, users, n_users, layout)
+        rtr = x0[rtrs]
         v = torch.cat([v, rtr], dim=1)
         mask = torch.cat([mask, rtr_mask], dim=1)
         g = self.g0_attn(v,mask, g=g0)
 
         # Layer 1
-        x = torch.relu(self.conv1(x, ei))
-        v,mask = extract_hosts(x, servers, n_servers, users, n_users)
-        rtr = x[rtrs]
+        v,mask = extract_hosts(x1, servers, n_servers, users, n_users, layout)
+        rtr = x1[rtrs]
         v = torch.cat([v, rtr], dim=1)
         mask = torch.cat([mask, rtr_mask], dim=1)
         g = self.g1_attn(v,mask, g=g)
 
         # Layer 2
-        x = torch.relu(self.conv2(x, ei))
-        v,mask = extract_hosts(x, servers, n_servers, users, n_users)
+        x = x2
+        v,mask = extract_hosts(x, servers, n_servers, users, n_users, layout)
         rtr = x[rtrs]
         v = torch.cat([v, rtr], dim=1)
         mask = torch.cat([mask, rtr_mask], dim=1)
         g = self.g2_attn(v,mask, g=g) # B x d_g
 
         # B x 16 x d
-        z,mask = extract_hosts(x, servers, n_servers, users, n_users)
+        z,mask = extract_hosts(x, servers, n_servers, users, n_users, layout)
 
         # Attach global vec to all nodes in each batch
         z = torch.cat(
@@ -220,18 +298,23 @@ class InductiveActorNetwork(nn.Module):
             out = out.reshape(out.size(0)//3, out.size(1)*3)
 
         out[out == 0] = -float('inf')   # So softmax prob is 0
-        out = self.sm(out)
-
-        return Categorical(out)
+        return self.sm(out)
 
 
 class InductiveCriticNetwork(nn.Module):
     def __init__(self, in_dim, global_state_space=3,
-                 hidden1=256, hidden2=64, gdim=64, lr=0.001):
+                 hidden1=256, hidden2=64, gdim=64, lr=0.001, trunk=None):
         super().__init__()
 
-        self.conv1 = GCNConv(in_dim, hidden1)
-        self.conv2 = GCNConv(hidden1, hidden2)
+        # A shared trunk belongs to the actor; keep it out of this
+        # module's parameters so it isn't stepped by both optimizers
+        self._trunk = (trunk,)
+        if trunk is None:
+            self.conv1 = GCNConv(in_dim, hidden1)
+            self.conv2 = GCNConv(hidden1, hidden2)
+        else:
+            hidden1 = trunk.conv1.out_channels
+            hidden2 = trunk.conv2.out_channels
         self.out = nn.Sequential(
             nn.Linear(hidden2, hidden1),
             nn.ReLU(),
@@ -254,18 +337,26 @@ class InductiveCriticNetwork(nn.Module):
         )
         self.opt = Adam(self.parameters(), lr)
 
-    def forward(self, x, ei, global_vec, servers, n_servers, users, n_users, action_edges, multi_subnet):
+    def encode(self, x, ei):
+        trunk = self._trunk[0]
+        if trunk is not None:
+            return trunk(x, ei)
+        h1 = torch.relu(self.conv1(x, ei))
+        h2 = torch.relu(self.conv2(h1, ei))
+        return x, h1, h2
+
+    def forward(self, x, ei, global_vec, servers, n_servers, users, n_users, action_edges, multi_subnet, hidden=None):
+        x0, x1, x2 = hidden if hidden is not None else self.encode(x, ei)
         g0 = self.gs(global_vec)
+        layout = host_layout(servers, n_servers, users, n_users)
 
-        v,mask = extract_hosts(x, servers, n_servers, users, n_users)
+        v,mask = extract_hosts(x0, servers, n_servers, users, n_users, layout)
         g = self.g0_attn(v, mask, g=g0)
 
-        x = torch.relu(self.conv1(x, ei))
-        v,mask = extract_hosts(x, servers, n_servers, users, n_users)
+        v,mask = extract_hosts(x1, servers, n_servers, users, n_users, layout)
         g = self.g1_attn(v, mask, g=g)
 
-        x = torch.relu(self.conv2(x, ei))
-        v,mask = extract_hosts(x, servers, n_servers, users, n_users)
+        v,mask = extract_hosts(x2, servers, n_servers, users, n_users, layout)
         g = self.g2_attn(v, mask, g=g)
 
         # I guess just average the three global vectors together?
@@ -283,17 +374,30 @@ class InductiveGraphPPOAgent():
     which action to take
     '''
     def __init__(self, in_dim, gamma=0.99, lmbda=0.95, clip=0.1, bs=5, epochs=6,
-                 a_kwargs=dict(), c_kwargs=dict(), training=True, concat_edges=False):
+                 a_kwargs=dict(), c_kwargs=dict(), training=True, concat_edges=False,
+                 shared_trunk=False, gae=False):
+
+        # shared_trunk: one GCN stack feeds both heads (sized by a_kwargs),
+        # so each state is message-passed once instead of twice
+        trunk = None
+        if shared_trunk:
+            trunk = GCNTrunk(in_dim, a_kwargs.get('hidden1', 256), a_kwargs.get('hidden2', 64))
 
-        self.actor = InductiveActorNetwork(in_dim, concat_edges=concat_edges, **a_kwargs)
-        self.critic = InductiveCriticNetwork(in_dim, **c_kwargs)
+        self.actor = InductiveActorNetwork(in_dim, concat_edges=concat_edges, trunk=trunk, **a_kwargs)
+        self.critic = InductiveCriticNetwork(in_dim, trunk=trunk, **c_kwargs)
         self.memory = MultiPPOMemory(bs, agents=5)
+        self.shared_trunk = shared_trunk
 
         self.args = (in_dim,)
         self.kwargs = dict(
             gamma=gamma, lmbda=lmbda, clip=clip, bs=bs, epochs=epochs,
             a_kwargs=a_kwargs, c_kwargs=c_kwargs, training=training, concat_edges=concat_edges
         )
+        if shared_trunk:
+            # split checkpoints keep the original kwargs so older code can still read them
+            self.kwargs['shared_trunk'] = True
+        if gae:
+            self.kwargs['gae'] = True
 
         # PPO Hyperparams
         self.gamma = gamma
@@ -301,6 +405,7 @@ class InductiveGraphPPOAgent():
         self.clip = clip
         self.bs = bs
         self.epochs = epochs
+        self.gae = gae
 
         self.training = training
         self.deterministic = False
@@ -356,7 +461,8 @@ class InductiveGraphPPOAgent():
         torch.save({
             'actor': self.actor.state_dict(),
             'critic': self.critic.state_dict(),
-            'agent': me
+            'agent': me,
+            'format': CHECKPOINT_SHARED if self.shared_trunk else CHECKPOINT_SPLIT
         }, outf)
 
     @torch.no_grad()
@@ -372,7 +478,9 @@ class InductiveGraphPPOAgent():
         if is_blocked:
             return None
 
-        distro = self.actor(*state)
+        # With a shared trunk, the critic below reuses the actor's message passing
+        hidden = self.actor.encode(state[0], state[1]) if self.shared_trunk and self.training else None
+        distro = self.actor(*state, hidden=hidden)
 
         # I don't know why this would ever be called
         # during training, but just in case, putting the
@@ -385,7 +493,7 @@ class InductiveGraphPPOAgent():
         if not self.training:
             return action.item()
 
-        value = self.critic(*state)
+        value = self.critic(*state, hidden=hidden)
         prob = distro.log_prob(action)
         return action.item(), value.item(), prob.item()
 
@@ -395,49 +503,59 @@ class InductiveGraphPPOAgent():
         '''
         self.memory.remember(idx, s,a,v,p,r,t)
 
+    def returns(self, mem):
+        '''
+        Critic targets and advantages for every memory in mem.
+
+        Targets are the discounted rewards, normalized (the critic
+        learns on that scale). Advantages are target - value, or, if
+        self.gae, GAE(gamma, lmbda) computed on the raw reward scale
+        (values mapped back from the normalized one) and divided by
+        the same std. With lmbda=1 the two agree.
+        '''
+        g = discounted_scan(mem.r, mem.t, self.gamma).float()
+        mu, sigma = g.mean(), g.std() + 1e-5
+        r = (g - mu) / sigma # Normalize rewards
+
+        if not self.gae:
+            return r, r - mem.v.float()
+
+        # TD residuals, not bootstrapping past a terminal (or the end of the buffer)
+        v = mem.v * sigma.double() + mu.double()
+        next_v = torch.cat([v[1:], v.new_zeros(1)]) * (1 - mem.t)
+        delta = mem.r + self.gamma * next_v - v
+        adv = discounted_scan(delta, mem.t, self.gamma * self.lmbda)
+
+        r = ((adv + v - mu.double()) / sigma.double()).float()
+        return r, (adv / sigma.double()).float()
+
     def learn(self, verbose=False):
         '''        
         This runs the PPO update algorithm on memories stored in self.memory 
         Assumes that an external process is adding memories to the buffer
         '''
+        # Targets don't change between epochs, so they're computed once
+        r = None
         for e in range(self.epochs):
-            s,a,v,p,r,t, batches = self.memory.get_batches()
-
-            # Calculate discounted reward
-            rewards = []
-            discounted_reward = 0
-            for reward, is_terminal in zip(reversed(r), reversed(t)):
-                if is_terminal:
-                    discounted_reward = 0
-                discounted_reward = reward + self.gamma * discounted_reward
-                rewards.insert(0, discounted_reward)
-
-            # Normalize 
-            r = torch.tensor(rewards, dtype=torch.float)
-            r = (r - r.mean()) / (r.std() + 1e-5) # Normalize rewards
-
-            # Calculate advantage 
-            advantages = r - torch.tensor(v)
+            mem, batches = self.memory.get_batches()
+            if r is None:
+                r, advantages = self.returns(mem)
             closs,aloss,eloss = 0,0,0
 
             # Optimize for clipped advantage for each minibatch 
             for b_idx,b in enumerate(batches):
-                b = b.tolist()
-                new_probs = []
-
                 # Combine graphs from minibatches so GNN is called once
-                s_ = [s[idx] for idx in b]
-                a_ = [a[idx] for idx in b]
-                batched_states = combine_marl_states(s_)
+                batched_states = mem.gather(b)
 
                 self._zero_grad()
 
-                # Forward pass 
-                dist = self.actor(*batched_states)
-                critic_vals = self.critic(*batched_states)
+                # Forward pass (one GCN pass for both heads if the trunk is shared)
+                hidden = self.actor.encode(batched_states[0], batched_states[1]) if self.shared_trunk else None
+                dist = self.actor(*batched_states, hidden=hidden)
+                critic_vals = self.critic(*batched_states, hidden=hidden)
 
-                new_probs = dist.log_prob(torch.tensor(a_))
-                old_probs = torch.tensor([p[i] for i in b])
+                new_probs = dist.log_prob(mem.a[b])
+                old_probs = mem.p[b].float()
                 entropy = dist.entropy()
 
                 a_t = advantages[b]
@@ -491,6 +609,10 @@ def load(in_f):
     data = torch.load(in_f)
     args,kwargs = data['agent']
 
+    # Checkpoints from before the format flag are all split actor/critic
+    fmt = data.get('format', CHECKPOINT_SPLIT)
+    kwargs = dict(kwargs, shared_trunk=(fmt == CHECKPOINT_SHARED))
+
     agent = InductiveGraphPPOAgent(*args, **kwargs)
     agent.actor.load_state_dict(data['actor'])
     agent.critic.load_state_dict(data['critic'])
@@ -0,0 +1,170 @@
+import copy
+import os
+
+import torch
+from torch import nn
+from torch_geometric.nn import GCNConv
+
+from models.cage4 import load, MAX_SERVERS, MAX_USERS, MAX_EDGES
+
+# TorchScript actor saved next to its checkpoint: weights/gnn_ppo-0.pt -> weights/gnn_ppo-0.ts
+ARTIFACT_EXT = '.ts'
+# int8 (dynamically quantized) actor: weights/gnn_ppo-0.pt -> weights/gnn_ppo-0.q8.ts
+QUANTIZED_EXT = '.q8.ts'
+
+
+class ActorProbs(nn.Module):
+    '''
+    Single-subnet actor returning action probabilities (1 x 81).
+    This is the part of the policy that gets traced; sampling
+    stays outside so callers can mask or pick greedily.
+    '''
+    def __init__(self, actor):
+        super().__init__()
+        self.actor = actor
+
+    def forward(self, x, ei, global_vec, servers, n_servers, users, n_users, action_edges):
+        return self.actor.probs(x, ei, global_vec, servers, n_servers, users, n_users, action_edges, False)
+
+
+def artifact_path(weights_path, quantized=False):
+    return os.path.splitext(weights_path)[0] + (QUANTIZED_EXT if quantized else ARTIFACT_EXT)
+
+
+def quantize_actor(actor):
+    '''
+    Post-training dynamic int8 quantization of a copy of the actor:
+    weights are stored as int8, activations quantized on the fly.
+    Covers every Linear -- attention blocks, node/edge/global heads,
+    and the GCN feature transforms (swapped for nn.Linear so
+    quantize_dynamic sees them). Message passing stays fp32.
+    '''
+    actor = copy.deepcopy(actor).eval()
+    for conv in [m for m in actor.modules() if isinstance(m, GCNConv)]:
+        lin = nn.Linear(conv.lin.in_channels, conv.lin.out_channels, bias=False)
+        lin.weight.data.copy_(conv.lin.weight.data)
+        conv.lin = lin
+
+    return torch.ao.quantization.quantize_dynamic(actor, {nn.Linear}, dtype=torch.qint8)
+
+
+def example_state(in_dim, n_servers=MAX_SERVERS, n_users=MAX_USERS, seed=0, n_other=0):
+    '''
+    Synthetic single-subnet observation with the CAGE4 layout:
+    servers, then users, then 8 subnet routers and the internet router,
+    then n_other extra nodes (processes, connections) each hanging off
+    a random host. Only shapes/dtypes matter for tracing; n_other lets
+    benchmarks grow the graph without changing the action layout.
+    '''
+    g = torch.Generator().manual_seed(seed)
+    n_hosts = n_servers + n_users
+    routers = torch.arange(n_hosts, n_hosts + MAX_EDGES)
+    internet = n_hosts + MAX_EDGES
+
+    x = (torch.rand(internet + 1 + n_other, in_dim, generator=g) > 0.9).float()
+
+    hosts = torch.arange(n_hosts)
+    host_rtr = routers[hosts % MAX_EDGES]
+    src = torch.cat([hosts, host_rtr, routers, torch.full((MAX_EDGES,), internet)])
+    dst = torch.cat([host_rtr, hosts, torch.full((MAX_EDGES,), internet), routers])
+    ei = torch.stack([src, dst])
+    if n_other:
+        other = torch.arange(internet + 1, internet + 1 + n_other)
+        owner = torch.randint(0, n_hosts, (n_other,), generator=g)
+        ei = torch.cat([ei, torch.stack([other, owner]), torch.stack([owner, other])], dim=1)
+
+    global_vec = torch.zeros(1, 3)
+    global_vec[0, 0] = 1.
+    action_edges = torch.stack([routers, torch.full((MAX_EDGES,), internet)])
+
+    return (
+        x, ei, global_vec,
+        torch.arange(n_servers), torch.tensor([n_servers]),
+        torch.arange(n_servers, n_hosts), torch.tensor([n_users]),
+        action_edges
+    )
+
+
+def example_multi_state(in_dim, n_servers=(6, 4, 2), n_users=(10, 7, 3), seed=0):
+    '''
+    Synthetic blue_agent_4 observation: one graph holding three subnets,
+    each with its own hosts and 8 edges from its router to the others.
+    Returns the 9-tuple the wrapper produces (multi_subnet=True).
+    '''
+    g = torch.Generator().manual_seed(seed)
+    n_hosts = sum(n_servers) + sum(n_users)
+    routers = torch.arange(n_hosts, n_hosts + MAX_EDGES + 1)
+
+    x = (torch.rand(n_hosts + routers.size(0), in_dim, generator=g) > 0.9).float()
+
+    srv, usr, edges, src, dst = [], [], [], [], []
+    start = 0
+    for k, (n_s, n_u) in enumerate(zip(n_servers, n_users)):
+        hosts = torch.arange(start, start + n_s + n_u)
+        srv.append(hosts[:n_s])
+        usr.append(hosts[n_s:])
+        start += n_s + n_u
+
+        others = torch.cat([routers[:k], routers[k+1:]])
+        edges.append(torch.stack([routers[k].repeat(MAX_EDGES), others]))
+        src += [hosts, routers[k].repeat(hosts.size(0))]
+        dst += [routers[k].repeat(hosts.size(0)), hosts]
+
+    ei = torch.stack([torch.cat(src), torch.cat(dst)])
+    global_vec = torch.zeros(len(n_servers), 3)
+    global_vec[:, 1] = 1.
+
+    return (
+        x, ei, global_vec,
+        torch.cat(srv), torch.tensor(n_servers),
+        torch.cat(usr), torch.tensor(n_users),
+        torch.cat(edges, dim=1), True
+    )
+
+
+@torch.no_grad()
+def export_actor(weights_path, out_path=None, quantized=False):
+    '''
+    Trace the actor of a gnn_ppo-*.pt checkpoint and save it as TorchScript
+    (int8 via quantize_actor if quantized). Returns the path written.
+    '''
+    out_path = out_path or artifact_path(weights_path, quantized)
+    agent = load(weights_path)
+    actor = quantize_actor(agent.actor) if quantized else agent.actor
+    model = ActorProbs(actor).eval()
+
+    example = example_state(agent.args[0])
+    traced = torch.jit.trace(model, example, check_trace=False)
+
+    # Tracing must not have baked in the example's host counts
+    check = example_state(agent.args[0], n_servers=4, n_users=7, seed=1)
+    assert torch.equal(traced(*check), model(*check)), 'traced actor diverges from eager'
+
+    traced.save(out_path)
+    return out_path
+
+
+def save_observations(states, path, source):
+    '''
+    Save recorded actor inputs (state tuples ending in multi_subnet)
+    for offline checks. source: 'bridge' or 'cyborg'
+    '''
+    torch.save({'source': source, 'states': list(states)}, path)
+
+
+def load_observations(path):
+    '''
+    Returns (source, states) from a save_observations file
+    '''
+    data = torch.load(path)
+    return data['source'], data['states']
+
+
+def load_actor(path):
+    '''
+    Load an exported actor. Needs only torch — not torch_geometric
+    or the training classes.
+    '''
+    actor = torch.jit.load(path, map_location='cpu')
+    actor.eval()
+    return actor
@@ -1,23 +1,66 @@
-import torch 
+import torch
+
+# Columns of a state tuple (see wrapper.graph_wrapper) and the dim each
+# is concatenated along. The 9th element, is_multi_subnet, is kept as a
+# flag per state
+STATE_COLUMNS = [
+    ('x', 0), ('ei', 1), ('global_vec', 0),
+    ('servers', 0), ('n_servers', 0), ('users', 0), ('n_users', 0),
+    ('action_edges', 1)
+]
+
+# Columns holding node ids; stored local to their own graph and
+# offset when graphs are gathered into a batch
+NODE_INDEXED = ('ei', 'servers', 'users', 'action_edges')
+
+# Per-transition values: action, value, log prob, reward, terminal
+SCALARS = [
+    ('a', torch.long), ('v', torch.float64), ('p', torch.float64),
+    ('r', torch.float64), ('t', torch.long), ('multi', torch.bool)
+]
+
+def _ranges(starts, lens):
+    '''
+    Concatenation of arange(starts[i], starts[i]+lens[i]) for every i
+    '''
+    out = lens.cumsum(0) - lens
+    return torch.arange(int(lens.sum())) + (starts - out).repeat_interleave(lens)
+
 
 class PPOMemory:
     '''
-    Holds memories for agents that are relevant to the 
+    Holds memories for agents that are relevant to the
     PPO optimization procedure
+
+    Stored by column: every state column is one flat tensor (graphs
+    concatenated, node ids local to their graph) with the per-state
+    sizes alongside, and the scalars live in preallocated tensors.
+    Minibatches are assembled with gather(). Pickles as a handful of
+    tensors, so it's cheap to send between processes.
     '''
-    def __init__(self, bs):
-        self.s = []
-        self.a = []
-        self.v = []
-        self.p = []
-        self.r = []
-        self.t = []
+    def __init__(self, bs, capacity=512):
+        self.bs = bs
+        self.n = 0
+        self.num = {k: torch.zeros(capacity, dtype=d) for k,d in SCALARS}
+
+        self.cols = dict()      # name -> flat tensor
+        self.lens = dict()      # name -> size of each state along its dim
+        self.starts = dict()    # name -> where each state begins
+        self._pending = []      # states not yet flattened into cols
+        self.parts = None       # sizes of the buffers joined by cat()
+
+    def __len__(self):
+        return self.n
 
-        self.bs = bs 
+    a = property(lambda self: self.num['a'][:self.n])
+    v = property(lambda self: self.num['v'][:self.n])
+    p = property(lambda self: self.num['p'][:self.n])
+    r = property(lambda self: self.num['r'][:self.n])
+    t = property(lambda self: self.num['t'][:self.n])
 
     def remember(self, s,a,v,p,r,t):
         '''
-        Pushes new memory into the buffer 
+        Pushes new memory into the buffer
 
         Args:
             s: State
@@ -25,69 +68,156 @@ class PPOMemory:
             v: Value (critic output)
             p: Log Prob (actor output)
             r: Reward
-            t: Terminal 
+            t: Terminal
         '''
-        self.s.append(s)
-        self.a.append(a)
-        self.v.append(v)
-        self.p.append(p)
-        self.r.append(r) 
-        self.t.append(t)
-
-    def clear(self): 
+        # Double when full (from at least 1: cat() and unpickling can
+        # leave a buffer with no capacity)
+        if self.n == self.num['a'].size(0):
+            self.num = {
+                k: torch.cat([col, col.new_zeros(max(col.size(0), 1))])
+                for k,col in self.num.items()
+            }
+
+        for k,val in zip('avprt', (a,v,p,r,t)):
+            self.num[k][self.n] = val
+        self.num['multi'][self.n] = s[8]
+
+        self._pending.append(s[:8])
+        self.n += 1
+
+    def clear(self):
+        '''
+        Empties the memory buffer
+        '''
+        self.n = 0
+        self.cols = dict(); self.lens = dict()
+        self.starts = dict(); self._pending = []
+        self.parts = None
+
+    def _flush(self):
+        '''
+        Concatenate states added since the last flush onto the columns
+        '''
+        if not self._pending:
+            return
+
+        pending = list(zip(*self._pending))
+        for i,(name,dim) in enumerate(STATE_COLUMNS):
+            col = [self.cols[name]] if name in self.cols else []
+            lens = [self.lens[name]] if name in self.lens else []
+
+            self.cols[name] = torch.cat(col + list(pending[i]), dim=dim)
+            self.lens[name] = torch.cat(lens + [torch.tensor([s.size(dim) for s in pending[i]])])
+            self.starts[name] = self.lens[name].cumsum(0) - self.lens[name]
+
+        self._pending = []
+
+    def gather(self, idx):
         '''
-        Empties the memory buffer 
+        Combine the states at idx into one batch, as
+        models.utils.combine_marl_states does for a list of states
         '''
-        self.s = []; self.a = []
-        self.v = []; self.p = []
-        self.r = []; self.t = []
+        self._flush()
+        idx = torch.as_tensor(idx)
+
+        nodes = self.lens['x'][idx]
+        node_offset = nodes.cumsum(0) - nodes
+
+        batch = []
+        for name,dim in STATE_COLUMNS:
+            lens = self.lens[name][idx]
+            col = self.cols[name].index_select(dim, _ranges(self.starts[name][idx], lens))
+            if name in NODE_INDEXED:
+                col = col + node_offset.repeat_interleave(lens)
+            batch.append(col)
+
+        # Is_Multi should be the same for all elements
+        return (*batch, bool(self.num['multi'][idx[0]]))
 
     def get_batches(self):
         '''
-        Return chunks of the shuffled memory buffer 
-        randomly partitioned into `self.bs`-sized chunks 
+        Return the buffer and the indices of its shuffled memories
+        randomly partitioned into `self.bs`-sized chunks. A buffer
+        built by cat() is partitioned per original buffer, so
+        minibatches never mix them
+        '''
+        offset = 0
+        batch_idxs = []
+        for cnt in self.parts or [self.n]:
+            idxs = torch.randperm(cnt) + offset
+            batch_idxs += list(idxs.split(self.bs))
+            offset += cnt
+
+        return self, batch_idxs
+
+    @classmethod
+    def cat(cls, mems, bs):
+        '''
+        One buffer holding all memories of `mems`, in order
         '''
-        idxs = torch.randperm(len(self.a))
-        batch_idxs = idxs.split(self.bs)
+        out = cls(bs, capacity=0)
+        [mem._flush() for mem in mems]
+        mems = [mem for mem in mems if mem.n]
+        if not mems:
+            return out
+
+        out.n = sum(mem.n for mem in mems)
+        out.parts = [n for mem in mems for n in (mem.parts or [mem.n])]
+        out.num = {k: torch.cat([mem.num[k][:mem.n] for mem in mems]) for k in out.num}
+        for name,dim in STATE_COLUMNS:
+            out.cols[name] = torch.cat([mem.cols[name] for mem in mems], dim=dim)
+            out.lens[name] = torch.cat([mem.lens[name] for mem in mems])
+            out.starts[name] = out.lens[name].cumsum(0) - out.lens[name]
+        return out
+
+    def __getstate__(self):
+        # Only the filled part of the preallocated scalars is sent, and
+        # no starts (derived from lens): fewer storages to share
+        self._flush()
+        state = self.__dict__.copy()
+        state['num'] = {k: col[:self.n].clone() for k,col in self.num.items()}
+        del state['starts']
+        return state
 
-        return self.s, self.a, self.v, \
-            self.p, self.r, self.t, batch_idxs
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.starts = {name: lens.cumsum(0) - lens for name,lens in self.lens.items()}
 
 
 class MultiPPOMemory:
     '''
-    Store multiple memory buffers, one for each agent. 
-    Used during training to keep agent's observations seperated 
+    Store multiple memory buffers, one for each agent.
+    Used during training to keep agent's observations seperated
     '''
     def __init__(self, bs, agents=5) -> None:
-        self.tot = agents 
-        self.bs = bs 
+        self.tot = agents
+        self.bs = bs
         self.mems = [PPOMemory(bs) for _ in range(agents)]
 
+    @property
+    def mems(self):
+        return self._mems
+
+    @mems.setter
+    def mems(self, mems):
+        # Callers hand over new buffers by assigning mems
+        self._mems = mems
+        self._joined = None
+
     def remember(self, idx, *args):
-        self.mems[idx].remember(*args)
+        self._mems[idx].remember(*args)
+        self._joined = None
 
     def clear(self):
-        [mem.clear() for mem in self.mems]
-        
-    def get_batches(self): 
-        offset = 0
-        idxs = []
-        all_s = []; all_a = []
-        all_v = []; all_p = []
-        all_r = []; all_t = []
-
-        for i in range(self.tot):
-            all_s += self.mems[i].s
-            all_a += self.mems[i].a
-            all_v += self.mems[i].v
-            all_p += self.mems[i].p
-            all_r += self.mems[i].r
-            all_t += self.mems[i].t
-            
-            cnt = len(self.mems[i].s)
-            idx = torch.randperm(cnt) + offset 
-            idxs += list(idx.split(self.bs))
-            offset += cnt 
-
-        return all_s, all_a, all_v, all_p, all_r, all_t, idxs
\ No newline at end of file
+        self.mems = [PPOMemory(self.bs) for _ in range(self.tot)]
+
+    def get_batches(self):
+        '''
+        Join the first `self.tot` buffers in self.mems into one (once;
+        later epochs reuse it until the buffers change) and return it
+        with its minibatch indices
+        '''
+        if self._joined is None:
+            mems = self._mems[:self.tot]
+            self._joined = mems[0] if len(mems) == 1 else PPOMemory.cat(mems, self.bs)
+        return self._joined.get_batches()
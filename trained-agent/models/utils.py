@@ -53,4 +53,48 @@ def combine_marl_states(s):
     edges = torch.cat(new_edges, dim=1)
 
     # Is_Multi should be the same for all elements
-    return xs,eis,gvs, srvs,nsrvs, usrs,nusrs, edges, is_multi[0]
\ No newline at end of file
+    return xs,eis,gvs, srvs,nsrvs, usrs,nusrs, edges, is_multi[0]
+
+def discounted_scan(x, t, c):
+    '''
+    Reverse scan y[i] = x[i] + c * y[i+1], restarting at every terminal
+    (t[i] = 1 means y[i] = x[i]). This is the loop
+
+        y = 0
+        for x_i,t_i in reversed(zip(x,t)):
+            if t_i: y = 0
+            y = x_i + c*y
+
+    as tensor ops: the steps are split into runs ending at a terminal,
+    laid out as rows of a padded matrix scaled by c**k (k = position in
+    the run), and each row is reverse-cumsummed. Computed in float64;
+    matches the loop to float rounding. Runs long enough for c**k to
+    underflow (or c = 0) fall back to the loop.
+    '''
+    x = x.double()
+    n = x.size(0)
+    if not n:
+        return x
+
+    # A new run starts at 0 and after every terminal
+    t = t.bool()
+    new_run = torch.cat([t.new_ones(1), t[:-1]])
+    run = new_run.long().cumsum(0) - 1
+    starts = new_run.nonzero().squeeze(1)
+    k = torch.arange(n) - starts[run]
+
+    w = torch.full((n,), c, dtype=torch.float64).pow(k)
+    if not w.all():
+        y, out = 0., []
+        for x_i,t_i in zip(reversed(x.tolist()), reversed(t.tolist())):
+            if t_i:
+                y = 0.
+            y = x_i + c*y
+            out.append(y)
+        return torch.tensor(out[::-1], dtype=torch.float64)
+
+    runs = x.new_zeros(int(run[-1]) + 1, int(k.max()) + 1)
+    runs[run, k] = w * x
+    runs = runs.flip(1).cumsum(1).flip(1)
+
+    return runs[run, k] / w
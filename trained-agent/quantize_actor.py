@@ -0,0 +1,90 @@
+# Exports int8 (dynamically quantized) actors to weights/gnn_ppo-*.q8.ts for the bridge,
+# then reports how far each drifts from fp32: action-distribution KL, top-1 agreement,
+# latency and artifact size.
+#   venv/bin/python quantize_actor.py [weights/gnn_ppo-0.pt ...] [--obs obs.pt ...]
+#
+# --obs takes observations recorded with
+#   bridge:  sudo ~/fyp-venv-linux/bin/python evaluation.py --record-obs obs_bridge.pt
+#   CybORG:  venv/bin/python evaluate_cyborg.py --record-obs obs_cyborg.pt
+# Without --obs, synthetic layouts (models.inference.example_state) are used.
+
+import glob
+import os
+import time
+import warnings
+from argparse import ArgumentParser
+
+import torch
+
+from models.cage4 import load
+from models.inference import (
+    artifact_path, export_actor, load_actor, quantize_actor,
+    example_state, example_multi_state, load_observations
+)
+
+WEIGHTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "weights")
+
+
+def kl(p, q):
+    # KL(fp32 || int8) over each distribution's support
+    p, q = p.clamp_min(1e-12), q.clamp_min(1e-12)
+    return (p * (p.log() - q.log())).sum(-1)
+
+
+def timed(fn, states, repeats=50):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for s in states:
+            fn(*s[:8])
+    return (time.perf_counter() - start) / (repeats * len(states)) * 1000
+
+
+if __name__ == "__main__":
+    ap = ArgumentParser()
+    ap.add_argument('weights', nargs='*', help='Checkpoints to quantize (default: weights/gnn_ppo-*.pt)')
+    ap.add_argument('--obs', nargs='+', default=[], help='Recorded observation files to compare on')
+    args = ap.parse_args()
+    warnings.filterwarnings("ignore", category=torch.jit.TracerWarning)
+
+    paths = args.weights or sorted(glob.glob(os.path.join(WEIGHTS_DIR, "gnn_ppo-*.pt")))
+    in_dim = load(paths[0]).args[0]
+
+    states = []
+    for f in args.obs:
+        source, recorded = load_observations(f)
+        print(f"{f}: {len(recorded)} {source} observations")
+        states += recorded
+    if not states:
+        print("No --obs given, comparing on synthetic layouts")
+        states = [example_state(in_dim, n_srv, n_usr, seed=i) + (False,)
+                  for i, (n_srv, n_usr) in enumerate([(6, 10), (5, 9), (2, 3), (6, 4), (1, 1)])]
+        states += [example_multi_state(in_dim, seed=i) for i in range(3)]
+
+    # TorchScript artifacts only take single-subnet states
+    single = [s for s in states if not s[8]]
+
+    for path in paths:
+        actor = load(path).actor.eval()
+        q_actor = quantize_actor(actor)
+
+        with torch.no_grad():
+            divergence, agree = [], 0
+            for s in states:
+                p, q = actor.probs(*s), q_actor.probs(*s)
+                divergence.append(kl(p, q).max().item())
+                agree += torch.equal(p.argmax(-1), q.argmax(-1))
+
+            fp32_path = artifact_path(path)
+            if not os.path.exists(fp32_path):
+                export_actor(path)
+            int8_path = export_actor(path, quantized=True)
+            fp32, int8 = load_actor(fp32_path), load_actor(int8_path)
+            fp32_ms, int8_ms = timed(fp32, single), timed(int8, single)
+
+        divergence = torch.tensor(divergence)
+        print(
+            f"{os.path.basename(int8_path)}: KL mean {divergence.mean():.2e} max {divergence.max():.2e}  "
+            f"top-1 {agree}/{len(states)}  "
+            f"fp32 {fp32_ms:.2f} ms {os.path.getsize(fp32_path) // 1024} KB  "
+            f"int8 {int8_ms:.2f} ms {os.path.getsize(int8_path) // 1024} KB"
+        )
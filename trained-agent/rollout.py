@@ -0,0 +1,219 @@
+# Long-lived rollout workers for train.py. Each worker process builds its wrapped
+# CybORG env once and keeps it for the whole run, and sends back every episode's
+# trajectories (columnar PPOMemory buffers: a few flat tensors each) through shared
+# memory — instead of joblib pickling all five agents (with Adam state) and an env
+# to every job, and thousands of small state tensors back.
+#
+# Weights are never sent per iteration: the learner's actor/critic parameters live
+# in torch.multiprocessing shared memory and every worker's modules alias them, so
+# an optimizer step is visible to all workers at once. A shared version counter,
+# bumped by RolloutPool.publish() after each update, is read at every episode
+# boundary and tags the episode; run() rejects episodes from an older version.
+#
+# Every episode is ~20 tensor storages per agent. Under torch's default
+# 'file_descriptor' sharing strategy each one holds an open descriptor until it's
+# received, so a full iteration (N=25, 5 agents) needs ~2,500 — more than the common
+# `ulimit -n` of 1024. The 'file_system' strategy (set below, at import, so the
+# spawned workers and learners use it too) shares by name and keeps no descriptors
+# open. If you switch back, raise RLIMIT_NOFILE to at least 25 * N * 5 + 1024.
+#
+# Not run standalone — used by train.py.
+
+import traceback
+from queue import Empty
+
+import torch
+import torch.multiprocessing as mp
+from tqdm import tqdm
+
+from CybORG import CybORG
+from CybORG.Agents import SleepAgent, EnterpriseGreenAgent, FiniteStateRedAgent
+from CybORG.Simulator.Scenarios import EnterpriseScenarioGenerator
+
+from models.cage4 import InductiveGraphPPOAgent
+from models.memory_buffer import MultiPPOMemory
+from wrapper.graph_wrapper import GraphWrapper
+
+mp.set_sharing_strategy('file_system')
+
+
+def make_env(episode_len, seed):
+    sg = EnterpriseScenarioGenerator(
+        blue_agent_class=SleepAgent,
+        green_agent_class=EnterpriseGreenAgent,
+        red_agent_class=FiniteStateRedAgent,
+        steps=episode_len,
+    )
+    return GraphWrapper(CybORG(sg, "sim", seed=seed))
+
+
+@torch.no_grad()
+def generate_episode_job(agents, env, hp, i):
+    '''
+    Generate one episode of memories for all agents. Returns
+    len(agents) memory buffers, and the total reward for the episode.
+
+    Args:
+        agents:     list of keep.cage4.InductiveGraphAgent objects
+        env:        wrapped cyborg object
+        hp:         hyperparameter namespace
+        i:          worker id in range(0, `hp.workers`)
+    '''
+    n_agents = len(agents)
+
+    # Initialize environment
+    env.reset()
+    states = env.last_obs
+    blocked_rewards = [0]*n_agents
+
+    tot_reward = 0
+    memory_buffers = MultiPPOMemory(hp.bs, agents=n_agents)
+
+    # Begin episode
+    for ts in tqdm(range(hp.episode_len), desc=f'Worker {i}'):
+        actions = dict()
+        memories = dict()
+
+        # Get actions for all unblocked agents
+        for k,(state,blocked) in states.items():
+            i = int(k[-1])
+            if blocked:
+                actions[k] = None
+            else:
+                action,value,prob = agents[i].get_action((state,blocked))
+                memories[i] = (state,action,value,prob)
+                actions[k] = action
+
+        next_state, rewards, _,_,_ = env.step(actions)
+        rewards = list(rewards.values())
+        tot_reward += sum(rewards)/n_agents
+
+        # Delay recieving rewards until multi-step actions are completed.
+        # Agents recieve cumulative reward for all the timesteps
+        # they spent performing their action.
+        for i in range(n_agents):
+            if i in memories:
+                s,a,v,p = memories[i]
+                r = rewards[i] + blocked_rewards[i]
+                t = 0 if ts < hp.episode_len-1 else 1
+
+                memory_buffers.remember(i, s,a,v,p, r,t)
+                blocked_rewards[i] = 0
+            else:
+                blocked_rewards[i] += rewards[i]
+
+        states = next_state
+
+    return memory_buffers.mems, tot_reward
+
+
+def _worker(wid, tasks, results, specs, weights, version, hp, seed, threads):
+    '''
+    Worker loop: one env for the life of the process; each task is a
+    list of episode ids and each episode is answered with
+    ('episode', episode id, weights version, memories, reward)
+    '''
+    try:
+        torch.set_num_threads(threads)
+        torch.manual_seed(seed + wid)
+        env = make_env(hp.episode_len, seed + wid)
+
+        # Map the learner's shared weights instead of keeping a private
+        # copy. Workers never step, so the optimizers (and the freshly
+        # initialised parameters they hold on to) are dropped
+        agents = [InductiveGraphPPOAgent(*args, **kwargs) for args,kwargs in specs]
+        for agent,(actor,critic) in zip(agents, weights):
+            del agent.actor.opt, agent.critic.opt
+            agent.actor.load_state_dict(actor, assign=True)
+            agent.critic.load_state_dict(critic, assign=True)
+            agent.train()
+
+        while (episodes := tasks.get()) is not None:
+            for ep in episodes:
+                v = version.value
+                mems, reward = generate_episode_job(agents, env, hp, wid)
+                results.put(('episode', ep, v, mems, reward))
+    except Exception:
+        results.put(('error', wid, traceback.format_exc()))
+
+
+class RolloutPool:
+    '''
+    `workers` persistent processes generating episodes with the
+    current weights of `agents`.
+
+    Moves the agents' actor/critic parameters into shared memory (in
+    place, so their optimizers keep working on them). The learner must
+    only step while no episodes are being generated -- between run()
+    calls, as train() does -- and call publish() after each update
+    '''
+    def __init__(self, agents, hp, workers, seed, threads=1):
+        ctx = mp.get_context('spawn')
+        self.tasks = [ctx.Queue() for _ in range(workers)]
+        self.results = ctx.Queue()
+        self.version = ctx.Value('q', 0)
+
+        # Sent once, at process start; the workers alias these tensors
+        for agent in agents:
+            agent.actor.share_memory()
+            agent.critic.share_memory()
+        weights = [(agent.actor.state_dict(), agent.critic.state_dict()) for agent in agents]
+
+        specs = [(agent.args, agent.kwargs) for agent in agents]
+        self.procs = [
+            ctx.Process(
+                target=_worker, name=f'rollout-{w}', daemon=True,
+                args=(w, self.tasks[w], self.results, specs, weights, self.version, hp, seed, threads)
+            )
+            for w in range(workers)
+        ]
+        [p.start() for p in self.procs]
+
+    def publish(self):
+        '''
+        Mark the shared weights as updated. Episodes started after
+        this carry the new version
+        '''
+        with self.version.get_lock():
+            self.version.value += 1
+
+    def run(self, n):
+        '''
+        Generate n episodes with the current (published) weights. Returns
+        (memories, rewards): memories[i] is agent i's list of per-episode
+        PPOMemory buffers, in episode order
+        '''
+        for w,q in enumerate(self.tasks):
+            episodes = list(range(w, n, len(self.tasks)))
+            if episodes:
+                q.put(episodes)
+
+        out = dict()
+        while len(out) < n:
+            try:
+                msg = self.results.get(timeout=60)
+            except Empty:
+                if (dead := [p.name for p in self.procs if not p.is_alive()]):
+                    raise RuntimeError(f'Rollout workers exited unexpectedly: {dead}')
+                continue
+            if msg[0] == 'error':
+                raise RuntimeError(f'Rollout worker {msg[1]} failed:\n{msg[2]}')
+            _, ep, version, mems, reward = msg
+            if version != self.version.value:
+                raise RuntimeError(
+                    f'Episode {ep} was generated with weights v{version}, '
+                    f'current is v{self.version.value} (stepped during run()?)'
+                )
+            out[ep] = (mems, reward)
+
+        mems, rewards = zip(*[out.pop(ep) for ep in range(n)])
+        mems = [list(m) for m in zip(*mems)]
+        return mems, list(rewards)
+
+    def close(self):
+        for q in self.tasks:
+            q.put(None)
+        for p in self.procs:
+            p.join(timeout=10)
+            if p.is_alive():
+                p.terminate()
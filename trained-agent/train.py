@@ -4,15 +4,10 @@ from types import SimpleNamespace
 
 from joblib import Parallel, delayed
 import torch
-from tqdm import tqdm
-
-from CybORG import CybORG
-from CybORG.Agents import SleepAgent, EnterpriseGreenAgent, FiniteStateRedAgent
-from CybORG.Simulator.Scenarios import EnterpriseScenarioGenerator
 
+from learner import LearnerPool, thread_budget
 from models.cage4 import InductiveGraphPPOAgent
-from models.memory_buffer import MultiPPOMemory
-from wrapper.graph_wrapper import GraphWrapper
+from rollout import RolloutPool
 from wrapper.observation_graph import ObservationGraph
 
 SEED = 1337
@@ -22,89 +17,25 @@ HYPER_PARAMS = SimpleNamespace(
     bs = 2500,          # How many steps to learn from at a time
     episode_len = 500,
     training_episodes = 500_000, # Realistically, stops improving around 50k
-    epochs = 4
+    epochs = 4,
+    learner = 'threads' # Or 'processes': each agent's update in its own process
 )
 
 N_AGENTS = 5 
 MAX_THREADS = 36 # 5 per subnet (20 for agent 4, 4 for all others)
+SUBNETS = [1, 1, 1, 1, 3] # Subnets each agent defends (sets process learners' thread shares)
 torch.manual_seed(SEED)
 torch.set_num_threads(MAX_THREADS)
 
-@torch.no_grad()
-def generate_episode_job(agents, env, hp, i):
-    '''
-    Per-process job to generate one episode of memories
-    for all 5 agents. Returns `N_AGENTS` memory buffers, 
-    and the total reward for the episode. 
-
-    Args: 
-        agents:     list of keep.cage4.InductiveGraphAgent objects 
-        env:        wrapped cyborg object 
-        hp:         hyperparameter namespace 
-        i:          process id in range(0, `hp.workers`)
-    '''
-    torch.set_num_threads(MAX_THREADS // hp.workers)
-
-    # Initialize environment
-    env.reset()
-    states = env.last_obs
-    blocked_rewards = [0]*N_AGENTS
-
-    tot_reward = 0
-    memory_buffers = MultiPPOMemory(hp.bs)
-
-    # Begin episode 
-    for ts in tqdm(range(hp.episode_len), desc=f'Worker {i}'):
-        actions = dict()
-        memories = dict()
-
-        # Get actions for all unblocked agents
-        for k,(state,blocked) in states.items():
-            i = int(k[-1])
-            if blocked:
-                actions[k] = None
-            else:
-                action,value,prob = agents[i].get_action((state,blocked))
-                memories[i] = (state,action,value,prob)
-                actions[k] = action
-
-        next_state, rewards, _,_,_ = env.step(actions)
-        rewards = list(rewards.values())
-        tot_reward += sum(rewards)/N_AGENTS
-
-        # Delay recieving rewards until multi-step actions are completed. 
-        # Agents recieve cumulative reward for all the timesteps 
-        # they spent performing their action. 
-        for i in range(N_AGENTS):
-            if i in memories:
-                s,a,v,p = memories[i]
-                r = rewards[i] + blocked_rewards[i]
-                t = 0 if ts < hp.episode_len-1 else 1
-
-                memory_buffers.remember(i, s,a,v,p, r,t)
-                blocked_rewards[i] = 0
-            else:
-                blocked_rewards[i] += rewards[i]
-
-        states = next_state
-
-    return memory_buffers.mems, tot_reward
-
 def train(agents, hp, seed=SEED):
     [agent.train() for agent in agents]
     log = []
 
-    # Only call constructors once out here to save some time
-    envs = []
-    for i in range(min(hp.workers, hp.N)):
-        sg = EnterpriseScenarioGenerator(
-            blue_agent_class=SleepAgent,
-            green_agent_class=EnterpriseGreenAgent,
-            red_agent_class=FiniteStateRedAgent,
-            steps=hp.episode_len,
-        )
-        env = CybORG(sg, "sim", seed=seed)
-        envs.append(GraphWrapper(env))
+    # Long-lived workers, each with its own env (built once, seeded seed+worker).
+    # They read the agents' weights from shared memory and send back packed
+    # trajectories
+    workers = min(hp.workers, hp.N)
+    pool = RolloutPool(agents, hp, workers, seed, threads=max(MAX_THREADS // hp.workers, 1))
 
     # Define learn function for threads to call later so we can 
     # parallelize the backprop step. Use more threads for Agent 4 
@@ -117,45 +48,55 @@ def train(agents, hp, seed=SEED):
                 torch.set_num_threads((MAX_THREADS // 9) * N_AGENTS)
             return agents[i].learn()
 
+    # Or one learner process per agent, with its own thread budget. They
+    # step the shared weights in place, so nothing needs copying back
+    learners = None
+    if hp.learner == 'processes':
+        learners = LearnerPool(agents, thread_budget(MAX_THREADS, SUBNETS), seed)
+
     # Begin training loop 
-    for e in range(hp.training_episodes // hp.N):
-        e *= hp.N
-
-        # Generate N episodes in parallel 
-        out = Parallel(prefer='processes', n_jobs=hp.workers)(
-            delayed(generate_episode_job)(agents, envs[i % len(envs)], hp, i) for i in range(hp.N)
-        )
-
-        # Concat memories across episodes, and transfer them to agents' 
-        # internal memory buffers 
-        memories, avg_rewards = zip(*out)
-        memories = [list(m) for m in zip(*memories)]
-        for i in range(N_AGENTS):
-            agents[i].memory.mems = memories[i]
-
-        # Use threads because agents are in heap memory 
-        # Parallel backpropagation 
-        print("Updating")
-        last_losses = Parallel(prefer='threads', n_jobs=N_AGENTS)(
-            delayed(learn)(i) for i in range(N_AGENTS)
-        )
-
-        losses = ','.join([f'{last_losses[i]:0.4f}' for i in range(N_AGENTS)])
-        print(f"[{e}] Loss: [{losses}]")
-
-        # Log average reward across all episodes 
-        avg_reward = sum(avg_rewards) / hp.N
-        print(f"Avg reward for episode: {avg_reward}")
-        log.append((avg_reward,e,sum(last_losses)/N_AGENTS))
-        torch.save(log, f'logs/{hp.fnames}.pt')
-
-        # Checkpoint model states 
-        for i in range(N_AGENTS):
-            agent = agents[i]
-            agent.save(outf=f'checkpoints/{hp.fnames}-{i}_checkpoint.pt')
-
-            if e % 10_000 < hp.N and e > hp.N:
-                agent.save(outf=f'checkpoints/{hp.fnames}-{i}_{e//1000}k.pt')
+    try:
+        for e in range(hp.training_episodes // hp.N):
+            e *= hp.N
+
+            # Generate N episodes in parallel 
+            memories, avg_rewards = pool.run(hp.N)
+
+            print("Updating")
+            if learners is not None:
+                last_losses = learners.learn(memories)
+            else:
+                # Transfer memories to agents' internal memory buffers 
+                for i in range(N_AGENTS):
+                    agents[i].memory.mems = memories[i]
+
+                # Use threads because agents are in heap memory 
+                # Parallel backpropagation 
+                last_losses = Parallel(prefer='threads', n_jobs=N_AGENTS)(
+                    delayed(learn)(i) for i in range(N_AGENTS)
+                )
+            pool.publish()
+
+            losses = ','.join([f'{last_losses[i]:0.4f}' for i in range(N_AGENTS)])
+            print(f"[{e}] Loss: [{losses}]")
+
+            # Log average reward across all episodes 
+            avg_reward = sum(avg_rewards) / hp.N
+            print(f"Avg reward for episode: {avg_reward}")
+            log.append((avg_reward,e,sum(last_losses)/N_AGENTS))
+            torch.save(log, f'logs/{hp.fnames}.pt')
+
+            # Checkpoint model states 
+            for i in range(N_AGENTS):
+                agent = agents[i]
+                agent.save(outf=f'checkpoints/{hp.fnames}-{i}_checkpoint.pt')
+
+                if e % 10_000 < hp.N and e > hp.N:
+                    agent.save(outf=f'checkpoints/{hp.fnames}-{i}_{e//1000}k.pt')
+    finally:
+        pool.close()
+        if learners is not None:
+            learners.close()
 
 
 if __name__ == '__main__':
@@ -163,6 +104,9 @@ if __name__ == '__main__':
     ap.add_argument('fname', help='Required: the name to save output files as.')
     ap.add_argument('--hidden', action='store', type=int, default=256, help='Dimension of middle layer for actor/critic')
     ap.add_argument('--embedding', action='store', type=int, default=128, help='Dimension of node representation for actor/critic')
+    ap.add_argument('--shared-trunk', action='store_true', help='Actor and critic share one GCN trunk (one message-passing pass per state)')
+    ap.add_argument('--gae', action='store_true', help='Use GAE(gamma, lambda) advantages instead of normalized return - value')
+    ap.add_argument('--learner', choices=['threads', 'processes'], default=HYPER_PARAMS.learner, help='Run the five PPO updates in threads or in one process per agent')
 
     args = ap.parse_args()
     print(args)
@@ -189,8 +133,11 @@ if __name__ == '__main__':
         a_kwargs={'lr': 0.0003, 'hidden1': args.hidden, 'hidden2': args.embedding},
         c_kwargs={'lr': 0.001, 'hidden1': args.hidden, 'hidden2': args.embedding},
         clip=0.2,
-        epochs=HYPER_PARAMS.epochs
+        epochs=HYPER_PARAMS.epochs,
+        shared_trunk=args.shared_trunk,
+        gae=args.gae
     ) for _ in range(N_AGENTS)]
 
     HYPER_PARAMS.fnames = args.fname
+    HYPER_PARAMS.learner = args.learner
     train(agents, HYPER_PARAMS)
\ No newline at end of file
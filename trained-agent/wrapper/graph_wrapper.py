@@ -1,5 +1,3 @@
-from copy import deepcopy
-
 import numpy as np
 import torch
 
@@ -11,6 +9,11 @@ from CybORG.Shared.Enums import TernaryEnum
 from wrapper.observation_graph import ObservationGraph
 from wrapper.globals import *
 
+# Columns GraphWrapper appends to ObservationGraph's node features:
+# per-host tabular bits, then messages (2 bits + is_recieved)
+TAB_DIMS = 2
+MSG_DIMS = 3
+
 class GraphWrapper(EnterpriseMAE):
     def __init__(self, env: CybORG, *args, **kwargs):
         super().__init__(env, *args, **kwargs)
@@ -122,7 +125,7 @@ class GraphWrapper(EnterpriseMAE):
             self.msg[agent] = new_msg
 
             # Combine node features from graph source, and tabular source
-            x,ei,masks = g.get_state(MY_SUBNETS[i])
+            x,ei,masks = g.get_state(MY_SUBNETS[i], extra_dims=TAB_DIMS+MSG_DIMS)
             x = self._combine_data(x, tab_x)
 
             # Mask/pack into conviniently sized tensors for the GNN models 
@@ -172,15 +175,16 @@ class GraphWrapper(EnterpriseMAE):
                 dummy_msg = (np.zeros((4,3)), np.zeros(8))
 
             # Duplicate shared observation of the initial graph across
-            # all agents (but make sure not to pass by reference)
-            g_ = deepcopy(g)
+            # all agents (but make sure not to pass by reference).
+            # Setup-time node features are computed once, in g.setup
+            g_ = g.copy()
             self.graphs[agent] = g_
 
             # Get tabular features and update connectivity graph 
             tab_x,phase,_ = self._parse_tabular(o,g_)
 
             # Combine all node features together and package for agents
-            x,ei,masks = g_.get_state(MY_SUBNETS[int(agent[-1])])
+            x,ei,masks = g_.get_state(MY_SUBNETS[int(agent[-1])], extra_dims=TAB_DIMS+MSG_DIMS)
             x = self._combine_data(x, tab_x)
             obs = self._to_obs(x,ei,masks,phase, *dummy_msg)
 
@@ -282,22 +286,21 @@ class GraphWrapper(EnterpriseMAE):
 
         return x,phase,msg
 
-    def _combine_data(self, graph_x, tabular_x):
+    def _combine_data(self, x, tabular_x):
         '''
         Stick the tabular data onto the node feature matrix 
         on the appropriate rows--those corresponding with 
         the hosts the tabular data is referencing 
+
+        x comes from get_state with TAB_DIMS+MSG_DIMS empty columns
+        at the end, which are filled in place (no padding/concat)
         '''
         # Tabular x only accounts for subnets and workstations
         # Processes/connections have higher indices, but no features
-        # from the FlatActionWrapper, so need to be padded before combined
-        padding = torch.zeros(
-            graph_x.size(0) - tabular_x.size(0),
-            tabular_x.size(1)
-        )
-        tabular_x = torch.cat([tabular_x, padding], dim=0)
-
-        return torch.cat([graph_x, tabular_x], dim=1)
+        # from the FlatActionWrapper, so their rows stay 0
+        col = ObservationGraph.DIM
+        x[:tabular_x.size(0), col : col+TAB_DIMS] = tabular_x
+        return x
 
     def _to_obs(self, x,ei,masks,phase, other_msg,my_msg):
         '''
@@ -305,7 +308,8 @@ class GraphWrapper(EnterpriseMAE):
         called during inference, not training)
 
         Args:  
-            x: feature matrix           (Nxd tensor)
+            x: feature matrix, last MSG_DIMS columns empty
+                                        (Nxd tensor)
             ei: edge index              (2xE tensor)
             masks: list of bitmaps for servers, users, 
                    subnet edges, and routers 
@@ -315,12 +319,12 @@ class GraphWrapper(EnterpriseMAE):
             my_msg: the message this agent sends to 
                     other agents        (1x8 tensor)
         '''
+        all_msg = x[:, -MSG_DIMS:]
 
         # Happens in all cases except agent_4
         if len(masks) == 1:
             (srv,usr,edge,rtrs) = masks[0]
 
-            all_msg = torch.zeros((x.size(0), 3))
             all_msg[rtrs] = torch.from_numpy(other_msg).float()
 
             # Edge[0][0] is always the subnet node managed by this agent
@@ -329,8 +333,6 @@ class GraphWrapper(EnterpriseMAE):
             # Set 'is_recieved' to a special value to indicate this is self
             all_msg[edge[0][0], 2] = -1
 
-            x = torch.cat([x, all_msg], dim=1)
-
             return (
                 x,ei,phase,
                 srv,torch.tensor([srv.size(0)]),
@@ -343,32 +345,19 @@ class GraphWrapper(EnterpriseMAE):
         # so we don't duplicate that, but we have to concat the 
         # masks together and scatter the messages we recieved
         # properly to the feature matrix
-        srv,usr,edges = [],[],[]
-        n_srv,n_usr = [],[]
-        my_ids = []
-        for (s,u,e,_) in masks:
-            my_ids.append(e[0][0].item())
-
-            srv.append(s)
-            usr.append(u)
-            edges.append(e)
-
-            n_srv.append(s.size(0))
-            n_usr.append(u.size(0))
+        srv,usr,edges,_ = zip(*masks)
+        my_ids = torch.stack([e[0][0] for e in edges])
 
         rtrs = masks[0][3]
-        other_rtrs = [o.item() for o in rtrs if o.item() not in my_ids]
-        all_msg = torch.zeros(x.size(0), 3)
+        other_rtrs = rtrs[~torch.isin(rtrs, my_ids)]
 
         all_msg[other_rtrs] = torch.from_numpy(other_msg).float()
         all_msg[my_ids, :2] = torch.from_numpy(my_msg[:6].reshape(3,2)).float()
         all_msg[my_ids, 2] = -1
 
-        x = torch.cat([x, all_msg], dim=1)
-
         return (
             x,ei,phase.repeat_interleave(3,0),
-            torch.cat(srv), torch.tensor(n_srv),
-            torch.cat(usr), torch.tensor(n_usr),
+            torch.cat(srv), torch.tensor([s.size(0) for s in srv]),
+            torch.cat(usr), torch.tensor([u.size(0) for u in usr]),
             torch.cat(edges, dim=1), True
-        )
\ No newline at end of file
+        )
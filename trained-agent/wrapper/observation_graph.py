@@ -45,6 +45,48 @@ class NodeTracker:
     def names(self):
         return list(self.mapping.keys())
 
+class EdgeStore:
+    '''
+    Growable 2xE edge index. Edges keep insertion order (duplicates
+    included) and appends are amortised O(1)
+    '''
+    def __init__(self, capacity=256):
+        self.ei = torch.empty(2, capacity, dtype=torch.long)
+        self.n = 0
+
+    def __len__(self):
+        return self.n
+
+    def extend(self, src, dst):
+        k = len(src)
+        if self.n + k > self.ei.size(1):
+            grown = torch.empty(2, max(2*self.ei.size(1), self.n + k), dtype=torch.long)
+            grown[:, :self.n] = self.ei[:, :self.n]
+            self.ei = grown
+
+        self.ei[0, self.n : self.n+k] = torch.tensor(src, dtype=torch.long)
+        self.ei[1, self.n : self.n+k] = torch.tensor(dst, dtype=torch.long)
+        self.n += k
+
+    def drop_nodes(self, nids):
+        '''
+        Remove every edge with an endpoint in nids
+        '''
+        ei = self.tensor()
+        keep = ~torch.isin(ei, torch.tensor(nids, dtype=torch.long)).any(dim=0)
+        kept = ei[:, keep]
+        self.ei[:, :kept.size(1)] = kept
+        self.n = kept.size(1)
+
+    def tensor(self):
+        return self.ei[:, :self.n]
+
+    def copy(self):
+        e = EdgeStore.__new__(EdgeStore)
+        e.ei = self.ei.clone()
+        e.n = self.n
+        return e
+
 class ObservationGraph:
     '''
     The main datastructure powering KEEP. 
@@ -88,14 +130,20 @@ class ObservationGraph:
         self.subnet_to_router = dict()
 
         # Unchanging network topology
-        self.permenant_edges = [[],[]]
+        self.permenant_edges = torch.zeros(2, 0, dtype=torch.long)
         self.n_permenant_nodes = 0
 
         # Keep track of new connections to ports
-        self.transient_edges = [[],[]]
+        self.transient_edges = EdgeStore()
 
         # Keep track of firewall rules
-        self.subnet_connectivity = [[], []]
+        self.subnet_connectivity = torch.zeros(2, 0, dtype=torch.long)
+
+        # Feature row of every node, indexed by nid, and the router column
+        # of the subnet each nid is in (-1 until known). Rows are written
+        # when a node is set, so get_state only has to slice
+        self.node_x = torch.zeros(0, self.DIM)
+        self.node_subnet = torch.zeros(0, dtype=torch.long)
 
         # Keep track of which nodes are getting deleted when Remove is called
         self.host_to_sussy = defaultdict(list)
@@ -132,15 +180,23 @@ class ObservationGraph:
 
         # Graph of subnets and default open ports doesn't change
         # but connections that we see in observations do. They're transient
-        self.permenant_edges = [
+        self.permenant_edges = torch.tensor([
             list(src) + list(dst),
             list(dst) + list(src)
-        ]
+        ])
         self.n_permenant_nodes = max(max(src), max(dst))+1
 
+        # Routers (and the internet node) are always in the graph
+        self.router_loops = torch.tensor([self.routers, self.routers])
+
         # Set up masks so we can quickly get nodes relevant to each agent
         self._init_node_masks()
 
+        # Subnet membership and feature rows of the initial nodes
+        self._grow(self.nids.nid)
+        for nid in self.nodes:
+            self._write_row(nid)
+
         # Gotta put it back in case other methods need the observation
         initial_observation['success'] = succ
 
@@ -153,7 +209,7 @@ class ObservationGraph:
         src = [self.nids[s] for s in src]
         dst = [self.nids[d] for d in dst]
 
-        self.subnet_connectivity = [src,dst]
+        self.subnet_connectivity = torch.tensor([src,dst], dtype=torch.long)
 
     def _init_node_masks(self):
         '''
@@ -202,77 +258,113 @@ class ObservationGraph:
                         agent_controlled.append(n)
 
             self.subnet_masks[sn] = (
-                srv,
-                usr,
-                [[me] * len(rtr), rtr],
-                agent_controlled
+                torch.tensor(srv, dtype=torch.long),
+                torch.tensor(usr, dtype=torch.long),
+                torch.tensor([[me] * len(rtr), rtr], dtype=torch.long),
+                torch.tensor(agent_controlled, dtype=torch.long)
             )
-    def _remap_sn_mask(self, k, remap):
+
+    def _grow(self, n):
+        '''
+        Make room in the per-node arrays for nids < n
         '''
-        Update masks so when state is reindexed, masks still point
-        to the same nodes 
+        if n <= self.node_x.size(0):
+            return
+        n = max(n, 2*self.node_x.size(0))
+        pad = n - self.node_x.size(0)
+        self.node_x = torch.cat([self.node_x, torch.zeros(pad, self.DIM)])
+        self.node_subnet = torch.cat([self.node_subnet, torch.full((pad,), -1, dtype=torch.long)])
+
+    def set_node(self, nid, node):
         '''
-        (srv,usr,edge,rtrs) = self.subnet_masks[k]
-
-        return (
-            torch.tensor([remap[s] for s in srv]),
-            torch.tensor([remap[u] for u in usr]),
-            torch.tensor([
-                [remap[e] for e in edge[0]],
-                [remap[e] for e in edge[1]]
-            ]),
-            torch.tensor([remap[r] for r in rtrs])
-        )
-
-    def get_state(self, subnets):
+        Add or replace the node at nid and refresh its feature row.
+        Nodes are never changed in place, so this is the only time a
+        row needs computing
+        '''
+        self.nodes[nid] = node
+        self._grow(self.nids.nid)
+        self._write_row(nid)
+
+    def _write_row(self, nid):
+        '''
+        Feature row of one node: one-hot ntype, type-specific features,
+        and one-hot of the subnet it's in
+        '''
+        node = self.nodes[nid]
+        row = self.node_x[nid]
+        row.zero_()
+
+        # Get one-hot ntype feature
+        ntype = self.NTYPES[type(node)]
+        row[ntype] = 1.
+
+        # Get multi-dim feature (if node has features)
+        if node.dim:
+            offset = self.OFFSETS[ntype]
+            row[offset : offset + node.dim] = torch.from_numpy(node.get_features())
+
+        # Label which subnet it's in (worked out once per nid)
+        if (sn := self.node_subnet[nid].item()) < 0:
+            name = self.nids.id_to_str(nid)
+            rtr = self.nids[name[:name.index('subnet') + 6] + '_router']
+            sn = self.routers.index(rtr)
+            self.node_subnet[nid] = sn
+        row[self.DIM - 9 + sn] = 1
+
+    def copy(self):
+        '''
+        Independent copy for another agent. Cheaper than deepcopy: node
+        objects are never modified in place (set_node replaces them), so
+        they and the setup-time tensors are shared; only containers and
+        the per-node arrays are copied.
+        '''
+        g = ObservationGraph.__new__(ObservationGraph)
+        g.__dict__.update(self.__dict__)
+
+        g.nids = NodeTracker()
+        g.nids.nid = self.nids.nid
+        g.nids.mapping = dict(self.nids.mapping)
+        g.nids.inv_mapping = dict(self.nids.inv_mapping)
+
+        g.nodes = dict(self.nodes)
+        g.node_x = self.node_x.clone()
+        g.node_subnet = self.node_subnet.clone()
+        g.transient_edges = self.transient_edges.copy()
+        g.host_to_sussy = defaultdict(list, {k:list(v) for k,v in self.host_to_sussy.items()})
+        return g
+
+    def get_state(self, subnets, extra_dims=0):
         '''
         Get the current state of the graph, and masks for all hosts 
         in subnet(s) of interest 
         
         Args: 
             subnets: list of routers we want observations w.r.t (strings)
+            extra_dims: zero columns to leave at the end of x for the
+                        caller to fill in place (e.g. GraphWrapper's tabular
+                        and message features)
         '''
 
         # Cat all edges together
-        ei = torch.tensor([
-            self.permenant_edges[0] + self.transient_edges[0] + self.subnet_connectivity[0] + self.routers,
-            self.permenant_edges[1] + self.transient_edges[1] + self.subnet_connectivity[1] + self.routers
-        ])
+        ei = torch.cat([
+            self.permenant_edges, self.transient_edges.tensor(),
+            self.subnet_connectivity, self.router_loops
+        ], dim=1)
 
         # Reindex so we use smallest possible feature vector 
         nids, ei = ei.unique(return_inverse=True)
-        nid_map = {n.item():i for i,n in enumerate(nids)}
-
-        # Create mapping from old nids to reindexed nids 
-        nodes = [self.nodes[n.item()] for n in nids]
-        ntypes = [self.NTYPES[type(n)] for n in nodes]
-
-        # Add features for subnet membership
-        rtr_map = {r:i for i,r in enumerate(self.routers)}
-        transductive_routers = torch.zeros(nids.size(0), 9)
 
-        x = torch.zeros(nids.size(0), self.DIM-9)
-        for i,node in enumerate(nodes):
-            # Get one-hot ntype feature
-            ntype = ntypes[i]
-            x[i][ntype] = 1.
-
-            # Label which subnet it's in
-            name = self.nids.id_to_str(nids[i].item())
-            sn = name[:name.index('subnet') + 6] + '_router'
-            sn = self.nids[sn]
-            transductive_routers[i, rtr_map[sn]] = 1
-
-            # Get multi-dim feature (if node has features)
-            if node.dim:
-                offset = self.OFFSETS[ntype]
-                x[i][offset : offset + node.dim] = torch.from_numpy(node.get_features())
-
-        x = torch.cat([x, transductive_routers], dim=1)
+        x = torch.zeros(nids.size(0), self.DIM + extra_dims)
+        x[:, :self.DIM] = self.node_x[nids]
 
         # Remap masks s.t. we know which nodes we are interested in doing
         # actions upon 
-        masks = [self._remap_sn_mask(sn,nid_map) for sn in subnets]
+        remap = torch.empty(self.node_x.size(0), dtype=torch.long)
+        remap[nids] = torch.arange(nids.size(0))
+        masks = [
+            tuple(remap[m] for m in self.subnet_masks[sn])
+            for sn in subnets
+        ]
         return x,ei,masks
 
 
@@ -376,6 +468,9 @@ class ObservationGraph:
         else:
             act = None
 
+        # Edges observed this step, added to the store in one go at the end
+        new_edges = [[],[]]
+
         if isinstance(act, Restore) and success == TernaryEnum.TRUE:
             # Removes all files/sessions/connections from act.hostname
             # I.e. remove all transient edges involving act.hostname
@@ -390,19 +485,10 @@ class ObservationGraph:
 
             removed = [host_id] + host_ports
 
-            # Cycle through existing edges and remove any with 
-            # restored host as src or dst 
-            new_edges = [[],[]]
-            for i in range(len(self.transient_edges[0])):
-                src = self.transient_edges[0][i]
-                dst = self.transient_edges[1][i]
-
-                if src not in removed and dst not in removed:
-                    new_edges[0].append(src)
-                    new_edges[1].append(dst)
+            # Remove any edges with restored host as src or dst 
+            self.transient_edges.drop_nodes(removed)
 
             # Remove restored host from list of suspicious machines
-            self.transient_edges = new_edges
             if act.hostname in self.host_to_sussy:
                 self.host_to_sussy.pop(act.hostname)
 
@@ -414,15 +500,7 @@ class ObservationGraph:
                 sus_ids = []
 
             if sus_ids:
-                new_edges = [[],[]]
-                for i in range(len(self.transient_edges[0])):
-                    if  (src := self.transient_edges[0][i]) not in sus_ids and \
-                        (dst := self.transient_edges[1][i]) not in sus_ids:
-
-                        new_edges[0].append(src)
-                        new_edges[1].append(dst)
-
-                self.transient_edges = new_edges
+                self.transient_edges.drop_nodes(sus_ids)
 
         elif isinstance(act, DeployDecoy) and success == TernaryEnum.TRUE:
             # Have to parse out which decoy was selected using the
@@ -438,9 +516,9 @@ class ObservationGraph:
 
             # Add edge from port -> host representing external communication
             # being allowed to enter the host through this node
-            self.nodes[port_id] = init_decoy(port_id, service)
-            self.transient_edges[0].append(port_id)
-            self.transient_edges[1].append(host_id)
+            self.set_node(port_id, init_decoy(port_id, service))
+            new_edges[0].append(port_id)
+            new_edges[1].append(host_id)
 
 
         edges = set()
@@ -487,10 +565,10 @@ class ObservationGraph:
                         if local_port > 49152 or self.nodes.get(lp_id) is None:
                             # Just make a new node
                             lp_node = ConnectionNode(lp_id, is_ephemeral=local_port > 49152)
-                            self.nodes[lp_id] = lp_node
+                            self.set_node(lp_id, lp_node)
 
-                        self.transient_edges[0] += [rh_id, lp_id]
-                        self.transient_edges[1] += [lp_id, lh_id]
+                        new_edges[0] += [rh_id, lp_id]
+                        new_edges[1] += [lp_id, lh_id]
 
                     if remote_port:
                         rp_name = f'{remote_host}:{remote_port}'
@@ -498,10 +576,10 @@ class ObservationGraph:
 
                         if remote_port > 49152 or self.nodes.get(rp_id) is None:
                             rp_node = ConnectionNode(rp_id, is_ephemeral=remote_port > 49152)
-                            self.nodes[rp_id] = rp_node
+                            self.set_node(rp_id, rp_node)
 
-                        self.transient_edges[0] += [lh_id, rp_id]
-                        self.transient_edges[1] += [rp_id, rh_id]
+                        new_edges[0] += [lh_id, rp_id]
+                        new_edges[1] += [rp_id, rh_id]
 
                     # Seems like this only happens if proc is suspicious?
                     if 'PID' in proc:
@@ -513,7 +591,7 @@ class ObservationGraph:
                 for file in files:
                     file_uq_str = f"{hostname}:{file['Path']}\\{file['File Name']}"
                     file_id = self.nids[file_uq_str]
-                    self.nodes[file_id] = FileNode(file_id, file)
+                    self.set_node(file_id, FileNode(file_id, file))
 
                     edges.update([
                         (host_id, file_id),
@@ -522,8 +600,12 @@ class ObservationGraph:
 
         if edges:
             src,dst = zip(*edges)
-            self.transient_edges[0] += src
-            self.transient_edges[1] += dst
+            new_edges[0] += src
+            new_edges[1] += dst
+
+        # One append to the edge store per observation
+        if new_edges[0]:
+            self.transient_edges.extend(*new_edges)
 
         # Need to put it back in the dict now that we're done with it
         obs['success'] = success
\ No newline at end of file